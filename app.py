@@ -3,12 +3,20 @@ import streamlit as st
 import json
 import base64
 import pandas as pd
+from datetime import date
+from dataclasses import asdict
 from pathlib import Path
 from backend.services.ocr_engine import run_ocr
 from backend.services.exporter import structure_ocr
+from backend.services.index_store import IndexStore, DocumentFilter
+from backend.services.cache import hash_file
+from backend.services.schema import invoice_of
+from backend.services.dedup import DedupIndex
+from backend.services.metrics import configure_logging
 import hashlib
 
 st.set_page_config(page_title="OCR & Structuration", layout="wide")
+configure_logging()
 st.title("📄 Traitement intelligent de documents")
 
 # Paths
@@ -16,40 +24,75 @@ DATA_DIR = Path("data")
 UPLOAD_DIR = DATA_DIR / "uploads"
 SAMPLES_DIR = DATA_DIR / "samples"
 INDEX_FILE = DATA_DIR / "index.json"
+DB_FILE = DATA_DIR / "index.db"
+DEDUP_FILE = DATA_DIR / "dedup.db"
 
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 SAMPLES_DIR.mkdir(parents=True, exist_ok=True)
 INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-# ----------------------
-# Helpers (inchangés)
-# ----------------------
-def load_index():
-    if INDEX_FILE.exists():
-        with open(INDEX_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+# Index SQLite (WAL) : ouvert et migré une seule fois par processus (pas à chaque rerun)
+@st.cache_resource
+def get_index_store():
+    store = IndexStore(str(DB_FILE))
+    store.migrate_from_json(str(INDEX_FILE))
+    return store
+
+index_store = get_index_store()
 
-def save_index(index_data):
-    with open(INDEX_FILE, "w", encoding="utf-8") as f:
-        json.dump(index_data, f, ensure_ascii=False, indent=4)
+# Empreintes des documents traités (renvois / rescans reconnus avant l'OCR)
+@st.cache_resource
+def get_dedup_index():
+    return DedupIndex(str(DEDUP_FILE))
 
+dedup_index = get_dedup_index()
+
+# ----------------------
+# Helpers
+# ----------------------
 def add_or_update_index_entry(entry):
-    index = load_index()
-    # Remove existing entry with same file_name to avoid duplicates
-    index = [e for e in index if e.get("file_name") != entry.get("file_name")]
-    index.append(entry)
-    save_index(index)
-
-def embed_pdf(path: Path, height=600):
-    if not path.exists():
+    # Upsert transactionnel (clé file_name) : pas de réécriture complète de l'index
+    index_store.upsert(entry)
+
+def file_version(path) -> int | None:
+    # mtime du fichier : clé d'invalidation des caches ci-dessous
+    try:
+        return Path(path).stat().st_mtime_ns
+    except (FileNotFoundError, TypeError):
         return None
-    data = path.read_bytes()
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def read_bytes_cached(path: str, mtime_ns: int) -> bytes:
+    return Path(path).read_bytes()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_json_cached(path: str, mtime_ns: int):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def embed_pdf(path: str, mtime_ns: int, height=600):
+    # Encodage base64 fait une fois par version du fichier (et seulement si l'aperçu est demandé)
+    data = read_bytes_cached(path, mtime_ns)
     b64 = base64.b64encode(data).decode("utf-8")
     src = f"data:application/pdf;base64,{b64}"
     html = f'<iframe src="{src}" width="100%" height="{height}"></iframe>'
     return html
 
+# 🔹 Lectures de l'index mises en cache : la clé inclut index_store.version()
+#    (mtime/taille de la base et du WAL), invalidée à chaque écriture
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_query(filters: dict, page: int, page_size: int, sort: str, version: tuple) -> dict:
+    return index_store.query(DocumentFilter(**filters), page=page, page_size=page_size, sort=sort)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_facets(filters: dict, version: tuple) -> dict:
+    return index_store.facets(DocumentFilter(**filters))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_summary(version: tuple) -> tuple[int, dict]:
+    return index_store.count(), index_store.ranges()
+
 def make_safe_key(*parts):
     raw = "|".join(map(str, parts))
     return hashlib.sha1(raw.encode()).hexdigest()[:16]
@@ -57,6 +100,14 @@ def make_safe_key(*parts):
 def structured_to_dataframe(structured):
     if not isinstance(structured, dict):
         return None
+    # Lignes typées (bloc "normalized") : colonnes numériques, pas de ré-analyse des montants
+    invoice = invoice_of(structured)
+    if invoice and invoice.items:
+        df_items = pd.DataFrame([item.to_record() for item in invoice.items])
+        for col in ("quantity", "unit_price", "amount"):
+            df_items[col] = pd.to_numeric(df_items[col])
+        df_items["currency"] = invoice.currency
+        return df_items
     if structured.get("items") and isinstance(structured.get("items"), list):
         try:
             df_items = pd.json_normalize(structured["items"])
@@ -65,6 +116,8 @@ def structured_to_dataframe(structured):
             pass
     rows = []
     for k, v in structured.items():
+        if k == "normalized":
+            continue
         if isinstance(v, (dict, list)):
             val = json.dumps(v, ensure_ascii=False)
         else:
@@ -83,6 +136,9 @@ if "last_ocr_path" not in st.session_state:
     st.session_state["last_ocr_path"] = None
 if "last_uploaded_file" not in st.session_state:
     st.session_state["last_uploaded_file"] = None
+# Uploads déjà traités dans la session : sha256 du contenu -> chemins (fichier, OCR)
+if "uploads" not in st.session_state:
+    st.session_state["uploads"] = {}
 
 # Button to clear last result
 st.sidebar.markdown("### Actions")
@@ -99,24 +155,45 @@ if st.sidebar.button("🔄 Réinitialiser dernier résultat"):
 uploaded_file = st.file_uploader("Dépose un PDF ou une image", type=["pdf", "png", "jpg", "jpeg"])
 
 if uploaded_file:
-    # Save uploaded file
-    temp_path = UPLOAD_DIR / uploaded_file.name
-    with open(temp_path, "wb") as f:
-        f.write(uploaded_file.read())
-    st.success(f"✅ Fichier enregistré : {temp_path}")
+    # Un rerun ne réécrit pas le fichier et ne relance pas l'OCR : résultat gardé par hash du contenu
+    upload_bytes = uploaded_file.getvalue()
+    upload_hash = hashlib.sha256(upload_bytes).hexdigest()
+    upload = st.session_state["uploads"].get(upload_hash)
+    if upload is None or not Path(upload["ocr_json_path"]).exists():
+        # Save uploaded file (sauf si le même contenu est déjà sur disque)
+        temp_path = UPLOAD_DIR / uploaded_file.name
+        if not (temp_path.exists() and hash_file(str(temp_path)) == upload_hash):
+            with open(temp_path, "wb") as f:
+                f.write(upload_bytes)
+
+        # Doublon d'un document déjà traité : son résultat est réutilisé (ni OCR ni LLM)
+        duplicate = dedup_index.check_file(str(temp_path))
+        if duplicate is None:
+            # OCR (cache disque par contenu : pas de nouvel appel API pour un fichier déjà vu)
+            with st.spinner("🔍 Exécution de l'OCR..."):
+                ocr_json_path = run_ocr(str(temp_path))
+            duplicate = dedup_index.check_ocr(str(temp_path), str(ocr_json_path))
+        if duplicate is None:
+            upload = {"path": str(temp_path), "ocr_json_path": str(ocr_json_path), "duplicate": None}
+        else:
+            upload = {"path": str(temp_path), "ocr_json_path": duplicate.ocr_json_path, "duplicate": asdict(duplicate)}
+            st.session_state["last_structured_path"] = duplicate.structured_json_path
+            st.session_state["last_structured"] = duplicate.load_structured()
+        st.session_state["uploads"][upload_hash] = upload
+    temp_path = Path(upload["path"])
+    ocr_json_path = upload["ocr_json_path"]
+    st.success(f"✅ Fichier enregistré : {temp_path} — OCR terminé")
+    if upload["duplicate"]:
+        dup = upload["duplicate"]
+        st.info(f"♻️ Doublon de {dup['file_name']} ({dup['kind']}, similarité {dup['similarity']:.2f}) : "
+                "résultat existant réutilisé.")
 
     # store uploaded filename in session_state
     st.session_state["last_uploaded_file"] = str(temp_path)
-
-    # OCR
-    with st.spinner("🔍 Exécution de l'OCR..."):
-        ocr_json_path = run_ocr(str(temp_path))
-    st.success("✅ OCR terminé")
     st.session_state["last_ocr_path"] = str(ocr_json_path)
 
     # Load OCR JSON and display full_text
-    with open(ocr_json_path, "r", encoding="utf-8") as f:
-        ocr_data = json.load(f)
+    ocr_data = load_json_cached(ocr_json_path, file_version(ocr_json_path))
 
     full_text = (ocr_data.get("full_text") or "").strip()
     st.subheader("📝 Texte OCR")
@@ -141,6 +218,7 @@ if uploaded_file:
         entry = {
             "file_name": Path(temp_path).name,
             "stem": Path(temp_path).stem,
+            "file_hash": upload_hash,
             "path_file": str(temp_path),
             "path_ocr": str(ocr_json_path),
             "path_structured": str(structured_json_path),
@@ -150,6 +228,7 @@ if uploaded_file:
             "document_type": ocr_data.get("document_type", "unknown")
         }
         add_or_update_index_entry(entry)
+        dedup_index.record_result(str(temp_path), str(ocr_json_path), str(structured_json_path))
         st.success("Index mis à jour.")
 
 # ----------------------
@@ -203,37 +282,62 @@ if st.session_state.get("last_structured"):
 st.markdown("---")
 st.subheader("🔎 Recherche globale et navigation")
 
-index_data = load_index()
-st.write(f"Documents indexés : **{len(index_data)}**")
-
-# Search input
-search_query = st.text_input("Recherche (mots séparés par espaces)")
-
-# Optional filters
-types = sorted({d.get("document_type", "unknown") for d in index_data})
-selected_type = st.selectbox("Filtrer par type de document", ["Tous"] + types)
+PAGE_SIZE = 50
+SORT_LABELS = {"relevance": "Pertinence", "recent": "Derniers indexés", "date_desc": "Date ↓", "date_asc": "Date ↑",
+               "total_desc": "Total ↓", "total_asc": "Total ↑"}
 
-# Perform search
-def matches_query(doc, keywords):
-    text = (doc.get("full_text") or "").lower()
-    return all(k in text for k in keywords)
+index_version = index_store.version()
+index_count, bounds = cached_summary(index_version)
+st.write(f"Documents indexés : **{index_count}**")
 
-results = index_data
-if search_query:
-    keywords = [w.strip().lower() for w in search_query.split() if w.strip()]
-    results = [d for d in results if matches_query(d, keywords)]
-if selected_type and selected_type != "Tous":
-    results = [d for d in results if d.get("document_type") == selected_type]
+# Search input
+search_query = st.text_input('Recherche (mots séparés par espaces, OR, "phrase exacte", préfixe*)')
+
+# Filtres sur les colonnes indexées (facettes comptées en SQL, pas de parcours des JSON)
+doc_filter = DocumentFilter(text=search_query.strip() or None)
+facets = cached_facets(asdict(doc_filter), index_version)
+
+def facet_select(column, label, field_name):
+    counts = {v: n for v, n in facets[field_name] if v is not None}
+    return column.multiselect(label, list(counts), format_func=lambda v: f"{v} ({counts[v]})")
+
+col_type, col_seller, col_buyer = st.columns(3)
+doc_filter.document_type = facet_select(col_type, "Type de document", "document_type")
+doc_filter.seller = facet_select(col_seller, "Vendeur", "seller")
+doc_filter.buyer = facet_select(col_buyer, "Acheteur", "buyer")
+
+col_date, col_min, col_max, col_sort = st.columns([2, 1, 1, 1])
+if bounds["date"][0]:
+    full_period = (date.fromisoformat(bounds["date"][0]), date.fromisoformat(bounds["date"][1]))
+    period = col_date.date_input("Période", value=full_period)
+    # Période complète = pas de filtre (les documents sans date restent visibles)
+    if isinstance(period, (list, tuple)) and len(period) == 2 and tuple(period) != full_period:
+        doc_filter.date_from, doc_filter.date_to = period[0].isoformat(), period[1].isoformat()
+total_min = col_min.number_input("Total min", value=None, min_value=0.0)
+total_max = col_max.number_input("Total max", value=None, min_value=0.0)
+doc_filter.total_min, doc_filter.total_max = total_min, total_max
+sort_options = list(SORT_LABELS) if doc_filter.text else [k for k in SORT_LABELS if k != "relevance"]
+sort = col_sort.selectbox("Trier par", sort_options, format_func=SORT_LABELS.get)
+
+# Recherche paginée (FTS5 + filtres en SQL) : seule la page affichée est chargée
+page = st.number_input("Page", min_value=1, value=1, step=1)
+page_data = cached_query(asdict(doc_filter), int(page), PAGE_SIZE, sort, index_version)
+results = page_data["results"]
+st.caption(f"{page_data['total_count']} document(s) — page {page_data['page']}/{page_data['pages']}")
 
 # Show results as DataFrame for selection
 if results:
     rows = []
     for d in results:
-        total = d.get("structured_json", {}).get("total", None)
+        # Colonnes typées de l'index (total numérique, date ISO, devise)
         rows.append({
             "file_name": d.get("file_name"),
             "document_type": d.get("document_type"),
-            "total": total,
+            "date": d.get("doc_date"),
+            "total": d.get("total"),
+            "currency": d.get("currency"),
+            "seller": d.get("seller"),
+            "buyer": d.get("buyer"),
             "path_file": d.get("path_file"),
             "path_structured": d.get("path_structured")
         })
@@ -284,21 +388,19 @@ if results:
 
         # Show & download original file
         pf = doc.get("path_file")
-        if pf and Path(pf).exists():
-            if pf.lower().endswith(".pdf"):
-                html = embed_pdf(Path(pf), height=700)
-                if html:
-                    st.components.v1.html(html, height=700, scrolling=True)
-            with open(pf, "rb") as bf:
-                pdf_bytes = bf.read()
-                dl_pdf_key = make_safe_key("dl_pdf", doc.get("file_name"))
-                st.download_button(
-                    label="⬇️ Télécharger le fichier original (PDF/IMG)",
-                    data=pdf_bytes,
-                    file_name=Path(pf).name,
-                    mime="application/pdf" if pf.lower().endswith(".pdf") else "application/octet-stream",
-                    key=f"dl_pdf_{dl_pdf_key}"
-                )
+        pf_version = file_version(pf)
+        if pf and pf_version is not None:
+            # Aperçu à la demande : le PDF n'est encodé que si la case est cochée
+            if pf.lower().endswith(".pdf") and st.checkbox("👁️ Aperçu du PDF", key=f"preview_{make_safe_key(pf)}"):
+                st.components.v1.html(embed_pdf(pf, pf_version, height=700), height=700, scrolling=True)
+            dl_pdf_key = make_safe_key("dl_pdf", doc.get("file_name"))
+            st.download_button(
+                label="⬇️ Télécharger le fichier original (PDF/IMG)",
+                data=read_bytes_cached(pf, pf_version),
+                file_name=Path(pf).name,
+                mime="application/pdf" if pf.lower().endswith(".pdf") else "application/octet-stream",
+                key=f"dl_pdf_{dl_pdf_key}"
+            )
         else:
             st.warning("Fichier original absent.")
 else:
@@ -306,4 +408,4 @@ else:
 
 # Footer
 st.sidebar.markdown("## Info")
-st.sidebar.write(f"Index entries: {len(index_data)}")
+st.sidebar.write(f"Index entries: {index_count}")
@@ -1,38 +1,391 @@
-from fastapi import FastAPI 
 # workflow.py
 import os
+import time
+import logging
+import threading
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from services.ocr_engine import run_ocr
 from services.exporter import structure_ocr
+from services.preprocessing import PreprocessConfig
+from services.metrics import metrics, configure_logging
+from services.job_queue import JobQueue, QUEUE_FILE, PENDING, STRUCTURED, DEFAULT_MAX_ATTEMPTS
+from services.dedup import DedupIndex
+from services.batch import run_batch
 
-def process_file(file_path: str, output_folder: str = "./data/samples"):
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = [".pdf", ".png", ".jpg", ".jpeg"]
+
+def process_file(file_path: str, output_folder: str = "./data/samples", multi_page: bool = False,
+                 preprocess: PreprocessConfig | None = None, dedup: DedupIndex | None = None):
     """
     Processus complet :
-    1️⃣ OCR du fichier (PDF ou image)
+    1️⃣ OCR du fichier (PDF ou image, prétraitée si preprocess est fourni)
     2️⃣ Extraction du JSON OCR
-    3️⃣ Structuration via LLM
+    3️⃣ Structuration via LLM (toutes les pages si multi_page=True)
+
+    Avec dedup, un doublon d'un document déjà traité (avant l'OCR, ou avant
+    la structuration d'après le texte) renvoie les résultats existants.
     """
-    print(f"\n🔹 Traitement du fichier : {file_path}")
+    logger.info("🔹 Traitement du fichier : %s", file_path)
 
-    # 1️⃣ OCR
-    ocr_json_path = run_ocr(file_path, output_folder=output_folder)
+    # 0️⃣ Doublon exact ou visuel : ni OCR ni LLM
+    duplicate = dedup.check_file(file_path) if dedup else None
+    if duplicate is None:
+        # 1️⃣ OCR
+        ocr_json_path = run_ocr(file_path, output_folder=output_folder, preprocess=preprocess)
+        duplicate = dedup.check_ocr(file_path, ocr_json_path) if dedup else None
+    if duplicate is not None:
+        return duplicate.ocr_json_path, duplicate.structured_json_path, duplicate.load_structured()
 
     # 2️⃣ Structuration LLM
-    structured_json_path, structured_json = structure_ocr(ocr_json_path, output_folder=output_folder)
+    structured_json_path, structured_json = structure_ocr(ocr_json_path, output_folder=output_folder, multi_page=multi_page)
+    if dedup:
+        dedup.record_result(file_path, ocr_json_path, structured_json_path)
 
-    print(f"✅ Workflow terminé pour : {file_path}")
+    logger.info("✅ Workflow terminé pour : %s", file_path)
     return ocr_json_path, structured_json_path, structured_json
 
-def process_folder(folder_path: str, output_folder: str = "./data/samples"):
+def _process_file_bounded(file_path: str, output_folder: str,
+                          ocr_slots: threading.Semaphore,
+                          structure_slots: threading.Semaphore, multi_page: bool = False,
+                          preprocess: PreprocessConfig | None = None, dedup: DedupIndex | None = None) -> dict:
     """
-    Traite tous les fichiers PDF et images d'un dossier
+    Variante de process_file pour le mode batch : chaque étape prend un
+    créneau dans son propre sémaphore, et les erreurs sont capturées dans
+    le résultat au lieu d'interrompre le lot.
+    """
+    result = {
+        "file": file_path,
+        "status": "ok",
+        "ocr_json_path": None,
+        "structured_json_path": None,
+        "error": None,
+        "duplicate_of": None,
+        "ocr_seconds": 0.0,
+        "structure_seconds": 0.0,
+    }
+    try:
+        duplicate = dedup.check_file(file_path) if dedup else None
+        if duplicate is None:
+            # 1️⃣ OCR (limité par ocr_slots)
+            with ocr_slots:
+                start = time.perf_counter()
+                result["ocr_json_path"] = run_ocr(file_path, output_folder=output_folder, preprocess=preprocess)
+                result["ocr_seconds"] = time.perf_counter() - start
+            duplicate = dedup.check_ocr(file_path, result["ocr_json_path"]) if dedup else None
+        if duplicate is not None:
+            result["duplicate_of"] = duplicate.file_name
+            result["ocr_json_path"] = duplicate.ocr_json_path
+            result["structured_json_path"] = duplicate.structured_json_path
+            return result
+
+        # 2️⃣ Structuration LLM (limitée par structure_slots)
+        with structure_slots:
+            start = time.perf_counter()
+            structured_json_path, _ = structure_ocr(result["ocr_json_path"], output_folder=output_folder,
+                                                    multi_page=multi_page)
+            result["structured_json_path"] = structured_json_path
+            result["structure_seconds"] = time.perf_counter() - start
+        if dedup:
+            dedup.record_result(file_path, result["ocr_json_path"], structured_json_path)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+def list_documents(folder_path: str) -> list[str]:
+    """
+    Liste les fichiers PDF et images d'un dossier (ordre alphabétique)
     """
     folder = Path(folder_path)
-    for file in folder.iterdir():
-        if file.suffix.lower() in [".pdf", ".png", ".jpg", ".jpeg"]:
-            process_file(str(file), output_folder=output_folder)
+    return sorted(
+        str(file) for file in folder.iterdir()
+        if file.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
+
+def process_batch(files: list[str], output_folder: str = "./data/samples",
+                  max_workers: int = 8, ocr_concurrency: int | None = None,
+                  structure_concurrency: int | None = None, multi_page: bool = False,
+                  preprocess: PreprocessConfig | None = None, dedup: DedupIndex | None = None) -> dict:
+    """
+    Traite une liste de fichiers en parallèle.
+
+    - max_workers : nombre de fichiers en cours de traitement simultanément
+    - ocr_concurrency : nombre maximal d'appels run_ocr simultanés
+    - structure_concurrency : nombre maximal d'appels structure_ocr simultanés
+    - preprocess : prétraitement des images du lot (None = images envoyées telles quelles)
+    - dedup : index des documents déjà traités (doublons rattachés, pas retraités)
+
+    Un fichier en échec n'arrête pas le lot. Retourne un dictionnaire avec
+    les résultats par fichier et un résumé (débit, succès, échecs).
+    """
+    max_workers = max(1, max_workers)
+    ocr_slots = threading.Semaphore(max(1, ocr_concurrency or max_workers))
+    structure_slots = threading.Semaphore(max(1, structure_concurrency or max_workers))
+
+    # 🔹 Copie de la config : totaux de prétraitement propres à ce lot (même si la config est partagée)
+    if preprocess is not None:
+        preprocess = replace(preprocess)
+
+    logger.info("🔹 Lot de %d fichier(s) — %d worker(s)", len(files), max_workers)
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(_process_file_bounded, f, output_folder, ocr_slots, structure_slots, multi_page, preprocess,
+                        dedup)
+            for f in files
+        ]
+        for future in as_completed(futures):
+            res = future.result()
+            results.append(res)
+            if res["duplicate_of"]:
+                logger.info("♻️ %s : doublon de %s", res["file"], res["duplicate_of"])
+            elif res["status"] == "ok":
+                logger.info("✅ %s (%.1fs OCR, %.1fs LLM)", res["file"], res["ocr_seconds"], res["structure_seconds"])
+            else:
+                logger.error("❌ %s : %s", res["file"], res["error"])
+    elapsed = time.perf_counter() - start
+
+    # 🔹 Garder l'ordre d'entrée pour des résultats reproductibles
+    order = {f: i for i, f in enumerate(files)}
+    results.sort(key=lambda r: order[r["file"]])
+
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    summary = {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "duplicates": sum(1 for r in results if r["duplicate_of"]),
+        "elapsed_seconds": elapsed,
+        "docs_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+    }
+    if preprocess is not None:
+        totals = preprocess.stats.snapshot()
+        summary["preprocessed_images"] = totals["images"]
+        summary["preprocess_bytes_saved"] = totals["original_bytes"] - totals["output_bytes"]
+        summary["preprocess_seconds"] = totals["seconds"]
+    logger.info(
+        "📊 Lot terminé : %d/%d réussi(s), %d échec(s) en %.1fs (%.2f docs/s)",
+        summary["succeeded"], summary["total"], summary["failed"], elapsed, summary["docs_per_second"]
+    )
+    if preprocess is not None:
+        logger.info(
+            "🖼️ Prétraitement : %d image(s), %.1f Mo économisés en %.1fs", summary["preprocessed_images"],
+            summary["preprocess_bytes_saved"] / 1024 ** 2, summary["preprocess_seconds"]
+        )
+    return {"results": results, "summary": summary}
+
+def _existing_ocr_result(file_path: str, output_folder: str) -> str | None:
+    """
+    Résultat OCR déjà présent sur disque et plus récent que le fichier source
+    """
+    ocr_path = Path(output_folder) / f"{Path(file_path).stem}_ocr_result.json"
+    try:
+        if ocr_path.stat().st_mtime >= Path(file_path).stat().st_mtime:
+            return str(ocr_path)
+    except FileNotFoundError:
+        pass
+    return None
+
+def _run_job(job: dict, queue: JobQueue, output_folder: str,
+             ocr_slots: threading.Semaphore, structure_slots: threading.Semaphore,
+             multi_page: bool, preprocess: PreprocessConfig | None, max_attempts: int,
+             dedup: DedupIndex | None = None) -> dict:
+    """
+    Exécute un job de la file à partir de son étape courante et enregistre
+    chaque transition (un crash ne fait perdre que l'étape en cours)
+    """
+    file_path = job["file_path"]
+    result = {"file": file_path, "status": "ok", "reused_ocr": False, "error": None, "duplicate_of": None,
+              "ocr_seconds": 0.0, "structure_seconds": 0.0}
+    try:
+        duplicate = dedup.check_file(file_path) if dedup and job["state"] == PENDING else None
+        if duplicate is not None:
+            # 0️⃣ Doublon d'un document déjà traité : job rattaché à ses résultats
+            queue.mark_ocr_done(job, duplicate.ocr_json_path)
+        elif job["state"] == PENDING:
+            # 1️⃣ OCR, sauf si un résultat à jour existe déjà (reprise)
+            ocr_json_path = _existing_ocr_result(file_path, output_folder)
+            if ocr_json_path:
+                result["reused_ocr"] = True
+            else:
+                with ocr_slots:
+                    start = time.perf_counter()
+                    ocr_json_path = run_ocr(file_path, output_folder=output_folder, preprocess=preprocess)
+                    result["ocr_seconds"] = time.perf_counter() - start
+            queue.mark_ocr_done(job, ocr_json_path)
+        if duplicate is None and dedup:
+            duplicate = dedup.check_ocr(file_path, job["ocr_json_path"])
+        if duplicate is not None:
+            result["duplicate_of"] = duplicate.file_name
+            queue.mark_structured(job, duplicate.structured_json_path)
+            return result
+
+        # 2️⃣ Structuration LLM
+        with structure_slots:
+            start = time.perf_counter()
+            structured_json_path, _ = structure_ocr(job["ocr_json_path"], output_folder=output_folder,
+                                                    multi_page=multi_page)
+            result["structure_seconds"] = time.perf_counter() - start
+        if dedup:
+            dedup.record_result(file_path, job["ocr_json_path"], structured_json_path)
+        queue.mark_structured(job, structured_json_path)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["status"] = "retry" if queue.mark_failed(job, result["error"], max_attempts) else "failed"
+    return result
+
+def process_queue(files: list[str], batch: str, output_folder: str = "./data/samples",
+                  queue_file: str = QUEUE_FILE, max_workers: int = 4,
+                  ocr_concurrency: int | None = None, structure_concurrency: int | None = None,
+                  multi_page: bool = False, preprocess: PreprocessConfig | None = None,
+                  max_attempts: int = DEFAULT_MAX_ATTEMPTS, dedup: DedupIndex | None = None) -> dict:
+    """
+    Traitement reprenable : les fichiers sont ajoutés au lot `batch` d'une
+    file SQLite persistante, puis des workers réservent les jobs un par un.
+
+    - relancer le même lot après un crash reprend là où il s'était arrêté
+      (fichiers déjà structurés ignorés, *_ocr_result.json existants réutilisés)
+    - un job en échec est réessayé avec backoff jusqu'à max_attempts tentatives
+    """
+    queue = JobQueue(queue_file)
+    created = queue.enqueue(batch, files)
+    recovered = queue.recover(batch)
+    max_workers = max(1, max_workers)
+    ocr_slots = threading.Semaphore(max(1, ocr_concurrency or max_workers))
+    structure_slots = threading.Semaphore(max(1, structure_concurrency or max_workers))
+
+    logger.info("🔹 Lot %s : %d nouveau(x) job(s), %d repris, état %s", batch, created, recovered, queue.stats(batch))
+    attempts = []
+    attempts_lock = threading.Lock()
+
+    def worker():
+        while True:
+            job = queue.claim(batch)
+            if job is None:
+                next_at = queue.next_retry_at(batch)
+                if next_at is None:
+                    return
+                # Jobs en attente de backoff : patienter puis réessayer
+                time.sleep(min(5.0, max(0.05, next_at - time.time())))
+                continue
+            res = _run_job(job, queue, output_folder, ocr_slots, structure_slots, multi_page, preprocess, max_attempts,
+                           dedup)
+            with attempts_lock:
+                attempts.append(res)
+            if res["duplicate_of"]:
+                logger.info("♻️ %s : doublon de %s", res["file"], res["duplicate_of"])
+            elif res["status"] == "ok":
+                logger.info("✅ %s%s", res["file"], " (OCR réutilisé)" if res["reused_ocr"] else "")
+            elif res["status"] == "retry":
+                logger.warning("⚠️ %s : %s (nouvel essai prévu)", res["file"], res["error"])
+            else:
+                logger.error("❌ %s : %s", res["file"], res["error"])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for future in [pool.submit(worker) for _ in range(max_workers)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    # 🔹 Résultat final de chaque fichier du lot (y compris ceux traités lors d'un run précédent)
+    wanted = {str(f) for f in files}
+    results = [
+        {
+            "file": job["file_path"],
+            "status": "ok" if job["state"] == STRUCTURED else "failed",
+            "state": job["state"],
+            "attempts": job["attempts"],
+            "ocr_json_path": job["ocr_json_path"],
+            "structured_json_path": job["structured_json_path"],
+            "error": job["error"] if job["state"] != STRUCTURED else None,
+        }
+        for job in queue.jobs(batch) if job["file_path"] in wanted
+    ]
+    processed = sum(1 for a in attempts if a["status"] == "ok")
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    summary = {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "processed_this_run": processed,
+        "reused_ocr": sum(1 for a in attempts if a["reused_ocr"]),
+        "duplicates": sum(1 for a in attempts if a["duplicate_of"]),
+        "retries": sum(1 for a in attempts if a["status"] == "retry"),
+        "elapsed_seconds": elapsed,
+        "docs_per_second": processed / elapsed if elapsed > 0 else 0.0,
+    }
+    logger.info(
+        "📊 Lot %s terminé : %d/%d réussi(s), %d échec(s), %d traité(s) en %.1fs (%d OCR réutilisé(s))",
+        batch, succeeded, len(results), summary["failed"], processed, elapsed, summary["reused_ocr"]
+    )
+    return {"results": results, "summary": summary}
+
+def process_folder(folder_path: str, output_folder: str = "./data/samples",
+                   max_workers: int = 1, ocr_concurrency: int | None = None,
+                   structure_concurrency: int | None = None, multi_page: bool = False,
+                   preprocess: PreprocessConfig | None = None, resume: bool = False,
+                   queue_file: str = QUEUE_FILE, dedup: DedupIndex | None = None, bulk: bool = False,
+                   batch_timeout_seconds: float | None = None):
+    """
+    Traite tous les fichiers PDF et images d'un dossier.
+
+    Par défaut les fichiers sont traités un par un ; avec max_workers > 1
+    le dossier passe par process_batch (traitement concurrent).
+    Avec resume=True le dossier passe par la file persistante (process_queue) :
+    une relance après un crash reprend là où le lot s'était arrêté.
+    Avec dedup (ex. DedupIndex()), les doublons de documents déjà traités
+    sont rattachés à leurs résultats au lieu d'être retraités.
+    Avec bulk=True le dossier passe par l'API batch (run_batch, traitements de
+    nuit) : moins cher, mais les résultats arrivent en minutes ou en heures ;
+    dedup, preprocess, multi_page et resume y sont refusés (ValueError).
+    """
+    if bulk:
+        # 🔹 Le mode batch n'applique ni dédoublonnage, ni prétraitement, ni structuration multi-pages
+        unsupported = [name for name, value in (("dedup", dedup), ("preprocess", preprocess),
+                                                ("multi_page", multi_page), ("resume", resume)) if value]
+        if unsupported:
+            raise ValueError(f"❌ bulk=True incompatible avec : {', '.join(unsupported)} "
+                             "(les jobs batch en cours sont déjà repris à la relance)")
+        return run_batch(list_documents(folder_path), output_folder=output_folder,
+                         timeout_seconds=batch_timeout_seconds)
+    files = list_documents(folder_path)
+    if resume:
+        return process_queue(
+            files,
+            batch=str(Path(folder_path).resolve()),
+            output_folder=output_folder,
+            queue_file=queue_file,
+            max_workers=max_workers,
+            ocr_concurrency=ocr_concurrency,
+            structure_concurrency=structure_concurrency,
+            multi_page=multi_page,
+            preprocess=preprocess,
+            dedup=dedup,
+        )
+    if max_workers <= 1 and ocr_concurrency is None and structure_concurrency is None:
+        for file in files:
+            process_file(file, output_folder=output_folder, multi_page=multi_page, preprocess=preprocess, dedup=dedup)
+        return None
+    return process_batch(
+        files,
+        output_folder=output_folder,
+        max_workers=max_workers,
+        ocr_concurrency=ocr_concurrency,
+        structure_concurrency=structure_concurrency,
+        multi_page=multi_page,
+        preprocess=preprocess,
+        dedup=dedup,
+    )
 
 if __name__ == "__main__":
+    # 🔹 Logs console (OCR_LOG_LEVEL=DEBUG pour voir le texte de chaque page)
+    configure_logging()
+
     # 🔹 Exemple : traiter un seul fichier
     single_file = "./data/samples/facture1.pdf"
     process_file(single_file)
@@ -40,3 +393,21 @@ if __name__ == "__main__":
     # 🔹 Exemple : traiter un dossier entier
     # folder_path = "./data/samples/"
     # process_folder(folder_path)
+
+    # 🔹 Exemple : traiter un dossier en parallèle (8 fichiers, 4 OCR, 2 LLM simultanés)
+    # process_folder(folder_path, max_workers=8, ocr_concurrency=4, structure_concurrency=2)
+
+    # 🔹 Exemple : lot reprenable (file SQLite data/jobs.db, relancer reprend là où il s'était arrêté)
+    # process_folder(folder_path, max_workers=8, resume=True)
+
+    # 🔹 Exemple : lot de nuit via l'API batch (jobs suivis dans data/samples/batch_state.json)
+    # process_folder(folder_path, bulk=True)
+
+    # 🔹 Exemple : photos réduites à 200 DPI, en gris, redressées
+    # process_folder(folder_path, max_workers=8, preprocess=PreprocessConfig(target_dpi=200, deskew=True))
+
+    # 🔹 Exemple : doublons (renvois, rescans) rattachés aux résultats existants (data/dedup.db)
+    # process_folder(folder_path, max_workers=8, dedup=DedupIndex())
+
+    # 🔹 Durées / tailles / tokens par étape (OCR_METRICS_JSONL=chemin pour le détail en JSON lines)
+    metrics.write_prometheus("./data/metrics.prom")
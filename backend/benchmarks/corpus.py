@@ -0,0 +1,184 @@
+# corpus.py
+import json
+import random
+from pathlib import Path
+
+# ----------------------
+# Corpus synthétiques de factures (déterministes à graine égale)
+# ----------------------
+
+SELLERS = ["Dupont SARL", "Martin & Fils", "Boulangerie Lefèvre", "Garage Moreau", "Société Générale Énergie",
+           "Imprimerie Bernard", "Cabinet Petit", "Électricité Roux", "Transports Fournier", "Café Girard"]
+BUYERS = ["Durand SAS", "Mairie de Lyon", "Hôtel Mercier", "Clinique Blanc", "Lycée Lambert", "Atelier Bonnet"]
+PRODUCTS = ["Prestation de conseil", "Licence logiciel", "Maintenance annuelle", "Câble réseau", "Papier A4",
+            "Cartouche d'encre", "Livraison express", "Formation sécurité", "Écran 27 pouces", "Heures de main-d'œuvre"]
+TERMS = ["Paiement à 30 jours", "Paiement à réception", "Échéance fin de mois", "Acompte de 30 %"]
+
+# 🔹 Requêtes de recherche représentatives (mots, OR, phrases, préfixes)
+QUERIES = ["facture", "dupont", "maintenance annuelle", "licence OR formation", '"paiement à 30 jours"',
+           "électri*", "garage livraison", "lyon", "écran", "cartouche OR papier", "conseil*", "hôtel mercier"]
+
+
+def _invoice(seed: str) -> dict:
+    rng = random.Random(seed)
+    items = []
+    for _ in range(rng.randint(1, 6)):
+        quantity = rng.randint(1, 20)
+        unit_price = round(rng.uniform(5, 500), 2)
+        items.append({
+            "description": rng.choice(PRODUCTS),
+            "quantité": quantity,
+            "prix_unitaire": unit_price,
+            "montant": round(quantity * unit_price, 2),
+        })
+    subtotal = round(sum(i["montant"] for i in items), 2)
+    tax = round(subtotal * 0.2, 2)
+    day, month = rng.randint(1, 28), rng.randint(1, 12)
+    return {
+        "invoice_number": f"F-{rng.randint(2020, 2025)}-{rng.randint(1, 99999):05d}",
+        "date": f"{day:02d}/{month:02d}/{rng.randint(2020, 2025)}",
+        "due_date": None,
+        "seller": rng.choice(SELLERS),
+        "buyer": {"nom": rng.choice(BUYERS), "adresse": f"{rng.randint(1, 200)} rue de la République"},
+        "items": items,
+        "subtotal": subtotal,
+        "tax": tax,
+        "total": round(subtotal + tax, 2),
+        "amount_paid": None,
+        "terms": rng.choice(TERMS),
+    }
+
+
+def invoice_structured(seed: str) -> dict:
+    """
+    JSON structuré d'une facture synthétique
+    """
+    return _invoice(seed)
+
+
+def invoice_markdown(seed: str) -> str:
+    """
+    Texte OCR (Markdown) de la même facture synthétique
+    """
+    invoice = _invoice(seed)
+    lines = [
+        f"# FACTURE {invoice['invoice_number']}",
+        "",
+        f"**{invoice['seller']}**",
+        f"Date : {invoice['date']}",
+        f"Client : {invoice['buyer']['nom']}, {invoice['buyer']['adresse']}",
+        "",
+        "| Description | Quantité | Prix unitaire | Montant |",
+        "|---|---|---|---|",
+    ]
+    for item in invoice["items"]:
+        lines.append(f"| {item['description']} | {item['quantité']} | {item['prix_unitaire']:.2f} € "
+                     f"| {item['montant']:.2f} € |")
+    lines += [
+        "",
+        f"Sous-total : {invoice['subtotal']:.2f} €",
+        f"TVA 20 % : {invoice['tax']:.2f} €",
+        f"**Total : {invoice['total']:.2f} €**",
+        "",
+        invoice["terms"],
+    ]
+    return "\n".join(lines)
+
+
+def make_entries(n: int, seed: int = 0) -> list[dict]:
+    """
+    Entrées d'index (même forme que celles de parser.build_index)
+    """
+    entries = []
+    for i in range(n):
+        key = f"{seed}-{i}"
+        entries.append({
+            "file_name": f"doc{i:06d}.pdf",
+            "document_type": "facture",
+            "full_text": invoice_markdown(key),
+            "structured_json": invoice_structured(key),
+        })
+    return entries
+
+
+def _pymupdf():
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            import fitz as pymupdf
+        except ImportError as e:
+            raise ImportError("❌ Le corpus de PDF nécessite PyMuPDF (pip install pymupdf)") from e
+    return pymupdf
+
+
+def _draw_invoice(page, seed: str) -> None:
+    # 🔹 Police standard PDF (Helvetica) : pas de glyphe "€"
+    page.insert_text((50, 60), invoice_markdown(seed).replace("€", "EUR"), fontsize=9, fontname="helv")
+
+
+def write_source_files(folder: str, n: int, size_kb: int = 64, seed: int = 0, pages_per_doc: int = 1,
+                       scanned_ratio: float = 0.5, scan_dpi: int = 100) -> list[str]:
+    """
+    PDF valides de pages_per_doc pages A4, mélangeant :
+    - pages avec couche texte (lues localement par text_layer)
+    - pages scannées (une image de la page, sans texte : envoyées à l'OCR),
+      environ scanned_ratio des pages
+    Les fichiers plus petits que size_kb Ko sont complétés par une pièce
+    jointe aléatoire (taille d'envoi réaliste, contenu ignoré par l'OCR).
+    """
+    pymupdf = _pymupdf()
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n):
+        path = Path(folder) / f"doc{i:06d}.pdf"
+        with pymupdf.open() as doc:
+            for p in range(pages_per_doc):
+                page_seed = f"{seed}-{i}-{p}"
+                page = doc.new_page(width=595, height=842)
+                if rng.random() < scanned_ratio:
+                    # 🔹 Page "scannée" : rendu en niveaux de gris, collé en image pleine page
+                    with pymupdf.open() as scratch:
+                        source = scratch.new_page(width=595, height=842)
+                        _draw_invoice(source, page_seed)
+                        pix = source.get_pixmap(dpi=scan_dpi, colorspace=pymupdf.csGRAY)
+                    page.insert_image(page.rect, pixmap=pix)
+                else:
+                    _draw_invoice(page, page_seed)
+            padding = size_kb * 1024 - len(doc.tobytes(garbage=3, deflate=True))
+            if padding > 0:
+                doc.embfile_add("padding.bin", rng.randbytes(padding))
+            doc.save(str(path), garbage=3, deflate=True)
+        paths.append(str(path))
+    return paths
+
+
+def write_ocr_corpus(folder: str, n: int, pages_per_doc: int = 1, seed: int = 0,
+                     with_structured: bool = True) -> list[str]:
+    """
+    Écrit n fichiers *_ocr_result.json (et *_structured.json) comme le ferait le pipeline.
+    Retourne les chemins des fichiers OCR.
+    """
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(n):
+        stem = f"doc{i:06d}"
+        pages = [{"index": p, "markdown": invoice_markdown(f"{seed}-{i}-{p}"), "images": []}
+                 for p in range(pages_per_doc)]
+        ocr_dict = {
+            "pages": pages,
+            "model": "mistral-ocr-latest",
+            "full_text": " ".join(page["markdown"] for page in pages),
+            "file_name": f"{stem}.pdf",
+            "num_pages": len(pages),
+            "document_type": "facture",
+        }
+        ocr_path = Path(folder) / f"{stem}_ocr_result.json"
+        with open(ocr_path, "w", encoding="utf-8") as f:
+            json.dump(ocr_dict, f, ensure_ascii=False, indent=4)
+        if with_structured:
+            with open(Path(folder) / f"{stem}_structured.json", "w", encoding="utf-8") as f:
+                json.dump(invoice_structured(f"{seed}-{i}-0"), f, ensure_ascii=False, indent=4)
+        paths.append(str(ocr_path))
+    return paths
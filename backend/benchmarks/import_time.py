@@ -0,0 +1,140 @@
+# import_time.py
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from .run import percentile
+
+# ----------------------
+# Coût d'import des modules de services (processus neuf à chaque mesure)
+# ----------------------
+# Exemple :
+#   python -m backend.benchmarks.import_time --repeat 5 --budget-ms 150
+
+MODULES = (
+    "backend.services.ocr_engine",
+    "backend.services.exporter",
+    "backend.services.parser",
+    "backend.services.preprocessing",
+    "backend.services.index_store",
+    "backend.services.search",
+    "backend.services.schema",
+    "backend.services.analytics",
+    "backend.services.api",
+    "backend.services.text_layer",
+    "backend.services.pdf_split",
+    "backend.services.dedup",
+    "backend.services.batch",
+)
+
+# 🔹 Dépendances lourdes qui ne doivent être chargées qu'au premier usage
+HEAVY_MODULES = ("streamlit", "mistralai", "httpx", "dotenv", "PIL", "pandas", "pyarrow", "fastapi", "pymupdf")
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+
+_PROBE = """
+import sys, json
+import {module}
+print(json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)))
+"""
+
+
+def _parse_importtime(stderr: str, module: str) -> tuple[float | None, list[tuple[str, float]]]:
+    """
+    Sortie de -X importtime -> (cumul du module en ms, [(module, temps propre en ms)])
+    """
+    cumulative, own = None, []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        own.append((name, int(self_us) / 1000))
+        if name == module:
+            cumulative = int(cumulative_us) / 1000
+    return cumulative, own
+
+
+def measure_import(module: str, workdir: str) -> dict:
+    """
+    Importe module dans un interpréteur neuf (cwd = workdir) et mesure son coût
+    """
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), os.getenv("PYTHONPATH")]))}
+    probe = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], cwd=workdir, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"module": module, "error": proc.stderr.strip().splitlines()[-1]}
+    cumulative, own = _parse_importtime(proc.stderr, module)
+    return {
+        "module": module,
+        "import_ms": cumulative,
+        "heavy_loaded": json.loads(proc.stdout.strip().splitlines()[-1]),
+        "top_self_ms": sorted(own, key=lambda item: item[1], reverse=True)[:5],
+    }
+
+
+def run_import_benchmark(modules=MODULES, repeat: int = 5) -> list[dict]:
+    results = []
+    for module in modules:
+        # 🔹 Dossier vide : un import qui écrit des fichiers (index, cache...) est détecté
+        with tempfile.TemporaryDirectory(prefix="ocr-import-") as workdir:
+            runs = [measure_import(module, workdir) for _ in range(max(1, repeat))]
+            side_effects = sorted(os.listdir(workdir))
+        errors = [r["error"] for r in runs if "error" in r]
+        if errors:
+            results.append({"module": module, "error": errors[0]})
+            continue
+        timings = [r["import_ms"] for r in runs if r["import_ms"] is not None]
+        results.append({
+            "module": module,
+            "p50_ms": percentile(timings, 50),
+            "max_ms": max(timings) if timings else None,
+            "heavy_loaded": runs[-1]["heavy_loaded"],
+            "files_created": side_effects,
+            "top_self_ms": runs[-1]["top_self_ms"],
+        })
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Coût d'import des modules de services")
+    parser.add_argument("--modules", default=",".join(MODULES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="échec si un import dépasse ce temps (p50)")
+    parser.add_argument("--output", help="fichier JSON des résultats")
+    args = parser.parse_args(argv)
+
+    results = run_import_benchmark([m.strip() for m in args.modules.split(",") if m.strip()], args.repeat)
+    failed = False
+    for r in results:
+        if "error" in r:
+            failed = True
+            print(f"❌ {r['module']} : {r['error']}")
+            continue
+        problems = []
+        if r["heavy_loaded"]:
+            problems.append(f"charge {', '.join(r['heavy_loaded'])}")
+        if r["files_created"]:
+            problems.append(f"crée {', '.join(r['files_created'])}")
+        if args.budget_ms is not None and r["p50_ms"] is not None and r["p50_ms"] > args.budget_ms:
+            problems.append(f"dépasse {args.budget_ms:.0f} ms")
+        failed = failed or bool(problems)
+        status = "⚠️" if problems else "✅"
+        print(f"{status} {r['module']:<32} p50 {r['p50_ms']:.1f} ms | max {r['max_ms']:.1f} ms"
+              + (f" | {'; '.join(problems)}" if problems else ""))
+        slowest = ", ".join(f"{name} {ms:.1f}" for name, ms in r["top_self_ms"][:3])
+        print(f"   modules les plus lents (ms) : {slowest}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        print(f"✅ Résultats sauvegardés dans : {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+# mock_mistral.py
+import json
+import time
+import base64
+import uuid
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .corpus import _pymupdf, invoice_markdown, invoice_structured
+
+# ----------------------
+# Faux serveur Mistral (OCR, chat, files) pour les benchmarks hors ligne
+# ----------------------
+# Le client est redirigé ici avec MISTRAL_SERVER_URL=http://127.0.0.1:<port>
+
+
+class MockMistralServer:
+    """
+    Serveur HTTP local imitant les endpoints utilisés par le pipeline :
+    - POST /v1/ocr
+    - POST /v1/chat/completions
+    - POST /v1/files, GET /v1/files/<id>/url, GET /v1/files/<id>/content, DELETE /v1/files/<id>
+    - POST /v1/batch/jobs, GET /v1/batch/jobs/<id> (fichiers JSONL d'entrée / de sortie)
+
+    - latency_ms : latence simulée par requête (± jitter_ms)
+    - error_rate : proportion de réponses en erreur transitoire (429 / 503)
+    - pages_per_doc : nombre de pages renvoyées par l'OCR (les PDF lisibles
+      renvoient une page par page du document)
+    - batch_seconds : durée d'un job batch (QUEUED -> RUNNING -> SUCCESS)
+    - batch_error_rate : proportion de requêtes en échec dans un job batch
+    """
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 10.0, error_rate: float = 0.0,
+                 pages_per_doc: int = 1, host: str = "127.0.0.1", port: int = 0, seed: int | None = None,
+                 batch_seconds: float = 0.2, batch_error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.pages_per_doc = pages_per_doc
+        self.batch_seconds = batch_seconds
+        self.batch_error_rate = batch_error_rate
+        self.random = random.Random(seed)
+        self.counts = {"ocr": 0, "chat": 0, "files": 0, "errors": 0, "batch_jobs": 0, "batch_requests": 0}
+        self.files: dict[str, dict] = {}
+        self.batch_jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockMistralServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # 🔹 Tirages aléatoires partagés entre les threads du serveur
+    def _draw(self) -> tuple[float, bool]:
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            failed = self.random.random() < self.error_rate
+            return delay, failed
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[key] += n
+
+    def _store_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        meta = {
+            "id": str(uuid.uuid4()),
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "sample_type": "batch_result" if purpose == "batch" else "ocr_input",
+            "source": "upload",
+        }
+        with self._lock:
+            self.files[meta["id"]] = {"meta": meta, "content": content}
+        return meta
+
+    def _create_batch(self, body: dict) -> dict:
+        job = {
+            "id": str(uuid.uuid4()),
+            "object": "batch",
+            "input_files": body.get("input_files") or [],
+            "endpoint": body.get("endpoint"),
+            "model": body.get("model"),
+            "metadata": body.get("metadata"),
+            "errors": [],
+            "status": "QUEUED",
+            "created_at": int(time.time()),
+            "total_requests": 0,
+            "completed_requests": 0,
+            "succeeded_requests": 0,
+            "failed_requests": 0,
+            "output_file": None,
+            "error_file": None,
+        }
+        with self._lock:
+            self.batch_jobs[job["id"]] = job
+        self._count("batch_jobs")
+        threading.Thread(target=self._run_batch, args=(job,), daemon=True).start()
+        return job
+
+    def _run_batch(self, job: dict) -> None:
+        """
+        Exécute un job batch : une ligne de sortie par ligne d'entrée (même custom_id)
+        """
+        lines = []
+        for file_id in job["input_files"]:
+            content = self.files.get(file_id, {}).get("content", b"")
+            lines += [json.loads(line) for line in content.decode("utf-8").splitlines() if line.strip()]
+        with self._lock:
+            job.update(status="RUNNING", total_requests=len(lines), started_at=int(time.time()))
+        time.sleep(self.batch_seconds)
+
+        outputs, errors = [], []
+        for line in lines:
+            body = dict(line.get("body") or {}, model=job["model"])
+            with self._lock:
+                failed = self.random.random() < self.batch_error_rate
+            if failed:
+                errors.append({"id": str(uuid.uuid4()), "custom_id": line.get("custom_id"), "response": None,
+                               "error": {"message": "mock batch request error", "code": "500"}})
+                continue
+            payload = _ocr_response(self, body) if job["endpoint"] == "/v1/ocr" else _chat_response(body)
+            outputs.append({"id": str(uuid.uuid4()), "custom_id": line.get("custom_id"),
+                            "response": {"status_code": 200, "body": payload}, "error": None})
+        self._count("batch_requests", len(lines))
+
+        def jsonl(records):
+            return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+
+        output = self._store_file(jsonl(outputs), f"{job['id']}_output.jsonl", "batch") if outputs else None
+        error = self._store_file(jsonl(errors), f"{job['id']}_error.jsonl", "batch") if errors else None
+        with self._lock:
+            job.update(
+                status="SUCCESS",
+                completed_requests=len(lines),
+                succeeded_requests=len(outputs),
+                failed_requests=len(errors),
+                output_file=output["id"] if output else None,
+                error_file=error["id"] if error else None,
+                completed_at=int(time.time()),
+            )
+
+
+def _multipart_file(content_type: str, raw: bytes) -> tuple[str, bytes, dict]:
+    """
+    Corps multipart/form-data -> (nom du fichier, contenu, autres champs)
+    """
+    boundary = content_type.split("boundary=", 1)[-1].strip('"').encode()
+    filename, content, fields = "upload", b"", {}
+    for part in raw.split(b"--" + boundary):
+        head, sep, data = part.partition(b"\r\n\r\n")
+        if not sep:
+            continue
+        data = data[:-2] if data.endswith(b"\r\n") else data
+        header = head.decode("utf-8", "replace")
+        name = header.split('name="', 1)[-1].split('"', 1)[0]
+        if 'filename="' in header:
+            filename = header.split('filename="', 1)[-1].split('"', 1)[0]
+            content = data
+        else:
+            fields[name] = data.decode("utf-8", "replace")
+    return filename, content, fields
+
+
+def _page_count(server: MockMistralServer, document: dict) -> int:
+    """
+    Pages du PDF envoyé (data URL ou fichier déposé sur le serveur) ;
+    pages_per_doc pour les images, les faux PDF ou sans PyMuPDF
+    """
+    url = document.get("document_url") or ""
+    if url.startswith("data:application/pdf;base64,"):
+        content = base64.b64decode(url.split(",", 1)[1])
+    elif url.startswith(f"{server.url}/signed/"):
+        content = server.files.get(url.rsplit("/", 1)[1], {}).get("content", b"")
+    else:
+        return server.pages_per_doc
+    try:
+        pymupdf = _pymupdf()
+        with pymupdf.open(stream=content, filetype="pdf") as doc:
+            return doc.page_count
+    except Exception:
+        return server.pages_per_doc
+
+
+def _ocr_response(server: MockMistralServer, body: dict) -> dict:
+    seed = json.dumps(body.get("document", {}), sort_keys=True)[:256]
+    pages = [
+        {
+            "index": i,
+            "markdown": invoice_markdown(f"{seed}-{i}"),
+            "images": [],
+            "dimensions": {"dpi": 200, "height": 2339, "width": 1654},
+        }
+        for i in range(_page_count(server, body.get("document", {})))
+    ]
+    return {
+        "pages": pages,
+        "model": body.get("model", "mistral-ocr-latest"),
+        "usage_info": {"pages_processed": len(pages), "doc_size_bytes": None},
+    }
+
+
+def _chat_response(body: dict) -> dict:
+    prompt = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+    content = json.dumps(invoice_structured(prompt[-256:]), ensure_ascii=False)
+    prompt_tokens = len(prompt) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "id": f"cmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "model": body.get("model", "mistral-large-latest"),
+        "created": int(time.time()),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content, "tool_calls": None},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _make_handler(server: MockMistralServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _read_body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _send(self, status: int, payload: dict | bytes, headers: dict | None = None) -> None:
+            raw = isinstance(payload, bytes)
+            data = payload if raw else json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream" if raw else "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _simulate(self) -> bool:
+            """
+            Applique la latence simulée ; retourne False si une erreur a été renvoyée
+            """
+            delay, failed = server._draw()
+            time.sleep(delay)
+            if failed:
+                server._count("errors")
+                status = server.random.choice((429, 503))
+                self._send(status, {"object": "error", "message": "mock transient error", "code": str(status)},
+                           headers={"Retry-After": "0"})
+                return False
+            return True
+
+        def do_POST(self):
+            raw = self._read_body()
+            if not self._simulate():
+                return
+            if self.path.startswith("/v1/ocr"):
+                server._count("ocr")
+                self._send(200, _ocr_response(server, json.loads(raw or b"{}")))
+            elif self.path.startswith("/v1/chat/completions"):
+                server._count("chat")
+                self._send(200, _chat_response(json.loads(raw or b"{}")))
+            elif self.path.startswith("/v1/files"):
+                server._count("files")
+                filename, content, fields = _multipart_file(self.headers.get("Content-Type", ""), raw)
+                self._send(200, server._store_file(content, filename, fields.get("purpose", "ocr")))
+            elif self.path.startswith("/v1/batch/jobs"):
+                self._send(200, server._create_batch(json.loads(raw or b"{}")))
+            else:
+                self._send(404, {"object": "error", "message": f"unknown path {self.path}"})
+
+        def do_GET(self):
+            if self.path.startswith("/v1/files/") and "/url" in self.path:
+                file_id = self.path.split("/")[3]
+                self._send(200, {"url": f"{server.url}/signed/{file_id}"})
+            elif self.path.startswith("/v1/files/") and self.path.split("?")[0].endswith("/content"):
+                stored = server.files.get(self.path.split("/")[3])
+                if stored is None:
+                    self._send(404, {"object": "error", "message": "unknown file"})
+                else:
+                    self._send(200, stored["content"])
+            elif self.path.startswith("/v1/batch/jobs/"):
+                job = server.batch_jobs.get(self.path.split("/")[4].split("?")[0])
+                if job is None:
+                    self._send(404, {"object": "error", "message": "unknown batch job"})
+                else:
+                    with server._lock:
+                        self._send(200, dict(job))
+            else:
+                self._send(404, {"object": "error", "message": f"unknown path {self.path}"})
+
+        def do_DELETE(self):
+            if self.path.startswith("/v1/files/"):
+                self._send(200, {"id": self.path.split("/")[3], "object": "file", "deleted": True})
+            else:
+                self._send(404, {"object": "error", "message": f"unknown path {self.path}"})
+
+    return Handler
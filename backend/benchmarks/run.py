@@ -0,0 +1,351 @@
+# run.py
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+
+from .corpus import QUERIES, make_entries, write_source_files, write_ocr_corpus
+from .mock_mistral import MockMistralServer
+
+# ----------------------
+# Benchmarks hors ligne du pipeline (API Mistral simulée en local)
+# ----------------------
+# Exemple :
+#   python -m backend.benchmarks.run --sizes 100,1000 --latency-ms 80 --error-rate 0.02
+#   python -m backend.benchmarks.run --stages index,search --sizes 100000 --output bench.json
+
+STAGES = ("ocr", "structure", "folder", "index", "search", "analytics")
+DEFAULT_SIZES = (100, 1000)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """
+    Percentile par interpolation linéaire (p entre 0 et 100)
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_mb() -> float | None:
+    """
+    Pic de mémoire résidente du processus courant (None si indisponible, ex. Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux : Ko, macOS : octets
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def _timed_map(fn, items: list, concurrency: int) -> list[float]:
+    """
+    Applique fn à chaque élément (concurrency threads) et retourne les latences
+    """
+    def timed(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return list(pool.map(timed, items))
+
+
+# ----------------------
+# Étapes mesurées (exécutées dans le processus enfant, cwd = dossier de travail)
+# ----------------------
+def _bench_ocr(size: int, options: dict) -> dict:
+    from backend.services.ocr_engine import run_ocr
+
+    files = write_source_files("src", size, size_kb=options["source_kb"], pages_per_doc=options["pages_per_doc"])
+    start = time.perf_counter()
+    latencies = _timed_map(lambda f: run_ocr(f, output_folder="out", use_cache=False), files,
+                           options["concurrency"])
+    return {"elapsed_seconds": time.perf_counter() - start, "latencies": latencies}
+
+
+def _bench_structure(size: int, options: dict) -> dict:
+    from backend.services.exporter import structure_ocr
+
+    ocr_files = write_ocr_corpus("ocr", size, pages_per_doc=options["pages_per_doc"], with_structured=False)
+    start = time.perf_counter()
+    latencies = _timed_map(lambda f: structure_ocr(f, output_folder="out", use_cache=False), ocr_files,
+                           options["concurrency"])
+    return {"elapsed_seconds": time.perf_counter() - start, "latencies": latencies}
+
+
+def _bench_folder(size: int, options: dict) -> dict:
+    # backend/app.py importe ses services en "services.X" (lancé depuis backend/)
+    sys.path.insert(0, str(BACKEND_DIR))
+    import app as workflow
+
+    write_source_files("src", size, size_kb=options["source_kb"], pages_per_doc=options["pages_per_doc"])
+    start = time.perf_counter()
+    batch = workflow.process_folder("src", output_folder="out", max_workers=options["concurrency"],
+                                    ocr_concurrency=options["concurrency"])
+    elapsed = time.perf_counter() - start
+    results = batch["results"]
+    return {
+        "elapsed_seconds": elapsed,
+        "latencies": [r["ocr_seconds"] + r["structure_seconds"] for r in results if r["status"] == "ok"],
+        "failed": batch["summary"]["failed"],
+    }
+
+
+def _bench_index(size: int, options: dict) -> dict:
+    from backend.services.parser import build_index
+
+    folder = "data/samples"
+    ocr_files = write_ocr_corpus(folder, size, pages_per_doc=options["pages_per_doc"])
+    kwargs = {"ocr_folder": folder, "structured_folder": folder, "db_file": "data/index.db"}
+
+    start = time.perf_counter()
+    build_index(full_rebuild=True, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    # 🔹 Mises à jour incrémentales : rien de changé, puis 1 % des fichiers modifiés
+    start = time.perf_counter()
+    build_index(**kwargs)
+    noop_seconds = time.perf_counter() - start
+
+    changed = ocr_files[::100] or ocr_files[:1]
+    write_ocr_corpus("changed", len(changed), seed=1, with_structured=False)
+    for i, path in enumerate(changed):
+        shutil.copyfile(Path("changed") / f"doc{i:06d}_ocr_result.json", path)
+    start = time.perf_counter()
+    build_index(**kwargs)
+    incremental_seconds = time.perf_counter() - start
+
+    return {
+        "elapsed_seconds": elapsed,
+        "latencies": [],
+        "incremental_noop_seconds": noop_seconds,
+        "incremental_1pct_seconds": incremental_seconds,
+    }
+
+
+def _bench_search(size: int, options: dict) -> dict:
+    from backend.services.index_store import IndexStore
+
+    entries = make_entries(size)
+    start = time.perf_counter()
+    store = IndexStore("data/index.db")
+    store.upsert_many(entries)
+    setup_seconds = time.perf_counter() - start
+
+    queries = QUERIES * options["query_rounds"]
+    start = time.perf_counter()
+    latencies = _timed_map(lambda q: store.search(q, limit=50), queries, 1)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "elapsed_seconds": elapsed,
+        "latencies": latencies,
+        "items": len(queries),
+        "setup_seconds": setup_seconds,
+    }
+
+
+def _bench_analytics(size: int, options: dict) -> dict:
+    from backend.services.analytics import export_analytics, totals_by_seller_month
+    from backend.services.index_store import IndexStore
+
+    store = IndexStore("data/index.db")
+    store.upsert_many(make_entries(size))
+
+    start = time.perf_counter()
+    summary = export_analytics(store, "data/analytics")
+    elapsed = time.perf_counter() - start
+
+    # 🔹 Agrégation type analyste : total des lignes par vendeur et par mois
+    start = time.perf_counter()
+    totals_by_seller_month("data/analytics")
+    aggregate_seconds = time.perf_counter() - start
+
+    return {
+        "elapsed_seconds": elapsed,
+        "latencies": [],
+        "line_items": summary["items_written"],
+        "aggregate_seconds": aggregate_seconds,
+    }
+
+
+BENCHMARKS = {
+    "ocr": _bench_ocr,
+    "structure": _bench_structure,
+    "folder": _bench_folder,
+    "index": _bench_index,
+    "search": _bench_search,
+    "analytics": _bench_analytics,
+}
+
+
+def run_case(stage: str, size: int, workdir: str, options: dict) -> dict:
+    """
+    Exécute une étape sur un corpus de size documents et retourne ses mesures.
+    Les chemins relatifs (./data, sorties) restent dans workdir.
+    """
+    Path(workdir).mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        measured = BENCHMARKS[stage](size, options)
+
+    # 🔹 Détail par étape du registre de metrics.py (si le pipeline l'a chargé)
+    registry = sys.modules.get("backend.services.metrics") or sys.modules.get("services.metrics")
+    if registry is not None:
+        measured["stages"] = registry.metrics.snapshot()["stages"]
+
+    latencies = measured.pop("latencies")
+    items = measured.pop("items", size)
+    elapsed = measured.pop("elapsed_seconds")
+    p50, p95 = percentile(latencies, 50), percentile(latencies, 95)
+    return {
+        "stage": stage,
+        "size": size,
+        "items": items,
+        "elapsed_seconds": elapsed,
+        "docs_per_second": items / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": p50 * 1000 if p50 is not None else None,
+        "p95_ms": p95 * 1000 if p95 is not None else None,
+        "peak_rss_mb": peak_rss_mb(),
+        **measured,
+    }
+
+
+def run_benchmarks(stages=STAGES, sizes=DEFAULT_SIZES, latency_ms: float = 50.0, jitter_ms: float = 10.0,
+                   error_rate: float = 0.0, pages_per_doc: int = 1, concurrency: int = 8,
+                   source_kb: int = 64, query_rounds: int = 20, isolate: bool = True) -> list[dict]:
+    """
+    Lance chaque (étape, taille) contre un serveur Mistral simulé.
+
+    Avec isolate=True chaque cas tourne dans un processus neuf, ce qui rend
+    le pic de RSS propre à ce cas.
+    """
+    options = {"concurrency": concurrency, "pages_per_doc": pages_per_doc,
+               "source_kb": source_kb, "query_rounds": query_rounds}
+    results = []
+    with MockMistralServer(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate,
+                           pages_per_doc=pages_per_doc, seed=0) as server, \
+            tempfile.TemporaryDirectory(prefix="ocr-bench-") as tmp:
+        # 🔹 Variables lues par les services (héritées par les processus enfants)
+        os.environ["MISTRAL_SERVER_URL"] = server.url
+        os.environ.setdefault("MISTRAL_API_KEY", "benchmark")
+        os.environ["OCR_CACHE_DISABLED"] = "1"
+        os.environ["OCR_BLOB_DIR"] = os.path.join(tmp, "blobs")
+
+        for stage in stages:
+            for size in sizes:
+                workdir = os.path.join(tmp, f"{stage}-{size}")
+                print(f"🔹 {stage} × {size} documents...")
+                if isolate:
+                    ctx = multiprocessing.get_context("spawn")
+                    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                        result = pool.submit(run_case, stage, size, workdir, options).result()
+                else:
+                    cwd = os.getcwd()
+                    try:
+                        result = run_case(stage, size, workdir, options)
+                    finally:
+                        os.chdir(cwd)
+                results.append(result)
+                print(format_result(result))
+                shutil.rmtree(workdir, ignore_errors=True)
+        print(f"📊 Requêtes reçues par le serveur simulé : {server.counts}")
+    return results
+
+
+def _fmt(value, pattern: str) -> str:
+    return "n/a" if value is None else pattern.format(value)
+
+
+def format_result(result: dict) -> str:
+    return (
+        f"✅ {result['stage']:<9} {result['size']:>7} docs | "
+        f"{result['docs_per_second']:>9.1f} /s | "
+        f"p50 {_fmt(result['p50_ms'], '{:.1f}')} ms | p95 {_fmt(result['p95_ms'], '{:.1f}')} ms | "
+        f"RSS max {_fmt(result['peak_rss_mb'], '{:.0f}')} Mo"
+    )
+
+
+def compare_to_baseline(results: list[dict], baseline: list[dict], tolerance: float = 0.2) -> list[str]:
+    """
+    Liste les cas dont le débit a baissé de plus de tolerance par rapport à baseline
+    """
+    reference = {(b["stage"], b["size"]): b for b in baseline}
+    regressions = []
+    for r in results:
+        b = reference.get((r["stage"], r["size"]))
+        if b and b["docs_per_second"] and r["docs_per_second"] < b["docs_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{r['stage']} × {r['size']} : {r['docs_per_second']:.1f}/s "
+                f"(référence {b['docs_per_second']:.1f}/s)"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne du pipeline OCR")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"parmi {', '.join(STAGES)}")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="ex. 100,1000,100000")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--pages", type=int, default=1, help="pages par document")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--source-kb", type=int, default=64)
+    parser.add_argument("--output", help="fichier JSON des résultats")
+    parser.add_argument("--baseline", help="résultats de référence (JSON) à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="baisse de débit tolérée (0.2 = 20 %%)")
+    parser.add_argument("--no-isolate", action="store_true", help="tout exécuter dans le processus courant")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in BENCHMARKS]
+    if unknown:
+        parser.error(f"étape(s) inconnue(s) : {', '.join(unknown)}")
+
+    results = run_benchmarks(
+        stages=stages,
+        sizes=[int(s) for s in args.sizes.split(",") if s.strip()],
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        pages_per_doc=args.pages,
+        concurrency=args.concurrency,
+        source_kb=args.source_kb,
+        isolate=not args.no_isolate,
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        print(f"✅ Résultats sauvegardés dans : {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"❌ Régression : {line}")
+        if regressions:
+            return 1
+        print("✅ Aucune régression par rapport à la référence")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
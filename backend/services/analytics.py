@@ -0,0 +1,364 @@
+# analytics.py
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import logging
+import argparse
+from datetime import date
+from pathlib import Path
+
+from .index_store import IndexStore, DB_FILE
+from .schema import SCHEMA_VERSION, normalize_many
+from .metrics import metrics, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Export analytique colonnaire (Parquet / Arrow) des documents et de leurs lignes
+# ----------------------
+# Deux jeux de données partitionnés par mois (year_month=YYYY-MM, format hive) :
+#   documents/ : une ligne par document (montants, dates, vendeur, acheteur...)
+#   items/     : une ligne par ligne de facture (avec date, vendeur, devise du document)
+#
+# Exemple :
+#   python -m backend.services.analytics --report
+
+EXPORT_DIR = "./data/analytics"
+MANIFEST_NAME = "manifest.json"
+DATASETS = ("documents", "items")
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# 🔹 Documents lus et écrits par lot (borne la mémoire d'un export complet)
+DEFAULT_BATCH_SIZE = 50_000
+
+UNKNOWN_PARTITION = "unknown"
+AMOUNT_COLUMNS = ("subtotal", "tax", "total", "amount_paid")
+
+
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError as e:
+        raise ImportError("❌ L'export analytique nécessite pyarrow (pip install pyarrow)") from e
+    return pa, pc
+
+
+def _schemas(pa) -> dict:
+    amounts = [pa.field(name, pa.float64()) for name in AMOUNT_COLUMNS]
+    return {
+        "documents": pa.schema([
+            pa.field("file_name", pa.string()),
+            pa.field("file_hash", pa.string()),
+            pa.field("document_type", pa.string()),
+            pa.field("num_pages", pa.int32()),
+            pa.field("invoice_number", pa.string()),
+            pa.field("date", pa.date32()),
+            pa.field("due_date", pa.date32()),
+            pa.field("currency", pa.string()),
+            pa.field("seller", pa.string()),
+            pa.field("buyer", pa.string()),
+            *amounts,
+            pa.field("item_count", pa.int32()),
+            pa.field("valid", pa.bool_()),
+        ]),
+        "items": pa.schema([
+            pa.field("file_name", pa.string()),
+            pa.field("line", pa.int32()),
+            pa.field("date", pa.date32()),
+            pa.field("currency", pa.string()),
+            pa.field("seller", pa.string()),
+            pa.field("buyer", pa.string()),
+            pa.field("description", pa.string()),
+            pa.field("quantity", pa.float64()),
+            pa.field("unit_price", pa.float64()),
+            pa.field("amount", pa.float64()),
+        ]),
+    }
+
+
+def _records(entries: list[dict]) -> list[dict]:
+    """
+    Forme typée de chaque entrée : bloc "normalized" s'il est à jour,
+    sinon normalisation groupée (anciens fichiers structurés)
+    """
+    records = [None] * len(entries)
+    missing = []
+    for i, entry in enumerate(entries):
+        structured = entry.get("structured_json")
+        record = structured.get("normalized") if isinstance(structured, dict) else None
+        if isinstance(record, dict) and record.get("schema_version") == SCHEMA_VERSION:
+            records[i] = record
+        else:
+            missing.append(i)
+    invoices = normalize_many([entries[i].get("structured_json") or {} for i in missing])
+    for i, invoice in zip(missing, invoices):
+        records[i] = invoice.to_record()
+    return records
+
+
+def _iso_date(value: str | None) -> date | None:
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def partition_of(record: dict) -> str:
+    """
+    Partition d'un document : mois de sa date (YYYY-MM), "unknown" sans date
+    """
+    return record["date"][:7] if record.get("date") else UNKNOWN_PARTITION
+
+
+def build_columns(entries: list[dict]) -> tuple[dict, dict, list[str]]:
+    """
+    Colonnes (listes Python) des deux jeux de données + partition de chaque document
+    """
+    docs = {name: [] for name in ("file_name", "file_hash", "document_type", "num_pages", "invoice_number",
+                                  "date", "due_date", "currency", "seller", "buyer", *AMOUNT_COLUMNS,
+                                  "item_count", "valid")}
+    items = {name: [] for name in ("file_name", "line", "date", "currency", "seller", "buyer",
+                                   "description", "quantity", "unit_price", "amount", "year_month")}
+    partitions = []
+    for entry, record in zip(entries, _records(entries)):
+        day = _iso_date(record.get("date"))
+        partition = partition_of(record)
+        partitions.append(partition)
+        docs["file_name"].append(entry["file_name"])
+        docs["file_hash"].append(entry.get("file_hash"))
+        docs["document_type"].append(entry.get("document_type"))
+        docs["num_pages"].append(entry.get("num_pages") if isinstance(entry.get("num_pages"), int) else None)
+        docs["invoice_number"].append(record.get("invoice_number"))
+        docs["date"].append(day)
+        docs["due_date"].append(_iso_date(record.get("due_date")))
+        for name in ("currency", "seller", "buyer", *AMOUNT_COLUMNS):
+            docs[name].append(record.get(name))
+        docs["item_count"].append(len(record.get("items") or []))
+        docs["valid"].append(not record.get("errors"))
+        for line, item in enumerate(record.get("items") or [], 1):
+            items["file_name"].append(entry["file_name"])
+            items["line"].append(line)
+            items["date"].append(day)
+            items["currency"].append(record.get("currency"))
+            items["seller"].append(record.get("seller"))
+            items["buyer"].append(record.get("buyer"))
+            for name in ("description", "quantity", "unit_price", "amount"):
+                items[name].append(item.get(name))
+            items["year_month"].append(partition)
+    return docs, items, partitions
+
+
+def _write_table(table, path: Path, fmt: str) -> None:
+    """
+    Écriture atomique (fichier temporaire puis rename)
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, tmp_path, compression="zstd")
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def _read_table(path: Path, fmt: str):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(path)
+    import pyarrow.feather as feather
+    return feather.read_table(path)
+
+
+def _part_path(export_dir: str, dataset: str, partition: str, part: str, fmt: str) -> Path:
+    return Path(export_dir) / dataset / f"year_month={partition}" / f"{part}{FORMATS[fmt]}"
+
+
+def _load_manifest(export_dir: str) -> dict:
+    try:
+        with open(Path(export_dir) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_manifest(export_dir: str, manifest: dict) -> None:
+    path = Path(export_dir) / MANIFEST_NAME
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _remove_orphans(export_dir: str, manifest: dict) -> int:
+    """
+    Supprime les fichiers absents du manifeste (export interrompu avant la
+    mise à jour du manifeste) : ils seraient sinon comptés deux fois
+    """
+    known = {(doc["partition"], doc["part"]) for doc in manifest["documents"].values()}
+    removed = 0
+    for dataset in DATASETS:
+        for path in (Path(export_dir) / dataset).glob("year_month=*/*"):
+            partition = path.parent.name.split("=", 1)[1]
+            if path.name.startswith(".") or (partition, path.stem) not in known:
+                path.unlink()
+                removed += 1
+    return removed
+
+
+def _drop_documents(export_dir: str, manifest: dict, file_names: set[str], fmt: str) -> None:
+    """
+    Réécrit les fichiers qui contiennent des documents modifiés ou supprimés
+    (chaque fichier touché n'est réécrit qu'une fois)
+    """
+    pa, pc = _arrow()
+    parts = {}
+    for name in file_names:
+        doc = manifest["documents"].pop(name, None)
+        if doc:
+            parts.setdefault((doc["partition"], doc["part"]), set()).add(name)
+    for (partition, part), names in parts.items():
+        for dataset in DATASETS:
+            path = _part_path(export_dir, dataset, partition, part, fmt)
+            if not path.exists():
+                continue
+            table = _read_table(path, fmt)
+            table = table.filter(pc.invert(pc.is_in(table["file_name"], value_set=pa.array(sorted(names)))))
+            if table.num_rows:
+                _write_table(table, path, fmt)
+            else:
+                path.unlink()
+
+
+def _write_batch(export_dir: str, entries: list[dict], part: str, fmt: str, manifest: dict) -> tuple[int, int]:
+    pa, pc = _arrow()
+    schemas = _schemas(pa)
+    docs, items, partitions = build_columns(entries)
+    docs_table = pa.table({**docs, "year_month": partitions}, schema=schemas["documents"].append(
+        pa.field("year_month", pa.string())))
+    items_table = pa.table(items, schema=schemas["items"].append(pa.field("year_month", pa.string())))
+
+    for dataset, table in (("documents", docs_table), ("items", items_table)):
+        for partition in sorted(set(table["year_month"].to_pylist())):
+            subset = table.filter(pc.equal(table["year_month"], partition)).drop_columns(["year_month"])
+            _write_table(subset, _part_path(export_dir, dataset, partition, part, fmt), fmt)
+    for name, partition in zip(docs["file_name"], partitions):
+        manifest["documents"][name] = {"partition": partition, "part": part}
+    return docs_table.num_rows, items_table.num_rows
+
+
+def export_analytics(store: IndexStore | None = None, export_dir: str = EXPORT_DIR, fmt: str = "parquet",
+                     full_rebuild: bool = False, batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    """
+    Exporte les documents de l'index (et leurs lignes) en jeux de données
+    partitionnés. Incrémental : seuls les documents ajoutés ou modifiés
+    depuis le dernier export sont écrits (nouveaux fichiers part-*), les
+    documents modifiés ou supprimés sont retirés des anciens fichiers.
+
+    fmt : "parquet" ou "arrow" (IPC / Feather v2). Changer de format
+    reconstruit l'export.
+
+    Le repère incrémental est le numéro de modification attribué par la base
+    (seq) : un document écrit par un autre processus pendant l'export a un
+    numéro plus grand et part au suivant. Les documents sont lus par lots de
+    batch_size et le manifeste est enregistré après chaque lot.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"❌ Format inconnu : {fmt} (parmi {', '.join(FORMATS)})")
+    _arrow()
+    store = store or IndexStore(DB_FILE)
+    start = time.perf_counter()
+
+    manifest = _load_manifest(export_dir)
+    # 🔹 Manifeste sans "seq" : ancien repère horaire, export reconstruit
+    if full_rebuild or manifest.get("format") != fmt or manifest.get("schema_version") != SCHEMA_VERSION \
+            or "seq" not in manifest:
+        for dataset in DATASETS:
+            shutil.rmtree(Path(export_dir) / dataset, ignore_errors=True)
+        manifest = {"format": fmt, "schema_version": SCHEMA_VERSION, "seq": 0, "documents": {}}
+    Path(export_dir).mkdir(parents=True, exist_ok=True)
+    orphans = _remove_orphans(export_dir, manifest)
+
+    batch_size = max(1, batch_size)
+    with metrics.timer("analytics_export") as obs:
+        deleted = set(manifest["documents"]) - store.file_names()
+        _drop_documents(export_dir, manifest, deleted, fmt)
+        _save_manifest(export_dir, manifest)
+
+        run = f"part-{int(time.time() * 1000):x}-{uuid.uuid4().hex[:6]}"
+        documents = items = replaced = 0
+        batch_index = 0
+        while changed := store.entries_since(manifest["seq"], limit=batch_size):
+            batch = [entry for _, entry in changed]
+            names = {entry["file_name"] for entry in batch if entry["file_name"] in manifest["documents"]}
+            _drop_documents(export_dir, manifest, names, fmt)
+            n_docs, n_items = _write_batch(export_dir, batch, f"{run}-{batch_index:04d}", fmt, manifest)
+            documents += n_docs
+            items += n_items
+            replaced += len(names)
+            batch_index += 1
+            manifest["seq"] = changed[-1][0]
+            _save_manifest(export_dir, manifest)
+        obs["documents"] = documents
+
+    summary = {
+        "documents_written": documents,
+        "items_written": items,
+        "documents_removed": len(deleted),
+        "documents_replaced": replaced,
+        "orphans_removed": orphans,
+        "documents_total": len(manifest["documents"]),
+        "elapsed_seconds": time.perf_counter() - start,
+    }
+    logger.info("📊 Export analytique (%s) : %d document(s), %d ligne(s) écrits, %d supprimé(s) en %.1fs",
+                fmt, documents, items, len(deleted), summary["elapsed_seconds"])
+    return summary
+
+
+def open_dataset(name: str = "items", export_dir: str = EXPORT_DIR):
+    """
+    Jeu de données exporté (pyarrow.dataset), partition year_month incluse :
+    open_dataset("items").to_table(filter=ds.field("year_month") >= "2024-01")
+    """
+    _arrow()
+    import pyarrow.dataset as ds
+    fmt = _load_manifest(export_dir).get("format", "parquet")
+    return ds.dataset(Path(export_dir) / name, format="ipc" if fmt == "arrow" else "parquet",
+                      partitioning="hive")
+
+
+def totals_by_seller_month(export_dir: str = EXPORT_DIR):
+    """
+    Somme des lignes par vendeur, mois et devise (pyarrow.Table)
+    """
+    table = open_dataset("items", export_dir).to_table(
+        columns=["seller", "year_month", "currency", "amount"]
+    )
+    return table.group_by(["seller", "year_month", "currency"]).aggregate(
+        [("amount", "sum"), ("amount", "count")]
+    ).sort_by([("year_month", "ascending"), ("amount_sum", "descending")])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Export Parquet / Arrow des documents structurés")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--output", default=EXPORT_DIR)
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--full-rebuild", action="store_true")
+    parser.add_argument("--report", action="store_true", help="affiche les totaux par vendeur et par mois")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    export_analytics(IndexStore(args.db), args.output, args.format, full_rebuild=args.full_rebuild)
+    if args.report:
+        print(totals_by_seller_month(args.output).to_pandas().to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+# api.py
+import os
+import re
+import sys
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+import argparse
+import threading
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from .ocr_engine import run_ocr
+from .exporter import structure_ocr
+from .index_store import IndexStore, DocumentFilter, DB_FILE, DEFAULT_PAGE_SIZE, document_entry
+from .job_queue import JobQueue, QUEUE_FILE, PENDING, STRUCTURED, FAILED, DEFAULT_MAX_ATTEMPTS
+from .dedup import DedupIndex, DEDUP_FILE
+from .cache import hash_file
+from .metrics import metrics, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Service HTTP d'ingestion (FastAPI) : uploads en flux, jobs persistants, recherche
+# ----------------------
+# Lancement :
+#   python -m backend.services.api --port 8000
+#   uvicorn backend.services.api:create_app --factory --port 8000
+
+UPLOAD_DIR = "./data/uploads"
+OUTPUT_FOLDER = "./data/samples"
+SUPPORTED_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg")
+
+# 🔹 Lot de la file persistante (job_queue) utilisé par l'API
+API_BATCH = "api"
+
+# 🔹 Uploads : écrits sur disque par morceaux, taille maximale par fichier
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("OCR_API_MAX_UPLOAD_BYTES", str(200 * 1024 ** 2)))
+MAX_BULK_FILES = 100
+
+# 🔹 Workers de traitement (threads) et intervalle de suivi des jobs en SSE
+DEFAULT_API_WORKERS = int(os.getenv("OCR_API_WORKERS", "4"))
+IDLE_POLL_SECONDS = 1.0
+SSE_POLL_SECONDS = 0.5
+MAX_PAGE_SIZE = 200
+
+_UNSAFE_CHARS = re.compile(r"[^\w.\-]+")
+_SHA256_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def _safe_name(filename: str | None) -> str:
+    name = _UNSAFE_CHARS.sub("_", Path(filename or "document").name).strip("._")
+    return name or "document"
+
+
+def job_view(job: dict) -> dict:
+    """
+    État public d'un job (sans les champs internes de réservation)
+    """
+    done = job["state"] in (STRUCTURED, FAILED)
+    return {
+        "job_id": job["id"],
+        "file_name": Path(job["file_path"]).name,
+        "state": job["state"],
+        "done": done,
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "next_attempt_at": job["next_attempt_at"] if not done and job["attempts"] else None,
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+def index_entry(file_path: str, ocr_json_path: str, structured_json_path: str, structured_json: dict) -> dict:
+    # Nom stocké : "<sha256>_<nom d'origine>" (fichiers reçus avant : préfixe de 16 caractères, hash relu)
+    prefix = Path(file_path).name.split("_", 1)[0]
+    file_hash = prefix if _SHA256_RE.fullmatch(prefix) else hash_file(file_path)
+    return document_entry(file_path, ocr_json_path, structured_json_path, structured_json, file_hash=file_hash)
+
+
+class JobRunner:
+    """
+    Threads qui traitent les jobs du lot API : OCR -> structuration -> index.
+    Chaque transition est enregistrée dans la file (reprise après redémarrage).
+    """
+
+    def __init__(self, queue: JobQueue, store: IndexStore, output_folder: str = OUTPUT_FOLDER,
+                 workers: int = DEFAULT_API_WORKERS, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 dedup: DedupIndex | None = None):
+        self.queue = queue
+        self.store = store
+        self.dedup = dedup
+        self.output_folder = output_folder
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+
+    def start(self) -> None:
+        recovered = self.queue.recover(API_BATCH)
+        if recovered:
+            logger.info("♻️ %d job(s) API repris après redémarrage", recovered)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"ocr-api-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            job = self.queue.claim(API_BATCH)
+            if job is None:
+                self._wake.wait(IDLE_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            self.run_job(job)
+
+    def _duplicate(self, job: dict):
+        """
+        Doublon d'un document déjà traité (avant l'OCR, puis avant la structuration)
+        """
+        if self.dedup is None:
+            return None
+        if job["state"] == PENDING:
+            duplicate = self.dedup.check_file(job["file_path"])
+            if duplicate is not None:
+                return duplicate
+            self.queue.mark_ocr_done(job, run_ocr(job["file_path"], output_folder=self.output_folder))
+        return self.dedup.check_ocr(job["file_path"], job["ocr_json_path"])
+
+    def run_job(self, job: dict) -> None:
+        try:
+            duplicate = self._duplicate(job)
+            if duplicate is not None:
+                # Résultat du document d'origine (pas d'entrée d'index en double)
+                self.queue.mark_ocr_done(job, duplicate.ocr_json_path)
+                self.queue.mark_structured(job, duplicate.structured_json_path)
+                logger.info("♻️ Job %d : doublon de %s", job["id"], duplicate.file_name)
+                return
+            if job["state"] == PENDING:
+                ocr_json_path = run_ocr(job["file_path"], output_folder=self.output_folder)
+                self.queue.mark_ocr_done(job, ocr_json_path)
+            structured_json_path, structured_json = structure_ocr(job["ocr_json_path"],
+                                                                  output_folder=self.output_folder)
+            self.store.upsert(index_entry(job["file_path"], job["ocr_json_path"], structured_json_path,
+                                          structured_json))
+            if self.dedup is not None:
+                self.dedup.record_result(job["file_path"], job["ocr_json_path"], structured_json_path)
+            self.queue.mark_structured(job, structured_json_path)
+            logger.info("✅ Job %d : %s", job["id"], Path(job["file_path"]).name)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if self.queue.mark_failed(job, error, self.max_attempts):
+                logger.warning("⚠️ Job %d : %s (nouvel essai prévu)", job["id"], error)
+            else:
+                logger.error("❌ Job %d : %s", job["id"], error)
+
+
+def create_app(upload_dir: str = UPLOAD_DIR, output_folder: str = OUTPUT_FOLDER, queue_file: str = QUEUE_FILE,
+               db_file: str = DB_FILE, workers: int = DEFAULT_API_WORKERS,
+               max_upload_bytes: int = MAX_UPLOAD_BYTES, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+               dedup_file: str | None = None):
+    """
+    Application FastAPI (fabrique : aucun fichier créé ni thread lancé avant le démarrage)
+
+    dedup_file : index des empreintes (dedup.DedupIndex) ; les renvois et
+    rescans d'un document déjà traité reprennent son résultat. None = désactivé.
+
+    - POST /jobs, /jobs/bulk (multipart) et /jobs/stream?filename= (corps brut) : 202 + job(s)
+    - GET /jobs/{id}, /jobs/{id}/events (SSE), /jobs/{id}/result ; POST /jobs/{id}/retry
+    - GET /search, /search/facets : index (plein texte, plages, facettes, pagination)
+    - GET /health, /metrics
+    """
+    try:
+        from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
+        from fastapi.responses import PlainTextResponse, StreamingResponse
+    except ImportError as e:
+        raise ImportError("❌ Le service HTTP nécessite fastapi et python-multipart "
+                          "(pip install fastapi python-multipart uvicorn)") from e
+
+    state = {}
+
+    @asynccontextmanager
+    async def lifespan(app):
+        Path(upload_dir).mkdir(parents=True, exist_ok=True)
+        state["queue"] = JobQueue(queue_file)
+        state["store"] = IndexStore(db_file)
+        dedup = DedupIndex(dedup_file) if dedup_file else None
+        state["runner"] = JobRunner(state["queue"], state["store"], output_folder, workers, max_attempts, dedup)
+        state["runner"].start()
+        try:
+            yield
+        finally:
+            state["runner"].stop()
+
+    app = FastAPI(title="OCR & Structuration", lifespan=lifespan)
+
+    async def save_stream(chunks, filename: str | None) -> Path:
+        """
+        Écrit le flux par morceaux dans un fichier temporaire en calculant son
+        sha256, puis le renomme "<sha256>_<nom>" (contenu identique = même job)
+        """
+        suffix = Path(filename or "").suffix.lower()
+        if suffix not in SUPPORTED_EXTENSIONS:
+            raise HTTPException(415, f"Extension non supportée : {suffix or '(aucune)'}")
+        tmp_path = Path(upload_dir) / f".upload-{uuid.uuid4().hex}{suffix}"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with metrics.timer("api_upload", file=_safe_name(filename)) as obs:
+                with open(tmp_path, "wb") as out:
+                    async for chunk in chunks:
+                        size += len(chunk)
+                        if size > max_upload_bytes:
+                            raise HTTPException(413, f"Fichier trop volumineux (max {max_upload_bytes} octets)")
+                        digest.update(chunk)
+                        await asyncio.to_thread(out.write, chunk)
+                obs["bytes"] = size
+            final_path = Path(upload_dir) / f"{digest.hexdigest()}_{_safe_name(filename)}"
+            if final_path.exists():
+                tmp_path.unlink()
+            else:
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return final_path
+
+    async def upload_chunks(upload: UploadFile):
+        while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+            yield chunk
+
+    def submit(path: Path) -> dict:
+        queue = state["queue"]
+        queue.enqueue(API_BATCH, [str(path)])
+        state["runner"].notify()
+        return job_view(queue.find(API_BATCH, str(path)))
+
+    def get_job(job_id: int) -> dict:
+        job = state["queue"].get(job_id)
+        if job is None or job["batch"] != API_BATCH:
+            raise HTTPException(404, f"Job inconnu : {job_id}")
+        return job
+
+    # ----------------------
+    # Jobs
+    # ----------------------
+    @app.post("/jobs", status_code=202)
+    async def create_job(file: UploadFile = File(...)):
+        path = await save_stream(upload_chunks(file), file.filename)
+        return await asyncio.to_thread(submit, path)
+
+    @app.post("/jobs/stream", status_code=202)
+    async def create_job_from_stream(request: Request, filename: str):
+        # Corps de la requête = contenu du fichier (pas de multipart : aucune copie intermédiaire)
+        path = await save_stream(request.stream(), filename)
+        return await asyncio.to_thread(submit, path)
+
+    @app.post("/jobs/bulk", status_code=202)
+    async def create_jobs(files: list[UploadFile] = File(...)):
+        if len(files) > MAX_BULK_FILES:
+            raise HTTPException(413, f"Trop de fichiers (max {MAX_BULK_FILES} par requête)")
+        jobs, rejected = [], []
+        for upload in files:
+            try:
+                path = await save_stream(upload_chunks(upload), upload.filename)
+            except HTTPException as e:
+                rejected.append({"file_name": upload.filename, "status_code": e.status_code, "error": e.detail})
+                continue
+            jobs.append(await asyncio.to_thread(submit, path))
+        return {"jobs": jobs, "rejected": rejected}
+
+    @app.get("/jobs/{job_id}")
+    async def read_job(job_id: int):
+        return job_view(await asyncio.to_thread(get_job, job_id))
+
+    @app.get("/jobs/{job_id}/events")
+    async def job_events(job_id: int, request: Request):
+        await asyncio.to_thread(get_job, job_id)
+
+        async def events():
+            last = None
+            while True:
+                view = job_view(await asyncio.to_thread(get_job, job_id))
+                if view != last:
+                    yield f"event: status\ndata: {json.dumps(view, ensure_ascii=False)}\n\n"
+                    last = view
+                if view["done"] or await request.is_disconnected():
+                    return
+                await asyncio.sleep(SSE_POLL_SECONDS)
+
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.get("/jobs/{job_id}/result")
+    async def job_result(job_id: int):
+        job = await asyncio.to_thread(get_job, job_id)
+        if job["state"] != STRUCTURED:
+            raise HTTPException(409, f"Job {job_id} pas encore structuré (état : {job['state']})")
+        with open(job["structured_json_path"], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @app.post("/jobs/{job_id}/retry", status_code=202)
+    async def retry_job(job_id: int):
+        await asyncio.to_thread(get_job, job_id)
+        if not await asyncio.to_thread(state["queue"].retry_job, job_id):
+            raise HTTPException(409, f"Job {job_id} n'est pas en échec")
+        state["runner"].notify()
+        return job_view(await asyncio.to_thread(get_job, job_id))
+
+    # ----------------------
+    # Recherche
+    # ----------------------
+    def build_filter(q, date_from, date_to, month, total_min, total_max, document_type, seller, buyer,
+                     currency) -> DocumentFilter:
+        return DocumentFilter(text=q, date_from=date_from, date_to=date_to, month=month, total_min=total_min,
+                              total_max=total_max, document_type=document_type or None, seller=seller or None,
+                              buyer=buyer or None, currency=currency or None)
+
+    @app.get("/search")
+    async def search(q: str | None = None, date_from: str | None = None, date_to: str | None = None,
+                     month: str | None = None, total_min: float | None = None, total_max: float | None = None,
+                     document_type: list[str] = Query([]), seller: list[str] = Query([]),
+                     buyer: list[str] = Query([]), currency: list[str] = Query([]),
+                     page: int = Query(1, ge=1), page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                     sort: str | None = None, include_text: bool = False):
+        filters = build_filter(q, date_from, date_to, month, total_min, total_max, document_type, seller, buyer,
+                               currency)
+        try:
+            result = await asyncio.to_thread(state["store"].query, filters, page, page_size, sort)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        if not include_text:
+            for entry in result["results"]:
+                entry.pop("full_text", None)
+        return result
+
+    @app.get("/search/facets")
+    async def search_facets(q: str | None = None, date_from: str | None = None, date_to: str | None = None,
+                            month: str | None = None, total_min: float | None = None,
+                            total_max: float | None = None, document_type: list[str] = Query([]),
+                            seller: list[str] = Query([]), buyer: list[str] = Query([]),
+                            currency: list[str] = Query([])):
+        filters = build_filter(q, date_from, date_to, month, total_min, total_max, document_type, seller, buyer,
+                               currency)
+        facets = await asyncio.to_thread(state["store"].facets, filters)
+        ranges = await asyncio.to_thread(state["store"].ranges, filters)
+        return {
+            "facets": {name: [{"value": v, "count": n} for v, n in values] for name, values in facets.items()},
+            "ranges": ranges,
+        }
+
+    # ----------------------
+    # Supervision
+    # ----------------------
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "jobs": await asyncio.to_thread(state["queue"].stats, API_BATCH)}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def prometheus_metrics():
+        return metrics.to_prometheus()
+
+    return app
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Service HTTP d'ingestion OCR")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=DEFAULT_API_WORKERS, help="threads de traitement")
+    parser.add_argument("--dedup", action="store_true", help=f"détection des doublons ({DEDUP_FILE})")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    configure_logging()
+    uvicorn.run(create_app(workers=args.workers, dedup_file=DEDUP_FILE if args.dedup else None),
+                host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
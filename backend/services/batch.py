@@ -0,0 +1,438 @@
+# batch.py
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+
+from .blob_store import extract_images
+from .cache import ocr_cache, hash_file
+from .ocr_engine import ocr_model, get_mime_type, ocr_request, ocr_cache_lookup, pages_to_ocr, save_ocr_result
+from .exporter import model as llm_model, RESPONSE_FORMAT, load_prompt, structure_cache_lookup, \
+    parse_structured_text, normalize_structured, save_structured
+from .text_layer import TEXT_LAYER_ENABLED, text_layer_pages, merge_pages
+from .index_store import IndexStore, DB_FILE, document_entry
+from .mistral_client import get_client, call_with_retry
+from .metrics import metrics, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Mode batch (traitements de nuit) : API batch au lieu d'appels interactifs
+# ----------------------
+# Exemple :
+#   python -m backend.services.batch ./data/inbox --output ./data/samples --poll 60
+#
+# 1. OCR : une requête /v1/ocr par fichier, regroupées en fichiers JSONL (jobs batch)
+# 2. Structuration : une requête /v1/chat/completions par résultat OCR
+# 3. Résultats redistribués dans *_ocr_result.json / *_structured.json et l'index
+
+OCR_ENDPOINT = "/v1/ocr"
+CHAT_ENDPOINT = "/v1/chat/completions"
+
+# 🔹 Jobs soumis et pas encore récupérés (relancer le lot reprend leur suivi)
+STATE_FILE_NAME = "batch_state.json"
+
+# 🔹 Taille d'un job : nombre de requêtes et taille du JSONL (les data URLs OCR sont lourdes)
+MAX_BATCH_REQUESTS = int(os.getenv("OCR_BATCH_MAX_REQUESTS", "1000"))
+MAX_BATCH_BYTES = int(os.getenv("OCR_BATCH_MAX_BYTES", str(100 * 1024 ** 2)))
+
+# 🔹 Suivi des jobs
+DEFAULT_POLL_SECONDS = float(os.getenv("OCR_BATCH_POLL_SECONDS", "30"))
+BATCH_TIMEOUT_HOURS = 24
+TERMINAL_STATUSES = {"SUCCESS", "FAILED", "TIMEOUT_EXCEEDED", "CANCELLED"}
+
+
+class BatchState:
+    """
+    Jobs batch en cours, enregistrés dans un fichier JSON (écriture atomique) :
+    {job_id: {"phase": "ocr" | "structure", "requests": {custom_id: {...}}}}
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.jobs = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.jobs = json.load(f).get("jobs", {})
+
+    def save(self) -> None:
+        if not self.jobs:
+            self.path.unlink(missing_ok=True)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"jobs": self.jobs}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def add(self, job_id: str, phase: str, requests: dict) -> None:
+        self.jobs[job_id] = {"phase": phase, "requests": requests, "submitted_at": time.time()}
+        self.save()
+
+    def remove(self, job_id: str) -> None:
+        self.jobs.pop(job_id, None)
+        self.save()
+
+    def job_ids(self, phase: str) -> list[str]:
+        return [job_id for job_id, job in self.jobs.items() if job["phase"] == phase]
+
+    def in_flight(self, phase: str) -> set[str]:
+        """
+        Fichiers sources déjà soumis dans un job de cette phase
+        """
+        return {r["file"] for job_id in self.job_ids(phase) for r in self.jobs[job_id]["requests"].values()}
+
+
+def _up_to_date(output_path: Path, source_path: str) -> bool:
+    try:
+        return output_path.stat().st_mtime >= Path(source_path).stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _ocr_output(file_path: str, output_folder: str) -> Path:
+    return Path(output_folder) / f"{Path(file_path).stem}_ocr_result.json"
+
+
+def _structured_output(ocr_json_path: str, output_folder: str) -> Path:
+    return Path(output_folder) / f"{Path(ocr_json_path).stem}_structured.json"
+
+
+def _pack(lines):
+    """
+    Regroupe les lignes JSONL en jobs (MAX_BATCH_REQUESTS requêtes, MAX_BATCH_BYTES octets).
+    Générateur : chaque job est produit dès qu'il est plein, les lignes
+    suivantes ne sont construites qu'ensuite.
+    """
+    current, size = [], 0
+    for line, meta in lines:
+        if current and size + len(line) > MAX_BATCH_BYTES:
+            yield current
+            current, size = [], 0
+        current.append((line, meta))
+        size += len(line)
+        if len(current) >= MAX_BATCH_REQUESTS:
+            yield current
+            current, size = [], 0
+    if current:
+        yield current
+
+
+def _too_large(size: int) -> str:
+    return (f"requête de {size / 1024 ** 2:.1f} Mo au-delà de la taille d'un job batch "
+            f"({MAX_BATCH_BYTES / 1024 ** 2:.1f} Mo, OCR_BATCH_MAX_BYTES) : à traiter en mode interactif")
+
+
+def _lines(requests, rejected: dict):
+    """
+    Lignes JSONL (octets) construites une à une ; les requêtes plus grosses
+    qu'un job sont écartées dans rejected ({fichier: erreur})
+    """
+    for cid, build_body, meta in requests:
+        line = (json.dumps({"custom_id": cid, "body": build_body()}, ensure_ascii=False) + "\n").encode("utf-8")
+        if len(line) > MAX_BATCH_BYTES:
+            rejected[meta["file"]] = _too_large(len(line))
+            continue
+        yield line, meta
+
+
+def _submit(state: BatchState, phase: str, endpoint: str, model: str, requests) -> tuple[list[str], dict]:
+    """
+    Envoie les requêtes (custom_id, build_body, meta) en jobs batch, un job à
+    la fois : le corps d'une requête n'est construit qu'au moment de l'ajouter
+    au job courant, et le job est libéré une fois envoyé.
+
+    Retourne (identifiants des jobs, {fichier: erreur} des requêtes refusées).
+    """
+    client = get_client()
+    job_ids, rejected = [], {}
+    for chunk in _pack(_lines(requests, rejected)):
+        content = b"".join(line for line, _ in chunk)
+        with metrics.timer("upload", file=f"{phase}.jsonl", bytes=len(content)):
+            uploaded = call_with_retry(client.files.upload, file={"file_name": f"{phase}_{int(time.time())}.jsonl",
+                                                                  "content": content}, purpose="batch")
+        job = call_with_retry(client.batch.jobs.create, input_files=[uploaded.id], endpoint=endpoint, model=model,
+                              metadata={"phase": phase}, timeout_hours=BATCH_TIMEOUT_HOURS)
+        state.add(job.id, phase, {meta["custom_id"]: meta for _, meta in chunk})
+        job_ids.append(job.id)
+        logger.info("📦 Job batch %s (%s) : %d requête(s), %.1f Mo", job.id, phase, len(chunk),
+                    len(content) / 1024 ** 2)
+        # 🔹 Job envoyé : libéré avant de construire les lignes du suivant
+        del chunk, content
+    for file_path, error in rejected.items():
+        logger.error("❌ %s : %s", Path(file_path).name, error)
+    return job_ids, rejected
+
+
+def wait_for_jobs(job_ids: list[str], poll_seconds: float = DEFAULT_POLL_SECONDS,
+                  timeout_seconds: float | None = None) -> dict:
+    """
+    Interroge les jobs jusqu'à un état final ; retourne {job_id: job} des jobs
+    terminés (ceux encore en cours au délai dépassé restent dans l'état)
+    """
+    client = get_client()
+    pending, done = list(job_ids), {}
+    deadline = time.monotonic() + timeout_seconds if timeout_seconds is not None else None
+    start = time.perf_counter()
+    while pending:
+        for job_id in list(pending):
+            job = call_with_retry(client.batch.jobs.get, job_id=job_id)
+            if job.status in TERMINAL_STATUSES:
+                pending.remove(job_id)
+                done[job_id] = job
+                metrics.observe("batch_job", time.perf_counter() - start, job=job_id, status=job.status,
+                                requests=job.total_requests, failed=job.failed_requests,
+                                error=job.status != "SUCCESS")
+                logger.info("%s Job batch %s : %s (%d/%d réussie(s))", "✅" if job.status == "SUCCESS" else "❌",
+                            job_id, job.status, job.succeeded_requests, job.total_requests)
+            else:
+                logger.info("⏳ Job batch %s : %s (%d/%d)", job_id, job.status, job.completed_requests,
+                            job.total_requests)
+        if pending:
+            if deadline is not None and time.monotonic() + poll_seconds > deadline:
+                logger.warning("⚠️ %d job(s) batch toujours en cours : suivi repris au prochain lancement",
+                               len(pending))
+                break
+            time.sleep(poll_seconds)
+    return done
+
+
+def _download_jsonl(file_id: str | None) -> list[dict]:
+    if not file_id:
+        return []
+    response = call_with_retry(get_client().files.download, file_id=file_id)
+    return [json.loads(line) for line in response.read().decode("utf-8").splitlines() if line.strip()]
+
+
+def _results(job) -> tuple[dict, dict]:
+    """
+    Sorties d'un job terminé : ({custom_id: body}, {custom_id: erreur})
+    """
+    bodies, errors = {}, {}
+    for record in _download_jsonl(job.output_file) + _download_jsonl(job.error_file):
+        cid = record.get("custom_id")
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or response.get("body")
+            errors[cid] = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+        else:
+            bodies[cid] = response.get("body") or {}
+    return bodies, errors
+
+
+def _collect(state: BatchState, jobs: dict, handle) -> dict:
+    """
+    Applique handle(meta, body) à chaque résultat ; retourne {fichier source: erreur}
+    """
+    failures = {}
+    for job_id, job in jobs.items():
+        requests = state.jobs[job_id]["requests"]
+        bodies, errors = _results(job) if job.output_file or job.error_file else ({}, {})
+        for cid, meta in requests.items():
+            try:
+                if cid in bodies:
+                    handle(meta, bodies[cid])
+                else:
+                    failures[meta["file"]] = errors.get(cid) or f"pas de résultat (job {job.status})"
+            except Exception as e:
+                failures[meta["file"]] = f"{type(e).__name__}: {e}"
+        state.remove(job_id)
+    return failures
+
+
+# ----------------------
+# Phases
+# ----------------------
+def _ocr_phase(files: list[str], state: BatchState, output_folder: str, use_cache: bool, include_images: bool,
+               text_layer: bool, poll_seconds: float, timeout_seconds: float | None) -> tuple[dict, dict]:
+    """
+    Retourne ({fichier: chemin du JSON OCR}, {fichier: erreur})
+    """
+    ocr_paths, requests, rejected = {}, [], {}
+    in_flight = state.in_flight("ocr")
+    for i, file_path in enumerate(files):
+        output = _ocr_output(file_path, output_folder)
+        if file_path in in_flight:
+            continue
+        if _up_to_date(output, file_path):
+            ocr_paths[file_path] = str(output)
+            continue
+        mime_type = get_mime_type(file_path)
+        cache_key, ocr_dict = ocr_cache_lookup(file_path, use_cache, include_images, None, text_layer)
+        local_pages = text_layer_pages(file_path, mime_type, text_layer) if ocr_dict is None else None
+        remote_pages = pages_to_ocr(local_pages)
+        if ocr_dict is None and remote_pages == []:
+            ocr_dict = merge_pages(local_pages, None)
+            if cache_key:
+                ocr_cache.set(cache_key, ocr_dict)
+        if ocr_dict is not None:
+            ocr_paths[file_path] = save_ocr_result(file_path, ocr_dict, output_folder)
+            continue
+        # 🔹 Taille de la data URL connue sans encoder : fichier trop gros refusé tout de suite
+        encoded_size = 4 * ((os.path.getsize(file_path) + 2) // 3)
+        if encoded_size > MAX_BATCH_BYTES:
+            rejected[file_path] = _too_large(encoded_size)
+            continue
+
+        def build_body(file_path=file_path, remote_pages=remote_pages):
+            body = ocr_request(file_path, None, include_images)
+            body.pop("model")
+            if remote_pages:
+                body["pages"] = remote_pages
+            return body
+
+        meta = {"custom_id": str(i), "file": file_path, "cache_key": cache_key, "pages": remote_pages}
+        requests.append((meta["custom_id"], build_body, meta))
+
+    if requests:
+        rejected.update(_submit(state, "ocr", OCR_ENDPOINT, ocr_model, requests)[1])
+
+    def handle(meta: dict, body: dict) -> None:
+        ocr_dict = body
+        extract_images(ocr_dict)
+        if meta["pages"]:
+            local = text_layer_pages(meta["file"], get_mime_type(meta["file"]), True)
+            ocr_dict = merge_pages(local, ocr_dict)
+        if meta["cache_key"]:
+            ocr_cache.set(meta["cache_key"], ocr_dict)
+        ocr_paths[meta["file"]] = save_ocr_result(meta["file"], ocr_dict, output_folder)
+
+    jobs = wait_for_jobs(state.job_ids("ocr"), poll_seconds, timeout_seconds)
+    failures = _collect(state, jobs, handle)
+    return ocr_paths, {**rejected, **failures}
+
+
+def _structure_phase(ocr_paths: dict, state: BatchState, output_folder: str, use_cache: bool,
+                     poll_seconds: float, timeout_seconds: float | None) -> tuple[dict, dict]:
+    """
+    Retourne ({fichier: (chemin du JSON structuré, JSON)}, {fichier: erreur})
+    """
+    structured, requests, rejected = {}, [], {}
+    in_flight = state.in_flight("structure")
+    for i, (file_path, ocr_json_path) in enumerate(ocr_paths.items()):
+        output = _structured_output(ocr_json_path, output_folder)
+        if file_path in in_flight:
+            continue
+        if _up_to_date(output, ocr_json_path):
+            with open(output, "r", encoding="utf-8") as f:
+                structured[file_path] = (str(output), json.load(f))
+            continue
+        prompt = load_prompt(ocr_json_path)
+        cache_key, structured_json = structure_cache_lookup(prompt, use_cache, ocr_json_path)
+        if structured_json is not None:
+            structured_json = normalize_structured(structured_json, Path(ocr_json_path).name)
+            structured[file_path] = (save_structured(ocr_json_path, structured_json, output_folder), structured_json)
+            continue
+        body = {"messages": [{"role": "user", "content": prompt}], "response_format": RESPONSE_FORMAT}
+        meta = {"custom_id": str(i), "file": file_path, "ocr_json_path": ocr_json_path, "cache_key": cache_key}
+        requests.append((meta["custom_id"], lambda body=body: body, meta))
+
+    if requests:
+        rejected.update(_submit(state, "structure", CHAT_ENDPOINT, llm_model, requests)[1])
+
+    def handle(meta: dict, body: dict) -> None:
+        choice = body["choices"][0]
+        usage = body.get("usage") or {}
+        metrics.observe("llm_batch", 0.0, file=Path(meta["ocr_json_path"]).name,
+                        prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+        structured_json = parse_structured_text(choice["message"].get("content") or "", meta["cache_key"],
+                                                choice.get("finish_reason"))
+        structured_json = normalize_structured(structured_json, Path(meta["ocr_json_path"]).name)
+        path = save_structured(meta["ocr_json_path"], structured_json, output_folder)
+        structured[meta["file"]] = (path, structured_json)
+
+    jobs = wait_for_jobs(state.job_ids("structure"), poll_seconds, timeout_seconds)
+    failures = _collect(state, jobs, handle)
+    return structured, {**rejected, **failures}
+
+
+def run_batch(files: list[str], output_folder: str = "./data/samples", db_file: str = DB_FILE,
+              state_file: str | None = None, poll_seconds: float = DEFAULT_POLL_SECONDS,
+              timeout_seconds: float | None = None, use_cache: bool = True, include_images: bool = True,
+              text_layer: bool = TEXT_LAYER_ENABLED) -> dict:
+    """
+    Traitement d'un lot via l'API batch (latence élevée, coût et débit meilleurs).
+
+    - les résultats déjà à jour, en cache ou lisibles localement (couche
+      texte) ne sont pas soumis
+    - state_file (défaut : <output_folder>/batch_state.json) garde les jobs
+      soumis : après un arrêt ou un délai dépassé (timeout_seconds), relancer
+      le même lot reprend leur suivi au lieu de les soumettre à nouveau
+    - seule la première page est structurée (comme structure_ocr par défaut)
+
+    Retourne un dictionnaire avec les résultats par fichier et un résumé.
+    """
+    files = [str(f) for f in files]
+    state = BatchState(state_file or str(Path(output_folder) / STATE_FILE_NAME))
+    start = time.perf_counter()
+    logger.info("🔹 Lot batch de %d fichier(s)", len(files))
+
+    ocr_paths, ocr_failures = _ocr_phase(files, state, output_folder, use_cache, include_images, text_layer,
+                                         poll_seconds, timeout_seconds)
+    structured, structure_failures = _structure_phase(ocr_paths, state, output_folder, use_cache, poll_seconds,
+                                                      timeout_seconds)
+
+    # 🔹 Index : une transaction pour tout le lot
+    entries = [
+        document_entry(file_path, ocr_paths[file_path], path, structured_json, file_hash=hash_file(file_path))
+        for file_path, (path, structured_json) in structured.items()
+    ]
+    if entries:
+        with metrics.timer("index_update", documents=len(entries)):
+            IndexStore(db_file).upsert_many(entries)
+
+    failures = {**ocr_failures, **structure_failures}
+    pending = state.in_flight("ocr") | state.in_flight("structure")
+    results = []
+    for file_path in files:
+        if file_path in structured:
+            status, error = "ok", None
+        elif file_path in failures:
+            status, error = "failed", failures[file_path]
+        else:
+            status, error = "pending", None
+        results.append({
+            "file": file_path,
+            "status": status,
+            "ocr_json_path": ocr_paths.get(file_path),
+            "structured_json_path": structured[file_path][0] if file_path in structured else None,
+            "error": error,
+        })
+    elapsed = time.perf_counter() - start
+    summary = {
+        "total": len(files),
+        "succeeded": len(structured),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "pending": sum(1 for r in results if r["status"] == "pending"),
+        "pending_jobs": len(state.jobs),
+        "elapsed_seconds": elapsed,
+    }
+    logger.info("📊 Lot batch terminé : %d/%d réussi(s), %d échec(s), %d en attente (%d fichier(s) dans un job "
+                "en cours) en %.1fs", summary["succeeded"], summary["total"], summary["failed"], summary["pending"],
+                len(pending), elapsed)
+    return {"results": results, "summary": summary}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Traitement d'un dossier via l'API batch (nuit)")
+    parser.add_argument("folder", help="dossier des PDF / images")
+    parser.add_argument("--output", default="./data/samples")
+    parser.add_argument("--db", default=DB_FILE, help="index SQLite")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS, help="intervalle de suivi (s)")
+    parser.add_argument("--timeout", type=float, default=None, help="durée max d'attente (s), reprise ensuite")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    files = sorted(str(f) for f in Path(args.folder).iterdir()
+                   if f.suffix.lower() in (".pdf", ".png", ".jpg", ".jpeg"))
+    batch = run_batch(files, output_folder=args.output, db_file=args.db, poll_seconds=args.poll,
+                      timeout_seconds=args.timeout)
+    print(json.dumps(batch["summary"], indent=2))
+    return 0 if batch["summary"]["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# blob_store.py
+import os
+import json
+import base64
+import hashlib
+import threading
+import mimetypes
+from pathlib import Path
+
+# 🔹 Dossier des images extraites (adressées par contenu)
+BLOB_DIR = os.getenv("OCR_BLOB_DIR", "./data/blobs")
+
+
+def _blob_path(blob_id: str, blob_dir: str = BLOB_DIR) -> Path:
+    return Path(blob_dir) / blob_id[:2] / blob_id
+
+
+def save_blob(data: bytes, extension: str = "bin", blob_dir: str = BLOB_DIR) -> str:
+    """
+    Sauvegarde des octets et retourne leur identifiant "<sha256>.<ext>".
+    Un contenu identique n'est écrit qu'une seule fois.
+    """
+    blob_id = f"{hashlib.sha256(data).hexdigest()}.{extension.lstrip('.') or 'bin'}"
+    path = _blob_path(blob_id, blob_dir)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 🔹 Fichier temporaire propre à chaque écrivain (processus + thread)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            # Même contenu déjà écrit par un autre écrivain : succès
+            if not path.exists():
+                raise
+    return blob_id
+
+
+def load_blob(blob_id: str, blob_dir: str = BLOB_DIR) -> bytes:
+    return _blob_path(blob_id, blob_dir).read_bytes()
+
+
+def blob_path(blob_id: str, blob_dir: str = BLOB_DIR) -> str:
+    return str(_blob_path(blob_id, blob_dir))
+
+
+def decode_data_uri(value: str) -> tuple[bytes, str | None]:
+    """
+    "data:image/jpeg;base64,...." -> (octets, "image/jpeg")
+    Accepte aussi du base64 brut (mime inconnu).
+    """
+    mime_type = None
+    if value.startswith("data:") and "," in value:
+        header, value = value.split(",", 1)
+        mime_type = header[5:].split(";", 1)[0] or None
+    return base64.b64decode(value), mime_type
+
+
+def load_image_data_uri(blob_id: str, blob_dir: str = BLOB_DIR) -> str:
+    """
+    Reconstruit la data URI d'une image (ex. pour l'afficher dans l'app)
+    """
+    mime_type = mimetypes.guess_type(blob_id)[0] or "application/octet-stream"
+    data = base64.b64encode(load_blob(blob_id, blob_dir)).decode("ascii")
+    return f"data:{mime_type};base64,{data}"
+
+
+def extract_images(ocr_dict: dict, blob_dir: str = BLOB_DIR) -> int:
+    """
+    Déplace les images base64 des pages OCR vers le blob store.
+
+    Chaque pages[].images[].image_base64 est remplacé par image_blob_id ;
+    le JSON OCR ne contient plus que le texte et les métadonnées.
+    Retourne le nombre d'images extraites.
+    """
+    extracted = 0
+    for page in ocr_dict.get("pages", []):
+        for image in page.get("images") or []:
+            encoded = image.pop("image_base64", None)
+            if not encoded:
+                continue
+            data, mime_type = decode_data_uri(encoded)
+            extension = (mimetypes.guess_extension(mime_type) if mime_type else None) \
+                or Path(image.get("id") or "").suffix or "bin"
+            image["image_blob_id"] = save_blob(data, extension.lstrip("."), blob_dir)
+            extracted += 1
+    return extracted
+
+
+def strip_ocr_file(ocr_json_path: str, blob_dir: str = BLOB_DIR) -> int:
+    """
+    Applique extract_images à un *_ocr_result.json existant (ancien format)
+    et le réécrit sans les images base64
+    """
+    with open(ocr_json_path, "r", encoding="utf-8") as f:
+        ocr_dict = json.load(f)
+    extracted = extract_images(ocr_dict, blob_dir)
+    if extracted:
+        tmp_path = f"{ocr_json_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(ocr_dict, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, ocr_json_path)
+    return extracted
@@ -0,0 +1,162 @@
+# cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+# 🔹 Dossier du cache persistant (surcharge possible via OCR_CACHE_DIR)
+CACHE_DIR = os.getenv("OCR_CACHE_DIR", "./data/cache")
+
+# 🔹 Politique d'éviction par défaut : 30 jours / 2 Go
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# 🔹 Fréquence de l'éviction automatique (toutes les N écritures)
+EVICT_EVERY = 100
+
+# 🔹 Taille des blocs lus pour hacher un fichier sans le charger en entier
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def cache_disabled() -> bool:
+    """
+    Le cache peut être désactivé globalement avec OCR_CACHE_DISABLED=1
+    """
+    return os.getenv("OCR_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+
+def hash_file(file_path: str) -> str:
+    """
+    SHA-256 du contenu d'un fichier, lu par blocs
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(content_hash: str, model: str, prompt_version: str) -> str:
+    """
+    Clé de cache = hash du contenu + modèle + version du prompt
+    """
+    raw = f"{content_hash}|{model}|{prompt_version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache disque adressé par contenu pour les résultats JSON (OCR, LLM).
+
+    Chaque entrée est un fichier <namespace>/<2 premiers caractères>/<clé>.json.
+    L'éviction supprime les entrées plus vieilles que max_age_seconds, puis
+    les moins récemment utilisées tant que le total dépasse max_bytes.
+    """
+
+    def __init__(self, namespace: str, cache_dir: str = CACHE_DIR,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(cache_dir) / namespace
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        """
+        Retourne la valeur en cache ou None (entrée absente ou expirée)
+        """
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if self.max_age_seconds and time.time() - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # 🔹 Rafraîchir l'atime pour l'éviction LRU (le mtime sert à l'expiration)
+        try:
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value) -> None:
+        """
+        Écrit la valeur de façon atomique (fichier temporaire + rename)
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % EVICT_EVERY == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Applique la politique d'éviction, retourne le nombre d'entrées supprimées
+        """
+        if not self.root.exists():
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for path in self.root.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if self.max_age_seconds and now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes and total > self.max_bytes:
+            # 🔹 Supprimer d'abord les entrées les moins récemment lues
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+        return removed
+
+    def clear(self) -> None:
+        for path in self.root.glob("*/*.json"):
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# 🔹 Caches partagés par les services
+ocr_cache = ResultCache("ocr")
+structure_cache = ResultCache("structure")
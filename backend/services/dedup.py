@@ -0,0 +1,458 @@
+# dedup.py
+import os
+import re
+import json
+import time
+import hashlib
+import itertools
+import logging
+import sqlite3
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from .cache import hash_file
+from .metrics import metrics
+from .text_layer import _pymupdf, extract_text_layer
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Détection des doublons avant OCR / structuration
+# ----------------------
+# Trois empreintes par document, comparées aux documents déjà traités :
+# - sha256 du fichier (renvoi à l'identique)
+# - dHash de la première page (même scan recompressé, re-exporté, redimensionné)
+# - SimHash du full_text OCR (rescan)
+# Les correspondances dHash et SimHash sont confirmées par les nombres du texte :
+# deux factures d'un même modèle ont le même rendu mais pas les mêmes montants.
+
+DEDUP_FILE = "./data/dedup.db"
+
+# 🔹 dHash : grille DHASH_SIZE x (DHASH_SIZE + 1) en niveaux de gris -> DHASH_SIZE² bits
+DHASH_SIZE = 16
+DHASH_BITS = DHASH_SIZE * DHASH_SIZE
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 2
+
+# 🔹 Bandes LSH avec sondage multiple : deux empreintes à d bits d'écart ont au
+#    moins une bande à moins de d // bandes bits d'écart. On interroge l'index avec
+#    toutes les variantes de chaque bande dans ce rayon (simhash au seuil 0.75 :
+#    16 bits d'écart, 4 bandes de 16 bits, rayon 4, ~10 000 clés).
+#    Au-delà de MAX_PROBES clés (seuil très bas) : parcours complet des références.
+BANDS = {"dhash": 16, "simhash": 4}
+HASH_BITS = {"dhash": DHASH_BITS, "simhash": SIMHASH_BITS}
+MAX_PROBES = 20_000
+# 🔹 Version du schéma (PRAGMA user_version) : les bandes sont recalculées quand elle change
+SCHEMA_VERSION = 2
+
+_TOKEN_RE = re.compile(r"\w+")
+_NUMBER_RE = re.compile(r"\d(?:[.,/-]?\d)*")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    file_path TEXT PRIMARY KEY,
+    file_name TEXT,
+    sha256 TEXT,
+    dhash TEXT,
+    simhash TEXT,
+    numbers TEXT,
+    ocr_json_path TEXT,
+    structured_json_path TEXT,
+    duplicate_of TEXT,
+    match_kind TEXT,
+    similarity REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_fingerprints_sha ON fingerprints(sha256);
+CREATE INDEX IF NOT EXISTS idx_fingerprints_duplicate ON fingerprints(duplicate_of);
+CREATE TABLE IF NOT EXISTS bands (
+    kind TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    file_path TEXT NOT NULL,
+    PRIMARY KEY (kind, key, file_path)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class DedupConfig:
+    """
+    Seuils de similarité (0..1, 1 = identique)
+
+    - image_threshold : dHash de la première page. Deux factures d'un même
+      modèle se ressemblent beaucoup à basse résolution : le dHash ne fait que
+      proposer des candidats, confirmés par les nombres (couche texte du PDF
+      avant l'OCR, full_text après)
+    - text_threshold : SimHash du full_text. Filtre large : sur un texte
+      court (une facture), quelques mots mal lus font varier le SimHash
+    - numbers_threshold : Jaccard des nombres du texte (montants, dates,
+      numéro de facture) exigé en plus du dHash / SimHash : c'est lui qui
+      distingue deux factures d'un même fournisseur
+    """
+    image_threshold: float = float(os.getenv("OCR_DEDUP_IMAGE_THRESHOLD", "0.97"))
+    text_threshold: float = float(os.getenv("OCR_DEDUP_TEXT_THRESHOLD", "0.75"))
+    numbers_threshold: float = float(os.getenv("OCR_DEDUP_NUMBERS_THRESHOLD", "0.8"))
+
+
+@dataclass
+class Duplicate:
+    """
+    Document déjà traité auquel un nouveau fichier est rattaché
+    """
+    file_name: str
+    kind: str
+    similarity: float
+    ocr_json_path: str | None
+    structured_json_path: str | None
+    file_path: str | None = None
+
+    def load_structured(self) -> dict:
+        with open(self.structured_json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+# ----------------------
+# Empreintes
+# ----------------------
+def hamming_similarity(a: int, b: int, bits: int) -> float:
+    return 1.0 - (a ^ b).bit_count() / bits
+
+
+def _downsample(samples: bytes, width: int, height: int, stride: int, out_w: int, out_h: int) -> list[list[float]]:
+    """
+    Réduction par moyenne de blocs d'une image en niveaux de gris (1 octet/pixel)
+    """
+    grid = []
+    for r in range(out_h):
+        y0 = r * height // out_h
+        y1 = max(y0 + 1, (r + 1) * height // out_h)
+        row = []
+        for c in range(out_w):
+            x0 = c * width // out_w
+            x1 = max(x0 + 1, (c + 1) * width // out_w)
+            total = sum(sum(samples[y * stride + x0:y * stride + x1]) for y in range(y0, y1))
+            row.append(total / ((y1 - y0) * (x1 - x0)))
+        grid.append(row)
+    return grid
+
+
+def _gray_grid(file_path: str) -> list[list[float]]:
+    out_w, out_h = DHASH_SIZE + 1, DHASH_SIZE
+    if Path(file_path).suffix.lower() == ".pdf":
+        pymupdf = _pymupdf()
+        with pymupdf.open(file_path) as doc:
+            page = doc[0]
+            # ~8 pixels par case : rendu rapide, assez fin pour une moyenne stable
+            zoom = 8 * out_w / max(1.0, page.rect.width)
+            pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), colorspace=pymupdf.csGRAY, alpha=False)
+            return _downsample(pix.samples, pix.width, pix.height, pix.stride, out_w, out_h)
+    try:
+        from PIL import Image, ImageOps
+    except ImportError as e:
+        raise ImportError("❌ Le hash perceptuel des images nécessite Pillow (pip install pillow)") from e
+    with Image.open(file_path) as img:
+        gray = ImageOps.exif_transpose(img).convert("L").resize((out_w, out_h), Image.Resampling.BOX)
+        pixels = list(gray.getdata())
+    return [pixels[r * out_w:(r + 1) * out_w] for r in range(out_h)]
+
+
+def dhash(file_path: str) -> int:
+    """
+    Hash perceptuel (différence horizontale) de la première page / de l'image
+    """
+    value = 0
+    for row in _gray_grid(file_path):
+        for left, right in zip(row, row[1:]):
+            value = (value << 1) | int(left < right)
+    return value
+
+
+def _tokens(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN_RE.findall(text)
+
+
+def simhash(text: str) -> int:
+    """
+    SimHash 64 bits des shingles de SHINGLE_SIZE mots (pondérés par leur fréquence)
+    """
+    tokens = _tokens(text)
+    shingles = Counter(" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1)))
+    weights = [0] * SIMHASH_BITS
+    for shingle, count in shingles.items():
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(SIMHASH_BITS):
+            weights[i] += count if (h >> i) & 1 else -count
+    return sum(1 << i for i, w in enumerate(weights) if w > 0)
+
+
+def text_numbers(text: str) -> set[str]:
+    """
+    Nombres du texte, séparateurs retirés ("1 450,00" -> {"1", "45000"})
+    """
+    return {re.sub(r"\D", "", n) for n in _NUMBER_RE.findall(text)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _text_layer_numbers(file_path: str) -> set[str] | None:
+    """
+    Nombres de la couche texte d'un PDF natif (None : image, page scannée ou illisible)
+    """
+    if Path(file_path).suffix.lower() != ".pdf":
+        return None
+    try:
+        pages = extract_text_layer(file_path)
+    except Exception as e:
+        logger.warning("⚠️ Couche texte illisible pour %s : %s", Path(file_path).name, e)
+        return None
+    if not pages or any(page is None for page in pages):
+        return None
+    return text_numbers(" ".join(page["markdown"] for page in pages))
+
+
+def _band_keys(value: int, kind: str) -> list[int]:
+    bands = BANDS[kind]
+    width = HASH_BITS[kind] // bands
+    mask = (1 << width) - 1
+    return [(band << width) | ((value >> (band * width)) & mask) for band in range(bands)]
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(width: int, radius: int) -> tuple[int, ...]:
+    """
+    Masques XOR de 0 à `radius` bits parmi `width`
+    """
+    return tuple(sum(1 << b for b in bits) for r in range(radius + 1)
+                 for bits in itertools.combinations(range(width), r))
+
+
+def _probe_keys(value: int, kind: str, max_distance: int) -> list[int] | None:
+    """
+    Clés de bandes à interroger pour trouver toute empreinte à moins de
+    max_distance bits (None : trop de clés, parcours complet)
+    """
+    width = HASH_BITS[kind] // BANDS[kind]
+    masks = _flip_masks(width, min(width, max_distance // BANDS[kind]))
+    if len(masks) * BANDS[kind] > MAX_PROBES:
+        return None
+    return [key ^ mask for key in _band_keys(value, kind) for mask in masks]
+
+
+def _key(file_path: str) -> str:
+    return os.path.abspath(file_path)
+
+
+def _index_bands(conn: sqlite3.Connection, key: str, row) -> None:
+    conn.execute("DELETE FROM bands WHERE file_path = ?", (key,))
+    for kind in BANDS:
+        if row[kind] is not None:
+            conn.executemany("INSERT OR IGNORE INTO bands (kind, key, file_path) VALUES (?, ?, ?)",
+                             [(kind, band_key, key) for band_key in _band_keys(int(row[kind], 16), kind)])
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """
+    Base créée par une version précédente : lignes indexées par chemin complet
+    (et non plus par nom de fichier), bandes recalculées
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    columns = {r["name"]: r["pk"] for r in conn.execute("PRAGMA table_info(fingerprints)")}
+    if columns.get("file_name"):
+        rows = conn.execute("SELECT * FROM fingerprints").fetchall()
+        conn.executescript("DROP TABLE fingerprints; DROP TABLE IF EXISTS bands;" + SCHEMA)
+        paths = {row["file_name"]: _key(row["file_path"] or row["file_name"]) for row in rows}
+        conn.executemany(
+            f"INSERT INTO fingerprints ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [[paths[row["file_name"]] if c == "file_path" else
+              paths.get(row[c], row[c]) if c == "duplicate_of" else row[c] for c in columns] for row in rows],
+        )
+        logger.info("✅ Doublons : %d empreinte(s) indexée(s) par chemin complet", len(rows))
+    conn.execute("DELETE FROM bands")
+    for row in conn.execute("SELECT file_path, dhash, simhash FROM fingerprints WHERE duplicate_of IS NULL "
+                            "AND structured_json_path IS NOT NULL").fetchall():
+        _index_bands(conn, row["file_path"], row)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+# ----------------------
+# Index des documents traités
+# ----------------------
+class DedupIndex:
+    """
+    Empreintes des documents dans SQLite (mode WAL), une ligne par chemin complet.
+
+    Étapes d'un document :
+    1. check_file avant l'OCR (sha256, ou dHash + nombres de la couche texte)
+    2. check_ocr après l'OCR, avant la structuration ((SimHash ou dHash) + nombres)
+    3. record_result une fois structuré : le document devient une référence
+
+    Seuls les documents structurés et non doublons servent de référence ;
+    un doublon est rattaché (duplicate_of) à leurs fichiers de résultat.
+    """
+
+    def __init__(self, db_path: str = DEDUP_FILE, config: DedupConfig | None = None):
+        self.db_path = str(db_path)
+        self.config = config or DedupConfig()
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            _migrate(conn)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _save(self, conn: sqlite3.Connection, file_path: str, **fields) -> None:
+        fields.update(file_name=Path(file_path).name, updated_at=time.time())
+        columns = ", ".join(["file_path", *fields])
+        updates = ", ".join(f"{c} = excluded.{c}" for c in fields)
+        conn.execute(
+            f"INSERT INTO fingerprints ({columns}) VALUES ({', '.join('?' * (len(fields) + 1))}) "
+            f"ON CONFLICT(file_path) DO UPDATE SET {updates}",
+            [_key(file_path), *fields.values()],
+        )
+
+    def _link(self, conn: sqlite3.Connection, file_path: str, duplicate: Duplicate) -> Duplicate:
+        # 🔹 Un doublon ne sert plus de référence
+        self._save(conn, file_path, duplicate_of=duplicate.file_path, match_kind=duplicate.kind,
+                   similarity=duplicate.similarity)
+        conn.execute("DELETE FROM bands WHERE file_path = ?", (_key(file_path),))
+        logger.info("♻️ %s : doublon de %s (%s, similarité %.2f)", Path(file_path).name, duplicate.file_name,
+                    duplicate.kind, duplicate.similarity)
+        return duplicate
+
+    def _candidates(self, conn: sqlite3.Connection, kind: str, value: int, threshold: float,
+                    exclude: str) -> list[sqlite3.Row]:
+        max_distance = max(0, int((1.0 - threshold) * HASH_BITS[kind]))
+        columns = f"f.file_path, f.file_name, f.{kind}, f.numbers, f.ocr_json_path, f.structured_json_path"
+        references = "f.structured_json_path IS NOT NULL AND f.duplicate_of IS NULL AND f.file_path != ?"
+        keys = _probe_keys(value, kind, max_distance)
+        if keys is not None:
+            rows = conn.execute(
+                f"SELECT DISTINCT {columns} FROM bands b JOIN fingerprints f ON f.file_path = b.file_path "
+                f"WHERE b.kind = ? AND b.key IN (SELECT value FROM json_each(?)) AND {references}",
+                (kind, json.dumps(keys), exclude),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT {columns} FROM fingerprints f WHERE f.{kind} IS NOT NULL AND {references}", (exclude,)
+            ).fetchall()
+        return rows
+
+    def _best(self, rows, kind: str, value: int, threshold: float, accept=None) -> Duplicate | None:
+        best = None
+        for row in rows:
+            similarity = hamming_similarity(value, int(row[kind], 16), HASH_BITS[kind])
+            if similarity < threshold or (accept and not accept(row)):
+                continue
+            if best is None or similarity > best.similarity:
+                best = Duplicate(row["file_name"], kind, similarity, row["ocr_json_path"],
+                                 row["structured_json_path"], row["file_path"])
+        return best
+
+    def _numbers_match(self, numbers: set[str]):
+        return lambda row: jaccard(numbers, set((row["numbers"] or "").split())) >= self.config.numbers_threshold
+
+    def check_file(self, file_path: str) -> Duplicate | None:
+        """
+        Avant l'OCR : même contenu (sha256) qu'un document déjà structuré, ou
+        même rendu (dHash) confirmé par les nombres de la couche texte. Sans
+        couche texte (image, scan), la confirmation attend check_ocr.
+        """
+        name, key = Path(file_path).name, _key(file_path)
+        with metrics.timer("dedup", file=name, step="file") as obs:
+            sha256 = hash_file(file_path)
+            try:
+                image_hash = dhash(file_path)
+            except Exception as e:
+                logger.warning("⚠️ Hash perceptuel impossible pour %s : %s", name, e)
+                image_hash = None
+            with self._connect() as conn:
+                self._save(conn, file_path, sha256=sha256, dhash=f"{image_hash:x}" if image_hash is not None else None,
+                           duplicate_of=None, match_kind=None, similarity=None)
+                row = conn.execute(
+                    "SELECT * FROM fingerprints WHERE sha256 = ? AND file_path != ? AND duplicate_of IS NULL "
+                    "AND structured_json_path IS NOT NULL LIMIT 1", (sha256, key)
+                ).fetchone()
+                duplicate = None
+                if row is not None:
+                    duplicate = Duplicate(row["file_name"], "sha256", 1.0, row["ocr_json_path"],
+                                          row["structured_json_path"], row["file_path"])
+                elif image_hash is not None:
+                    rows = self._candidates(conn, "dhash", image_hash, self.config.image_threshold, key)
+                    numbers = _text_layer_numbers(file_path) if rows else None
+                    if numbers is not None:
+                        duplicate = self._best(rows, "dhash", image_hash, self.config.image_threshold,
+                                               accept=self._numbers_match(numbers))
+                obs["match"] = duplicate.kind if duplicate else "none"
+                return self._link(conn, file_path, duplicate) if duplicate else None
+
+    def check_ocr(self, file_path: str, ocr_json_path: str) -> Duplicate | None:
+        """
+        Après l'OCR : texte quasi identique (SimHash) ou même rendu (dHash), et
+        mêmes nombres qu'un document déjà structuré
+        """
+        name, key = Path(file_path).name, _key(file_path)
+        with open(ocr_json_path, "r", encoding="utf-8") as f:
+            full_text = json.load(f).get("full_text") or ""
+        with metrics.timer("dedup", file=name, step="text") as obs:
+            value = simhash(full_text)
+            numbers = text_numbers(full_text)
+            with self._connect() as conn:
+                self._save(conn, file_path, simhash=f"{value:x}", numbers=" ".join(sorted(numbers)),
+                           ocr_json_path=str(ocr_json_path), duplicate_of=None, match_kind=None, similarity=None)
+                duplicate = None
+                if full_text.strip():
+                    accept = self._numbers_match(numbers)
+                    rows = self._candidates(conn, "simhash", value, self.config.text_threshold, key)
+                    duplicate = self._best(rows, "simhash", value, self.config.text_threshold, accept=accept)
+                    row = conn.execute("SELECT dhash FROM fingerprints WHERE file_path = ?", (key,)).fetchone()
+                    if duplicate is None and row is not None and row["dhash"] is not None:
+                        image_hash = int(row["dhash"], 16)
+                        rows = self._candidates(conn, "dhash", image_hash, self.config.image_threshold, key)
+                        duplicate = self._best(rows, "dhash", image_hash, self.config.image_threshold, accept=accept)
+                obs["match"] = duplicate.kind if duplicate else "none"
+                return self._link(conn, file_path, duplicate) if duplicate else None
+
+    def record_result(self, file_path: str, ocr_json_path: str, structured_json_path: str) -> None:
+        """
+        Document structuré (non doublon) : indexé comme référence pour les suivants
+        """
+        key = _key(file_path)
+        with self._connect() as conn:
+            self._save(conn, file_path, ocr_json_path=str(ocr_json_path),
+                       structured_json_path=str(structured_json_path), duplicate_of=None, match_kind=None,
+                       similarity=None)
+            row = conn.execute("SELECT dhash, simhash FROM fingerprints WHERE file_path = ?", (key,)).fetchone()
+            _index_bands(conn, key, row)
+
+    def duplicates_of(self, file_path: str) -> list[dict]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT file_name, file_path, match_kind, similarity FROM fingerprints "
+                                "WHERE duplicate_of = ? ORDER BY updated_at", (_key(file_path),)).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT COALESCE(match_kind, 'original') AS kind, COUNT(*) AS n "
+                                "FROM fingerprints GROUP BY kind").fetchall()
+        return {row["kind"]: row["n"] for row in rows}
@@ -1,40 +1,53 @@
 # llm_structuration.py
-import os
 import json
-import re
+import time
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import streamlit as st
-
-from mistralai import Mistral
-from dotenv import load_dotenv
-
-# 🔹 Charger la clé API
-load_dotenv(dotenv_path="./env")
-
-# Puis récupérer la clé soit dans env, soit dans secrets
-api_key = (
-    os.getenv("MISTRAL_API_KEY")
-    or st.secrets.get("MISTRAL_API_KEY")
-)
-if not api_key:
-    raise ValueError("❌ MISTRAL_API_KEY introuvable")
-client = Mistral(api_key=api_key)
+
+from .cache import structure_cache, cache_disabled, make_cache_key
+from .mistral_client import get_client, call_with_retry, call_with_retry_async
+from .metrics import metrics
+from .json_extract import find_json_object
+from .schema import attach_normalized
+
+logger = logging.getLogger(__name__)
+
 model = "mistral-large-latest"
 
-# 🔹 Fonction pour extraire un JSON du texte
-def extract_json(text: str) -> str | None:
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    return match.group(0) if match else None
+# 🔹 À incrémenter à chaque modification du prompt (invalide le cache)
+PROMPT_VERSION = "invoice-v2"
 
-# 🔹 Fonction principale pour structurer le JSON OCR
-def structure_ocr(ocr_json_path: str, output_folder: str = "./data/samples") -> tuple[str, dict]:
-    with open(ocr_json_path, "r", encoding="utf-8") as f:
-        ocr_data = json.load(f)
+# 🔹 Mode JSON de l'API : la réponse est un objet JSON (moins de réponses inexploitables)
+RESPONSE_FORMAT = {"type": "json_object"}
 
-    markdown = ocr_data.get("pages", [{}])[0].get("markdown", "")
+# 🔹 Mode multi-pages : taille max d'un morceau (tokens estimés) et parallélisme
+DEFAULT_MAX_CHUNK_TOKENS = 6000
+DEFAULT_CHUNK_WORKERS = 4
+
+# 🔹 Tokens de réponse réservés d'avance sur le budget tokens/min (corrigé avec l'usage réel)
+COMPLETION_TOKENS_ESTIMATE = 1000
+
+# 🔹 Fusion : ces champs sont pris sur la dernière partie qui les contient
+TOTAL_FIELDS = ("subtotal", "tax", "total", "amount_paid")
+
+# 🔹 Fonction pour extraire un JSON du texte (premier objet valide, voir json_extract)
+def extract_json(text: str) -> str | None:
+    _, source, _ = find_json_object(text)
+    return source
 
-    prompt = f"""
-Voici le texte OCR d'une facture au format Markdown.
+# 🔹 Prompt de structuration d'une facture
+def build_prompt(markdown: str, part: tuple[int, int] | None = None) -> str:
+    intro = "Voici le texte OCR d'une facture au format Markdown."
+    if part is not None:
+        intro = (
+            f"Voici la partie {part[0]}/{part[1]} du texte OCR d'une facture multi-pages au format Markdown.\n"
+            "N'extrais que les informations présentes dans cette partie (les autres champs à null ou [])."
+        )
+    return f"""
+{intro}
 Analyse-le et retourne un JSON strictement valide avec les champs :
 - invoice_number
 - date
@@ -57,25 +70,300 @@ Texte OCR :
 {markdown}
 """
 
-    response = client.chat.complete(
-        model=model,
-        messages=[{"role": "user", "content": prompt}]
-    )
+def load_prompt(ocr_json_path: str) -> str:
+    with open(ocr_json_path, "r", encoding="utf-8") as f:
+        ocr_data = json.load(f)
+
+    markdown = ocr_data.get("pages", [{}])[0].get("markdown", "")
+    return build_prompt(markdown)
+
+def structure_cache_lookup(prompt: str, use_cache: bool, ocr_json_path: str) -> tuple[str | None, dict | None]:
+    """
+    Cache : même prompt + même modèle => même résultat
+    """
+    if not use_cache or cache_disabled():
+        return None, None
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    cache_key = make_cache_key(prompt_hash, model, PROMPT_VERSION)
+    structured_json = structure_cache.get(cache_key)
+    if structured_json is not None:
+        logger.info("♻️ Structuration trouvée dans le cache pour : %s", ocr_json_path)
+    return cache_key, structured_json
+
+def _parse_response(response, cache_key: str | None) -> dict:
+    choice = response.choices[0]
+    return parse_structured_text(choice.message.content or "", cache_key, getattr(choice, "finish_reason", None))
 
-    structured_text = response.choices[0].message.content
-    json_candidate = extract_json(structured_text)
+def parse_structured_text(structured_text: str, cache_key: str | None = None, finish_reason: str | None = None) -> dict:
+    """
+    Texte de réponse du modèle -> JSON structuré (appel direct ou résultat d'un job batch)
+    """
+    with metrics.timer("json_extract", bytes=len(structured_text.encode("utf-8"))) as obs:
+        structured_json, _, repaired = find_json_object(structured_text)
+        obs["valid"] = structured_json is not None
+        obs["repaired"] = repaired
 
-    try:
-        structured_json = json.loads(json_candidate or structured_text)
-    except json.JSONDecodeError:
-        print("⚠️ Réponse non valide JSON, sauvegarde brute...")
-        structured_json = {"raw_output": structured_text}
+    if structured_json is None:
+        # 🔹 Les réponses invalides ne sont pas mises en cache
+        logger.warning("⚠️ Réponse non valide JSON, sauvegarde brute...")
+        return {"raw_output": structured_text}
+    if repaired:
+        # 🔹 JSON réparé (ex. réponse tronquée) : gardé et marqué (normalized.errors), mais pas mis en cache
+        logger.warning("⚠️ JSON réparé (finish_reason=%s)", finish_reason)
+        return {**structured_json, "_repaired": finish_reason or "unknown"}
+    if cache_key:
+        structure_cache.set(cache_key, structured_json)
+    return structured_json
 
-    import pathlib
-    pathlib.Path(output_folder).mkdir(parents=True, exist_ok=True)
+def _record_usage(obs: dict, response) -> None:
+    usage = getattr(response, "usage", None)
+    obs["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+    obs["completion_tokens"] = getattr(usage, "completion_tokens", None)
+
+def _complete(prompt: str, timeout_ms: int | None, label: str):
+    """
+    Appel LLM (avec retries sur 429 / 5xx), durée et tokens mesurés
+    """
+    with metrics.timer("llm_call", file=label, bytes=len(prompt.encode("utf-8"))) as obs:
+        response = call_with_retry(
+            get_client().chat.complete,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            response_format=RESPONSE_FORMAT,
+            timeout_ms=timeout_ms,
+            estimated_tokens=estimate_tokens(prompt) + COMPLETION_TOKENS_ESTIMATE,
+        )
+        _record_usage(obs, response)
+    return response
+
+async def _complete_async(prompt: str, timeout_ms: int | None, label: str):
+    with metrics.timer("llm_call", file=label, bytes=len(prompt.encode("utf-8"))) as obs:
+        response = await call_with_retry_async(
+            get_client().chat.complete_async,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            response_format=RESPONSE_FORMAT,
+            timeout_ms=timeout_ms,
+            estimated_tokens=estimate_tokens(prompt) + COMPLETION_TOKENS_ESTIMATE,
+        )
+        _record_usage(obs, response)
+    return response
+
+def normalize_structured(structured_json: dict, label: str) -> dict:
+    """
+    Ajoute la forme typée (montants, dates ISO, devise) au résultat ; le cache
+    garde la sortie brute du modèle, la normalisation est refaite à chaque fois
+    """
+    structured_json = attach_normalized(structured_json)
+    errors = structured_json["normalized"]["errors"]
+    if errors:
+        logger.warning("⚠️ %s : %s", label, " ; ".join(errors))
+    return structured_json
+
+def save_structured(ocr_json_path: str, structured_json: dict, output_folder: str) -> str:
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
     output_path = Path(output_folder) / f"{Path(ocr_json_path).stem}_structured.json"
-    with open(output_path, "w", encoding="utf-8") as out_file:
-        json.dump(structured_json, out_file, ensure_ascii=False, indent=4)
+    with metrics.timer("json_dump", file=output_path.name) as obs:
+        with open(output_path, "w", encoding="utf-8") as out_file:
+            json.dump(structured_json, out_file, ensure_ascii=False, indent=4)
+        obs["bytes"] = output_path.stat().st_size
+
+    logger.info("✅ JSON structuré sauvegardé dans : %s", output_path)
+    return str(output_path)
+
+# 🔹 Fonction principale pour structurer le JSON OCR
+def structure_ocr(ocr_json_path: str, output_folder: str = "./data/samples", use_cache: bool = True,
+                  timeout_ms: int | None = None, multi_page: bool = False) -> tuple[str, dict]:
+    """
+    Par défaut seule la première page est structurée ; avec multi_page=True
+    toutes les pages le sont (voir structure_ocr_multipage).
+    """
+    if multi_page:
+        output_path, structured_json, _ = structure_ocr_multipage(
+            ocr_json_path, output_folder, use_cache=use_cache, timeout_ms=timeout_ms
+        )
+        return output_path, structured_json
+
+    prompt = load_prompt(ocr_json_path)
+    cache_key, structured_json = structure_cache_lookup(prompt, use_cache, ocr_json_path)
+
+    if structured_json is None:
+        # 🔹 Appel LLM (avec retries sur 429 / 5xx)
+        response = _complete(prompt, timeout_ms, Path(ocr_json_path).name)
+        structured_json = _parse_response(response, cache_key)
+
+    structured_json = normalize_structured(structured_json, Path(ocr_json_path).name)
+    return save_structured(ocr_json_path, structured_json, output_folder), structured_json
+
+# 🔹 Version async (FastAPI, batchs) : ne bloque pas la boucle d'événements
+async def structure_ocr_async(ocr_json_path: str, output_folder: str = "./data/samples", use_cache: bool = True,
+                              timeout_ms: int | None = None) -> tuple[str, dict]:
+    prompt = await asyncio.to_thread(load_prompt, ocr_json_path)
+    cache_key, structured_json = await asyncio.to_thread(structure_cache_lookup, prompt, use_cache, ocr_json_path)
+
+    if structured_json is None:
+        response = await _complete_async(prompt, timeout_ms, Path(ocr_json_path).name)
+        structured_json = await asyncio.to_thread(_parse_response, response, cache_key)
+
+    structured_json = normalize_structured(structured_json, Path(ocr_json_path).name)
+    output_path = await asyncio.to_thread(save_structured, ocr_json_path, structured_json, output_folder)
+    return output_path, structured_json
+
+# ----------------------
+# Mode multi-pages
+# ----------------------
+def estimate_tokens(text: str) -> int:
+    """
+    Estimation grossière (~4 caractères par token), suffisante pour borner les morceaux
+    """
+    return len(text) // 4 + 1
+
+def _split_text(text: str, max_tokens: int) -> list[str]:
+    """
+    Découpe une page trop longue en morceaux de lignes (ou de caractères en dernier recours)
+    """
+    max_chars = max_tokens * 4
+    pieces, current = [], ""
+    for line in text.splitlines(keepends=True):
+        # Couper de préférence entre deux lignes
+        if current and len(current) + len(line) > max_chars and len(line) <= max_chars:
+            pieces.append(current)
+            current = ""
+        # Ligne plus longue qu'un morceau : coupe franche
+        while len(current) + len(line) > max_chars:
+            room = max_chars - len(current)
+            pieces.append(current + line[:room])
+            current = ""
+            line = line[room:]
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def chunk_pages(pages: list[str], max_tokens: int = DEFAULT_MAX_CHUNK_TOKENS) -> list[dict]:
+    """
+    Regroupe les pages (markdown) en morceaux d'au plus max_tokens tokens estimés.
+    Retourne [{"pages": [numéros de page], "markdown": texte}] dans l'ordre.
+    """
+    chunks = []
+    current = {"pages": [], "markdown": ""}
+    for number, markdown in enumerate(pages, 1):
+        block = f"\n\n<!-- Page {number} -->\n\n{markdown}"
+        if estimate_tokens(block) > max_tokens:
+            # Page trop longue : elle est découpée en plusieurs morceaux
+            if current["pages"]:
+                chunks.append(current)
+                current = {"pages": [], "markdown": ""}
+            for piece in _split_text(block, max_tokens):
+                chunks.append({"pages": [number], "markdown": piece})
+            continue
+        if current["pages"] and estimate_tokens(current["markdown"] + block) > max_tokens:
+            chunks.append(current)
+            current = {"pages": [], "markdown": ""}
+        current["pages"].append(number)
+        current["markdown"] += block
+    if current["pages"]:
+        chunks.append(current)
+    return chunks
+
+def merge_structured(parts: list, report: list[dict] | None = None) -> dict:
+    """
+    Fusion déterministe des résultats partiels (dans l'ordre des pages) :
+    - items : concaténés
+    - subtotal / tax / total / amount_paid : dernière partie non vide
+    - autres champs : première partie non vide
+
+    Les parties non structurées (texte brut, JSON qui n'est pas un objet)
+    sont gardées dans raw_output et listées dans chunk_errors ; report (un
+    rapport par partie, même ordre) reçoit leur erreur.
+    """
+    merged = {}
+    items = []
+    raw_outputs = []
+    chunk_errors = []
+    for index, part in enumerate(parts):
+        if isinstance(part, dict) and "raw_output" in part and len(part) == 1:
+            raw_outputs.append(part["raw_output"])
+            error = "réponse JSON invalide (raw_output)"
+        elif not isinstance(part, dict):
+            raw_outputs.append(json.dumps(part, ensure_ascii=False))
+            error = f"réponse non structurée ({type(part).__name__})"
+        else:
+            error = None
+        if error:
+            chunk = report[index] if report else {"chunk": index + 1, "pages": None}
+            chunk["error"] = error
+            chunk_errors.append({"chunk": chunk["chunk"], "pages": chunk["pages"], "error": error})
+            continue
+        for key, value in part.items():
+            if key == "items":
+                if isinstance(value, list):
+                    items.extend(value)
+                continue
+            if value in (None, "", [], {}):
+                merged.setdefault(key, value)
+                continue
+            if key in TOTAL_FIELDS or merged.get(key) in (None, "", [], {}):
+                merged[key] = value
+    merged["items"] = items
+    if raw_outputs:
+        merged["raw_output"] = raw_outputs
+    if chunk_errors:
+        merged["chunk_errors"] = chunk_errors
+    return merged
+
+def _structure_chunk(index: int, chunk: dict, total_chunks: int, use_cache: bool,
+                     timeout_ms: int | None, ocr_json_path: str) -> tuple[dict, dict]:
+    prompt = build_prompt(chunk["markdown"], part=(index, total_chunks))
+    report = {"chunk": index, "pages": chunk["pages"], "cached": False,
+              "latency_seconds": 0.0, "prompt_tokens": None, "completion_tokens": None}
+
+    cache_key, structured_json = structure_cache_lookup(prompt, use_cache, f"{ocr_json_path} (partie {index})")
+    if structured_json is not None:
+        report["cached"] = True
+        return structured_json, report
+
+    start = time.perf_counter()
+    response = _complete(prompt, timeout_ms, f"{Path(ocr_json_path).name}#{index}")
+    report["latency_seconds"] = time.perf_counter() - start
+    usage = getattr(response, "usage", None)
+    report["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+    report["completion_tokens"] = getattr(usage, "completion_tokens", None)
+    return _parse_response(response, cache_key), report
+
+def structure_ocr_multipage(ocr_json_path: str, output_folder: str = "./data/samples",
+                            max_chunk_tokens: int = DEFAULT_MAX_CHUNK_TOKENS,
+                            max_workers: int = DEFAULT_CHUNK_WORKERS, use_cache: bool = True,
+                            timeout_ms: int | None = None) -> tuple[str, dict, list[dict]]:
+    """
+    Structure toutes les pages d'un document OCR :
+    découpage en morceaux bornés en tokens, appels LLM en parallèle,
+    puis fusion déterministe (merge_structured).
+
+    Retourne (chemin du JSON structuré, JSON fusionné, rapport par morceau).
+    Les morceaux en erreur restent aussi visibles dans le JSON sauvegardé
+    (chunk_errors, raw_output et normalized.errors).
+    """
+    with open(ocr_json_path, "r", encoding="utf-8") as f:
+        ocr_data = json.load(f)
+    pages = [page.get("markdown", "") for page in ocr_data.get("pages", [])] or [""]
+    chunks = chunk_pages(pages, max_chunk_tokens)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        futures = [
+            pool.submit(_structure_chunk, i, chunk, len(chunks), use_cache, timeout_ms, ocr_json_path)
+            for i, chunk in enumerate(chunks, 1)
+        ]
+        outcomes = [future.result() for future in futures]
+
+    parts = [structured for structured, _ in outcomes]
+    report = [chunk_report for _, chunk_report in outcomes]
+    for r in report:
+        source = "cache" if r["cached"] else f"{r['latency_seconds']:.1f}s, {r['prompt_tokens']}+{r['completion_tokens']} tokens"
+        logger.info("🔹 Partie %d/%d (pages %d-%d) : %s", r["chunk"], len(chunks), r["pages"][0], r["pages"][-1], source)
 
-    print(f"✅ JSON structuré sauvegardé dans : {output_path}")
-    return str(output_path), structured_json
+    merged = merge_structured(parts, report)
+    for error in merged.get("chunk_errors", []):
+        logger.warning("⚠️ Partie %d (pages %s) : %s", error["chunk"], error["pages"], error["error"])
+    structured_json = normalize_structured(merged, Path(ocr_json_path).name)
+    return save_structured(ocr_json_path, structured_json, output_folder), structured_json, report
@@ -0,0 +1,607 @@
+# index_store.py
+import json
+import time
+import logging
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from .search import parse_query
+from .schema import invoice_of
+
+logger = logging.getLogger(__name__)
+
+# 🔹 Base SQLite de l'index (remplace la réécriture complète de index.json)
+DB_FILE = "./data/index.db"
+INDEX_FILE = "./data/index.json"
+
+# 🔹 Colonnes dédiées ; les autres champs d'une entrée vont dans extra_json
+COLUMNS = [
+    "file_name", "file_hash", "stem", "path_file", "path_ocr", "path_structured",
+    "document_type", "doc_date", "total", "currency", "seller", "buyer", "num_pages", "full_text", "structured_json",
+]
+DERIVED_COLUMNS = {"doc_date", "total", "currency", "seller", "buyer"}
+COLUMN_TYPES = {"total": "REAL", "num_pages": "INTEGER", "seller": "TEXT COLLATE NOCASE",
+                "buyer": "TEXT COLLATE NOCASE"}
+
+# 🔹 Champs proposés en facettes (comptage par valeur) et taille d'une page de résultats
+FACET_FIELDS = ("document_type", "seller", "buyer", "currency")
+DEFAULT_PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    file_name TEXT PRIMARY KEY,
+    file_hash TEXT,
+    stem TEXT,
+    path_file TEXT,
+    path_ocr TEXT,
+    path_structured TEXT,
+    document_type TEXT,
+    doc_date TEXT,
+    total REAL,
+    currency TEXT,
+    seller TEXT COLLATE NOCASE,
+    buyer TEXT COLLATE NOCASE,
+    num_pages INTEGER,
+    full_text TEXT,
+    structured_json TEXT,
+    extra_json TEXT,
+    updated_at REAL,
+    seq INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(file_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(document_type);
+CREATE INDEX IF NOT EXISTS idx_documents_date ON documents(doc_date);
+CREATE INDEX IF NOT EXISTS idx_documents_total ON documents(total);
+CREATE INDEX IF NOT EXISTS idx_documents_updated ON documents(updated_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path_ocr TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    fingerprint TEXT NOT NULL
+);
+"""
+
+# 🔹 Index des colonnes ajoutées après coup (créés une fois les colonnes migrées)
+SECONDARY_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_documents_seq ON documents(seq);
+CREATE INDEX IF NOT EXISTS idx_documents_seller ON documents(seller, doc_date);
+CREATE INDEX IF NOT EXISTS idx_documents_buyer ON documents(buyer, doc_date);
+CREATE INDEX IF NOT EXISTS idx_documents_currency ON documents(currency);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    full_text,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def _derived_values(structured: dict | None) -> dict:
+    """
+    Colonnes typées d'un document, lues dans le bloc "normalized" (schema.py) quand il existe
+    """
+    invoice = invoice_of(structured)
+    if invoice is None:
+        return {col: None for col in DERIVED_COLUMNS}
+    return {
+        "doc_date": invoice.date,
+        "total": float(invoice.total) if invoice.total is not None else None,
+        "currency": invoice.currency,
+        "seller": invoice.seller,
+        "buyer": invoice.buyer,
+    }
+
+
+def _add_missing_columns(conn: sqlite3.Connection) -> None:
+    """
+    Base créée par une version précédente : ajoute les colonnes apparues depuis
+    et recalcule les colonnes dérivées des documents existants
+    """
+    existing = {r["name"] for r in conn.execute("PRAGMA table_info(documents)")}
+    added = [col for col in COLUMNS if col not in existing]
+    for col in added:
+        conn.execute(f"ALTER TABLE documents ADD COLUMN {col} {COLUMN_TYPES.get(col, 'TEXT')}")
+    if DERIVED_COLUMNS & set(added):
+        rows = conn.execute("SELECT rowid, structured_json FROM documents").fetchall()
+        cols = sorted(DERIVED_COLUMNS)
+        conn.executemany(
+            f"UPDATE documents SET {', '.join(f'{c} = ?' for c in cols)} WHERE rowid = ?",
+            [
+                [*(_derived_values(json.loads(r["structured_json"]) if r["structured_json"] else None)[c]
+                   for c in cols), r["rowid"]]
+                for r in rows
+            ],
+        )
+        logger.info("✅ Index : colonnes %s ajoutées (%d document(s) mis à jour)", ", ".join(added), len(rows))
+    if "seq" not in existing:
+        # Numérotation initiale dans l'ordre des mises à jour connues
+        conn.execute("ALTER TABLE documents ADD COLUMN seq INTEGER")
+        rows = conn.execute("SELECT rowid FROM documents ORDER BY updated_at, rowid").fetchall()
+        conn.executemany("UPDATE documents SET seq = ? WHERE rowid = ?", [(i, r[0]) for i, r in enumerate(rows, 1)])
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seq', ?)", (str(len(rows)),))
+
+
+def _next_seq(conn: sqlite3.Connection) -> int:
+    """
+    Numéro de modification suivant, attribué par la base dans la transaction
+    d'écriture : SQLite n'a qu'un écrivain à la fois, les numéros suivent
+    donc l'ordre des commits (contrairement à une heure prise avant le commit)
+    """
+    conn.execute("INSERT INTO meta (key, value) VALUES ('seq', '1') "
+                 "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+    return int(conn.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()[0])
+
+
+def entry_to_row(entry: dict) -> dict:
+    """
+    Entrée d'index (format index.json) -> ligne de la table documents
+    """
+    structured = entry.get("structured_json")
+    structured = structured if isinstance(structured, dict) else None
+    row = {col: entry.get(col) for col in COLUMNS if col not in DERIVED_COLUMNS}
+    row["structured_json"] = json.dumps(structured, ensure_ascii=False) if structured is not None else None
+    row.update(_derived_values(structured))
+    extra = {k: v for k, v in entry.items() if k not in COLUMNS}
+    row["extra_json"] = json.dumps(extra, ensure_ascii=False) if extra else None
+    row["updated_at"] = time.time()
+    return row
+
+
+def document_entry(file_path: str, ocr_json_path: str, structured_json_path: str, structured_json: dict,
+                   file_hash: str | None = None) -> dict:
+    """
+    Entrée d'index d'un document traité (même forme que celles de l'app Streamlit)
+    """
+    with open(ocr_json_path, "r", encoding="utf-8") as f:
+        ocr_data = json.load(f)
+    return {
+        "file_name": Path(file_path).name,
+        "stem": Path(file_path).stem,
+        "file_hash": file_hash,
+        "path_file": str(file_path),
+        "path_ocr": str(ocr_json_path),
+        "path_structured": str(structured_json_path),
+        "full_text": (ocr_data.get("full_text") or "").strip(),
+        "structured_json": structured_json,
+        "num_pages": ocr_data.get("num_pages", ocr_data.get("usage_info", {}).get("pages_processed", 1)),
+        "document_type": ocr_data.get("document_type", "unknown"),
+    }
+
+
+def row_to_entry(row: sqlite3.Row) -> dict:
+    """
+    Ligne SQLite -> entrée d'index (même forme que index.json)
+    """
+    entry = json.loads(row["extra_json"]) if row["extra_json"] else {}
+    for col in COLUMNS:
+        if col in DERIVED_COLUMNS or col == "structured_json":
+            continue
+        if row[col] is not None:
+            entry[col] = row[col]
+    entry["structured_json"] = json.loads(row["structured_json"]) if row["structured_json"] else None
+    # Valeurs typées (lecture seule, recalculées à l'upsert) : pas de ré-analyse côté affichage
+    for col in DERIVED_COLUMNS:
+        entry[col] = row[col]
+    return entry
+
+
+def to_fts_query(query: str) -> str | None:
+    """
+    Traduit la syntaxe de recherche de l'app (ET, OR, "phrase", préfixe*)
+    en expression MATCH FTS5
+    """
+    groups = []
+    for group in parse_query(query):
+        clauses = []
+        for terms in group:
+            if len(terms) == 1 and terms[0].endswith("*"):
+                clauses.append(f'"{terms[0][:-1]}"*')
+            else:
+                clauses.append('"' + " ".join(t.rstrip("*") for t in terms) + '"')
+        groups.append("(" + " AND ".join(clauses) + ")")
+    return " OR ".join(groups) or None
+
+
+# 🔹 Tris proposés par query (NULL toujours en fin de liste)
+SORTS = {
+    "relevance": "bm25(documents_fts)",
+    "recent": "d.updated_at DESC",
+    "date_desc": "d.doc_date IS NULL, d.doc_date DESC",
+    "date_asc": "d.doc_date IS NULL, d.doc_date",
+    "total_desc": "d.total IS NULL, d.total DESC",
+    "total_asc": "d.total IS NULL, d.total",
+}
+
+
+def _values(value) -> list:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+@dataclass
+class DocumentFilter:
+    """
+    Critères combinables de query / facets :
+    - text : recherche plein texte (même syntaxe que search)
+    - date_from / date_to (ISO, bornes incluses) ou month ("2024-03")
+    - total_min / total_max (bornes incluses)
+    - document_type, seller, buyer, currency : valeur ou liste de valeurs
+      (seller / buyer insensibles à la casse)
+    """
+    text: str | None = None
+    date_from: str | None = None
+    date_to: str | None = None
+    month: str | None = None
+    total_min: float | None = None
+    total_max: float | None = None
+    document_type: str | list[str] | None = None
+    seller: str | list[str] | None = None
+    buyer: str | list[str] | None = None
+    currency: str | list[str] | None = None
+
+    def to_sql(self, has_fts: bool, exclude: str | None = None) -> tuple[str, list[str], list]:
+        """
+        (jointure, conditions WHERE, paramètres) ; exclude ignore un champ (facette)
+        """
+        join, where, params = "", [], []
+        fts_query = to_fts_query(self.text) if self.text else None
+        if fts_query and has_fts:
+            join = " JOIN documents_fts ON documents_fts.rowid = d.rowid"
+            where.append("documents_fts MATCH ?")
+            params.append(fts_query)
+        elif fts_query:
+            words = [t.rstrip("*") for group in parse_query(self.text) for c in group for t in c]
+            where += ["d.full_text LIKE ?" for _ in words]
+            params += [f"%{w}%" for w in words]
+
+        date_from, date_to = self.date_from, self.date_to
+        if self.month:
+            # Comparaison de chaînes ISO : "-31" borne tous les mois
+            date_from, date_to = f"{self.month}-01", f"{self.month}-31"
+        for column, op, value in (("doc_date", ">=", date_from), ("doc_date", "<=", date_to),
+                                  ("total", ">=", self.total_min), ("total", "<=", self.total_max)):
+            if value is not None:
+                where.append(f"d.{column} {op} ?")
+                params.append(value)
+
+        for column in FACET_FIELDS:
+            values = _values(getattr(self, column))
+            if column == exclude or not values:
+                continue
+            where.append(f"d.{column} IN ({', '.join('?' for _ in values)})")
+            params += values
+        return join, where, params
+
+
+class IndexStore:
+    """
+    Index des documents dans SQLite (mode WAL) :
+    - upsert par file_name, recherche par hash de fichier
+    - colonnes indexées document_type, doc_date, total, seller, buyer, currency
+      (filtres par plage et facettes, voir query / facets)
+    - table FTS5 sur full_text (si disponible)
+
+    Une connexion est ouverte par opération : l'objet peut être partagé
+    entre sessions / threads Streamlit.
+    """
+
+    def __init__(self, db_path: str = DB_FILE):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            _add_missing_columns(conn)
+            conn.executescript(SECONDARY_INDEXES)
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                # SQLite compilé sans FTS5 : repli sur LIKE
+                self.has_fts = False
+
+    @contextmanager
+    def _connect(self):
+        """
+        Connexion courte : commit en fin de bloc, rollback en cas d'erreur
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ----------------------
+    # Écriture
+    # ----------------------
+    def _upsert(self, conn: sqlite3.Connection, entry: dict) -> None:
+        row = entry_to_row(entry)
+        row["seq"] = _next_seq(conn)
+        cols = list(row)
+        updates = ", ".join(f"{c}=excluded.{c}" for c in cols if c != "file_name")
+        conn.execute(
+            f"INSERT INTO documents ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+            f"ON CONFLICT(file_name) DO UPDATE SET {updates}",
+            [row[c] for c in cols],
+        )
+        if self.has_fts:
+            # La ligne FTS partage le rowid du document (stable lors d'un upsert)
+            rowid = conn.execute("SELECT rowid FROM documents WHERE file_name = ?", (row["file_name"],)).fetchone()[0]
+            conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (rowid,))
+            conn.execute("INSERT INTO documents_fts (rowid, full_text) VALUES (?, ?)", (rowid, row["full_text"] or ""))
+
+    def upsert(self, entry: dict) -> None:
+        """
+        Ajoute ou remplace une entrée (clé : file_name), en une transaction
+        """
+        if not entry.get("file_name"):
+            raise ValueError("❌ Entrée d'index sans file_name")
+        with self._connect() as conn:
+            self._upsert(conn, entry)
+
+    def _merge_upsert(self, conn: sqlite3.Connection, entry: dict) -> None:
+        # Champs déjà en base et absents de l'entrée (ex. path_file) conservés
+        row = conn.execute("SELECT * FROM documents WHERE file_name = ?", (entry["file_name"],)).fetchone()
+        if row is not None:
+            entry = {**row_to_entry(row), **entry}
+        self._upsert(conn, entry)
+
+    def upsert_many(self, entries: list[dict], merge: bool = False) -> None:
+        """
+        Upsert groupé en une transaction. Avec merge=True, les champs déjà
+        présents en base et absents de l'entrée (ex. path_file) sont conservés.
+        """
+        with self._connect() as conn:
+            for entry in entries:
+                if not entry.get("file_name"):
+                    continue
+                if merge:
+                    self._merge_upsert(conn, entry)
+                else:
+                    self._upsert(conn, entry)
+
+    def _delete(self, conn: sqlite3.Connection, file_names: list[str]) -> None:
+        if self.has_fts:
+            conn.executemany(
+                "DELETE FROM documents_fts WHERE rowid = (SELECT rowid FROM documents WHERE file_name = ?)",
+                [(n,) for n in file_names],
+            )
+        conn.executemany("DELETE FROM documents WHERE file_name = ?", [(n,) for n in file_names])
+
+    def delete(self, file_names: list[str]) -> None:
+        with self._connect() as conn:
+            self._delete(conn, file_names)
+
+    # ----------------------
+    # Fichiers sources suivis par parser.build_index
+    # ----------------------
+    def sources(self) -> dict[str, dict]:
+        """
+        Empreinte de chaque fichier OCR indexé :
+        {path_ocr: {"file_name", "ocr", "structured"}}
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT path_ocr, file_name, fingerprint FROM sources").fetchall()
+        return {r["path_ocr"]: {"file_name": r["file_name"], **json.loads(r["fingerprint"])} for r in rows}
+
+    def apply_source_changes(self, changed: list[tuple[dict, dict]], removed: list[str],
+                             touched: dict[str, dict] | None = None) -> None:
+        """
+        Reporte les changements des fichiers sources en une transaction :
+        - changed : (entrée reconstruite, empreinte) ; l'entrée est fusionnée
+          avec la ligne existante et l'empreinte enregistrée
+        - removed : path_ocr disparus (source et document supprimés)
+        - touched : {path_ocr: empreinte} des sources au contenu inchangé
+          (mtime modifié) ; seule l'empreinte est mise à jour
+        Seules les lignes concernées sont écrites.
+        """
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE sources SET fingerprint = ? WHERE path_ocr = ?",
+                [(json.dumps(fingerprint), path_ocr) for path_ocr, fingerprint in (touched or {}).items()],
+            )
+            stale = []
+            for entry, fingerprint in changed:
+                previous = conn.execute(
+                    "SELECT file_name FROM sources WHERE path_ocr = ?", (entry["path_ocr"],)
+                ).fetchone()
+                # Nom de document changé : l'ancienne ligne ne correspond plus à aucune source
+                if previous is not None and previous[0] != entry["file_name"]:
+                    stale.append(previous[0])
+                self._merge_upsert(conn, entry)
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources (path_ocr, file_name, fingerprint) VALUES (?, ?, ?)",
+                    (entry["path_ocr"], entry["file_name"], json.dumps(fingerprint)),
+                )
+            for path_ocr in removed:
+                row = conn.execute("SELECT file_name FROM sources WHERE path_ocr = ?", (path_ocr,)).fetchone()
+                if row is not None:
+                    stale.append(row[0])
+            conn.executemany("DELETE FROM sources WHERE path_ocr = ?", [(p,) for p in removed])
+            kept = {entry["file_name"] for entry, _ in changed}
+            self._delete(conn, [name for name in stale if name not in kept])
+
+    # ----------------------
+    # Lecture
+    # ----------------------
+    def get(self, file_name: str) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM documents WHERE file_name = ?", (file_name,)).fetchone()
+        return row_to_entry(row) if row else None
+
+    def get_by_hash(self, file_hash: str) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM documents WHERE file_hash = ? LIMIT 1", (file_hash,)).fetchone()
+        return row_to_entry(row) if row else None
+
+    def all_entries(self) -> list[dict]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM documents ORDER BY updated_at").fetchall()
+        return [row_to_entry(r) for r in rows]
+
+    def entries_since(self, seq: int = 0, limit: int | None = None) -> list[tuple[int, dict]]:
+        """
+        Entrées modifiées après le numéro de modification seq, avec leur
+        numéro, par ordre croissant (exports incrémentaux, paginés par limit)
+        """
+        limit_sql = " LIMIT ?" if limit else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM documents WHERE seq > ? ORDER BY seq{limit_sql}", [seq] + ([limit] if limit else [])
+            ).fetchall()
+        return [(r["seq"], row_to_entry(r)) for r in rows]
+
+    def file_names(self) -> set[str]:
+        with self._connect() as conn:
+            return {r[0] for r in conn.execute("SELECT file_name FROM documents")}
+
+    def version(self) -> tuple:
+        """
+        Empreinte (mtime, taille) de la base et de son WAL : change à chaque
+        écriture, sert de clé d'invalidation aux caches des lecteurs
+        """
+        stamp = []
+        for path in (Path(self.db_path), Path(f"{self.db_path}-wal")):
+            try:
+                stat = path.stat()
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def document_types(self) -> list[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT COALESCE(document_type, 'unknown') FROM documents ORDER BY 1"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def search(self, query: str, limit: int | None = None) -> list[dict]:
+        """
+        Recherche plein texte (FTS5, classement bm25), même syntaxe que search.py
+        """
+        fts_query = to_fts_query(query)
+        if not fts_query:
+            return []
+        limit_sql = " LIMIT ?" if limit else ""
+        with self._connect() as conn:
+            if self.has_fts:
+                params = [fts_query] + ([limit] if limit else [])
+                rows = conn.execute(
+                    "SELECT d.* FROM documents_fts f JOIN documents d ON d.rowid = f.rowid "
+                    f"WHERE documents_fts MATCH ? ORDER BY bm25(documents_fts){limit_sql}",
+                    params,
+                ).fetchall()
+            else:
+                words = [t.rstrip("*") for group in parse_query(query) for c in group for t in c]
+                where = " AND ".join("full_text LIKE ?" for _ in words)
+                params = [f"%{w}%" for w in words] + ([limit] if limit else [])
+                rows = conn.execute(f"SELECT * FROM documents WHERE {where}{limit_sql}", params).fetchall()
+        return [row_to_entry(r) for r in rows]
+
+    def query(self, filters: DocumentFilter | None = None, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+              sort: str | None = None) -> dict:
+        """
+        Recherche filtrée et paginée (plein texte + plages + facettes).
+        Tri par défaut : pertinence si filters.text, sinon les plus récents.
+
+        Retourne {"results": entrées de la page, "total_count", "page", "page_size", "pages"}
+        """
+        filters = filters or DocumentFilter()
+        join, where, params = filters.to_sql(self.has_fts)
+        sort = sort or ("relevance" if join else "recent")
+        if sort not in SORTS:
+            raise ValueError(f"❌ Tri inconnu : {sort} (parmi {', '.join(SORTS)})")
+        if sort == "relevance" and not join:
+            sort = "recent"
+        page, page_size = max(1, page), max(1, page_size)
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+
+        with self._connect() as conn:
+            total_count = conn.execute(f"SELECT COUNT(*) FROM documents d{join}{where_sql}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT d.* FROM documents d{join}{where_sql} ORDER BY {SORTS[sort]} LIMIT ? OFFSET ?",
+                [*params, page_size, (page - 1) * page_size],
+            ).fetchall()
+        return {
+            "results": [row_to_entry(r) for r in rows],
+            "total_count": total_count,
+            "page": page,
+            "page_size": page_size,
+            "pages": max(1, -(-total_count // page_size)),
+        }
+
+    def facets(self, filters: DocumentFilter | None = None, fields: tuple[str, ...] = FACET_FIELDS,
+               limit: int = 20) -> dict[str, list[tuple[str | None, int]]]:
+        """
+        Nombre de documents par valeur de chaque champ, sous les filtres donnés.
+        Le filtre d'un champ n'est pas appliqué à sa propre facette (les autres
+        valeurs restent sélectionnables).
+        """
+        filters = filters or DocumentFilter()
+        result = {}
+        with self._connect() as conn:
+            for field_name in fields:
+                if field_name not in FACET_FIELDS:
+                    raise ValueError(f"❌ Facette inconnue : {field_name}")
+                join, where, params = filters.to_sql(self.has_fts, exclude=field_name)
+                where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+                rows = conn.execute(
+                    f"SELECT d.{field_name}, COUNT(*) FROM documents d{join}{where_sql} "
+                    f"GROUP BY d.{field_name} ORDER BY 2 DESC, 1 LIMIT ?",
+                    [*params, limit],
+                ).fetchall()
+                result[field_name] = [(r[0], r[1]) for r in rows]
+        return result
+
+    def ranges(self, filters: DocumentFilter | None = None) -> dict:
+        """
+        Bornes des dates et des totaux sous les filtres donnés (curseurs de l'interface)
+        """
+        join, where, params = (filters or DocumentFilter()).to_sql(self.has_fts)
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT MIN(d.doc_date), MAX(d.doc_date), MIN(d.total), MAX(d.total) FROM documents d{join}{where_sql}",
+                params,
+            ).fetchone()
+        return {"date": (row[0], row[1]), "total": (row[2], row[3])}
+
+    # ----------------------
+    # Migration
+    # ----------------------
+    def migrate_from_json(self, json_path: str = INDEX_FILE) -> int:
+        """
+        Import unique de l'ancien index.json (ne fait rien s'il a déjà été importé)
+        """
+        with self._connect() as conn:
+            done = conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if done or not Path(json_path).exists():
+            return 0
+
+        with open(json_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        with self._connect() as conn:
+            for entry in entries:
+                if entry.get("file_name"):
+                    self._upsert(conn, entry)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                (str(json_path),),
+            )
+        logger.info("✅ %d entrée(s) migrée(s) de %s vers %s", len(entries), json_path, self.db_path)
+        return len(entries)
@@ -0,0 +1,265 @@
+# job_queue.py
+import os
+import time
+import uuid
+import random
+import socket
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+# 🔹 File de traitement persistante (reprise après crash)
+QUEUE_FILE = "./data/jobs.db"
+
+# 🔹 États d'un job
+PENDING = "pending"
+OCR_DONE = "ocr_done"
+STRUCTURED = "structured"
+FAILED = "failed"
+ACTIVE_STATES = (PENDING, OCR_DONE)
+
+# 🔹 Réessais : backoff exponentiel avec jitter entre deux tentatives
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 5.0
+RETRY_MAX_SECONDS = 300.0
+
+# 🔹 Un job réservé depuis plus longtemps est considéré abandonné
+DEFAULT_LEASE_SECONDS = 15 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    claim_token TEXT,
+    claimed_by TEXT,
+    claimed_at REAL,
+    ocr_json_path TEXT,
+    structured_json_path TEXT,
+    error TEXT,
+    created_at REAL,
+    updated_at REAL,
+    UNIQUE(batch, file_path)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(batch, state, next_attempt_at);
+"""
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Délai avant la tentative suivante (attempts = tentatives déjà échouées)
+    """
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # Pas de signal 0 sous Windows : on s'en remet au bail
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """
+    File de jobs dans SQLite (mode WAL), un job par fichier et par lot :
+
+    pending -> ocr_done -> structured
+       └──────────┴──> failed (après max_attempts échecs)
+
+    Un worker réserve un job de façon atomique (claim) ; les jobs réservés
+    par un processus mort ou depuis plus de lease_seconds redeviennent
+    disponibles. Un job en échec garde son état (pending / ocr_done) et est
+    repris à la même étape après un backoff.
+    """
+
+    def __init__(self, db_path: str = QUEUE_FILE):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ----------------------
+    # Alimentation
+    # ----------------------
+    def enqueue(self, batch: str, files: list[str]) -> int:
+        """
+        Ajoute les fichiers au lot (les fichiers déjà présents sont ignorés).
+        Retourne le nombre de jobs créés.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (batch, file_path, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                [(batch, str(f), now, now) for f in files],
+            )
+            return conn.total_changes - before
+
+    def retry_failed(self, batch: str) -> int:
+        """
+        Remet les jobs en échec définitif dans la file (compteur de tentatives remis à zéro)
+        """
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET state = CASE WHEN ocr_json_path IS NULL THEN ? ELSE ? END, "
+                "attempts = 0, next_attempt_at = 0, error = NULL, updated_at = ? "
+                "WHERE batch = ? AND state = ?",
+                (PENDING, OCR_DONE, time.time(), batch, FAILED),
+            )
+            return cur.rowcount
+
+    def retry_job(self, job_id: int) -> bool:
+        """
+        Remet un job en échec définitif dans la file ; False s'il n'est pas en échec
+        """
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET state = CASE WHEN ocr_json_path IS NULL THEN ? ELSE ? END, "
+                "attempts = 0, next_attempt_at = 0, error = NULL, updated_at = ? "
+                "WHERE id = ? AND state = ?",
+                (PENDING, OCR_DONE, time.time(), job_id, FAILED),
+            )
+            return cur.rowcount == 1
+
+    # ----------------------
+    # Réservation
+    # ----------------------
+    def recover(self, batch: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> int:
+        """
+        Libère les jobs réservés par un processus local mort ou dont le bail a expiré
+        """
+        host = socket.gethostname()
+        now = time.time()
+        released = []
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, claimed_by, claimed_at FROM jobs WHERE batch = ? AND claim_token IS NOT NULL",
+                (batch,),
+            ).fetchall()
+            for row in rows:
+                owner_host, _, owner_pid = (row["claimed_by"] or "").rpartition(":")
+                dead = owner_host == host and owner_pid.isdigit() and not _pid_alive(int(owner_pid))
+                if dead or (row["claimed_at"] or 0) < now - lease_seconds:
+                    released.append((row["id"],))
+            conn.executemany(
+                "UPDATE jobs SET claim_token = NULL, claimed_by = NULL, claimed_at = NULL WHERE id = ?", released
+            )
+        return len(released)
+
+    def claim(self, batch: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> dict | None:
+        """
+        Réserve le prochain job disponible du lot (une seule requête UPDATE :
+        deux workers ne peuvent pas obtenir le même job)
+        """
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET claim_token = ?, claimed_by = ?, claimed_at = ?, updated_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE batch = ? AND state IN (?, ?) AND next_attempt_at <= ? "
+                "AND (claim_token IS NULL OR claimed_at < ?) ORDER BY id LIMIT 1)",
+                (token, _worker_id(), now, now, batch, *ACTIVE_STATES, now, now - lease_seconds),
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE claim_token = ?", (token,)).fetchone()
+        return dict(row) if row else None
+
+    def next_retry_at(self, batch: str) -> float | None:
+        """
+        Date de la prochaine tentative d'un job non réservé (None s'il n'y en a plus)
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM jobs WHERE batch = ? AND state IN (?, ?) AND claim_token IS NULL",
+                (batch, *ACTIVE_STATES),
+            ).fetchone()
+        return row[0]
+
+    # ----------------------
+    # Transitions
+    # ----------------------
+    def _update(self, job: dict, **fields) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND claim_token = ?",
+                [*fields.values(), job["id"], job["claim_token"]],
+            )
+
+    def mark_ocr_done(self, job: dict, ocr_json_path: str) -> None:
+        # Le job reste réservé : la structuration suit dans le même worker
+        self._update(job, state=OCR_DONE, ocr_json_path=ocr_json_path, error=None)
+        job.update(state=OCR_DONE, ocr_json_path=ocr_json_path)
+
+    def mark_structured(self, job: dict, structured_json_path: str) -> None:
+        self._update(job, state=STRUCTURED, structured_json_path=structured_json_path, error=None,
+                     claim_token=None, claimed_by=None, claimed_at=None)
+
+    def mark_failed(self, job: dict, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> bool:
+        """
+        Enregistre un échec. Retourne True si le job sera réessayé,
+        False s'il passe en échec définitif.
+        """
+        attempts = job["attempts"] + 1
+        retry = attempts < max_attempts
+        self._update(
+            job,
+            state=job["state"] if retry else FAILED,
+            attempts=attempts,
+            next_attempt_at=time.time() + retry_delay(attempts) if retry else 0,
+            error=error,
+            claim_token=None, claimed_by=None, claimed_at=None,
+        )
+        return retry
+
+    # ----------------------
+    # Lecture
+    # ----------------------
+    def get(self, job_id: int) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find(self, batch: str, file_path: str) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE batch = ? AND file_path = ?", (batch, str(file_path))
+            ).fetchone()
+        return dict(row) if row else None
+
+    def jobs(self, batch: str) -> list[dict]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs WHERE batch = ? ORDER BY id", (batch,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def stats(self, batch: str) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT state, COUNT(*) FROM jobs WHERE batch = ? GROUP BY state", (batch,))
+            counts = {state: n for state, n in rows}
+        return {state: counts.get(state, 0) for state in (PENDING, OCR_DONE, STRUCTURED, FAILED)}
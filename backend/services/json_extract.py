@@ -0,0 +1,187 @@
+# json_extract.py
+import re
+import json
+
+# ----------------------
+# Extraction du JSON d'une réponse LLM
+# ----------------------
+
+# 🔹 Seuls ces caractères changent l'état du scanner (le reste est sauté par la regex)
+_STRUCTURAL = re.compile(r'[{}\[\]"\\,]')
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+# 🔹 Réparation d'un JSON tronqué : nombre maximal de points de coupe essayés
+MAX_REPAIR_ATTEMPTS = 64
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _remove_trailing_commas(candidate: str) -> str | None:
+    """
+    Retire les virgules finales ("a": 1,}) en dehors des chaînes
+    """
+    out, last, in_string, skip = [], 0, False, -1
+    for m in _STRUCTURAL.finditer(candidate):
+        i = m.start()
+        if i < skip:
+            continue
+        c = candidate[i]
+        if in_string:
+            if c == "\\":
+                skip = i + 2
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "," and _TRAILING_COMMA.match(candidate, i):
+            out.append(candidate[last:i])
+            last = i + 1
+    if last == 0:
+        return None
+    out.append(candidate[last:])
+    return "".join(out)
+
+
+def repair_truncated(fragment: str) -> dict | None:
+    """
+    Complète un objet JSON coupé (réponse tronquée par max_tokens) :
+    ferme la chaîne et les crochets ouverts ; si ça ne suffit pas, recule
+    jusqu'à la dernière valeur complète (avant une virgule) et referme.
+    Une réparation qui ne garde aucune clé ({}) est refusée.
+    """
+    stack = []
+    in_string = False
+    skip = -1
+    # Points de coupe sûrs : (position, fermetures à ajouter)
+    cuts = []
+    for m in _STRUCTURAL.finditer(fragment):
+        i = m.start()
+        if i < skip:
+            continue
+        c = fragment[i]
+        if in_string:
+            if c == "\\":
+                skip = i + 2
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in _CLOSERS:
+            stack.append(_CLOSERS[c])
+            cuts.append((i + 1, "".join(reversed(stack))))
+        elif c in "}]":
+            if stack:
+                stack.pop()
+            if stack:
+                cuts.append((i + 1, "".join(reversed(stack))))
+        elif c == "," and stack:
+            cuts.append((i, "".join(reversed(stack))))
+
+    # 1️⃣ Tout garder : fermer la chaîne en cours puis les structures ouvertes
+    tail = fragment.rstrip()
+    if in_string and tail.endswith("\\"):
+        tail = tail[:-1]
+    attempts = [(tail + ('"' if in_string else ""), "".join(reversed(stack)))]
+    # 2️⃣ Reculer jusqu'aux derniers points de coupe
+    attempts += [(fragment[:pos], closers) for pos, closers in reversed(cuts[-MAX_REPAIR_ATTEMPTS:])]
+
+    for body, closers in attempts:
+        try:
+            value = json.loads(body + closers)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            # 🔹 Reculer davantage ne rendra pas plus de clés
+            return value or None
+    return None
+
+
+def _decode(candidate: str) -> dict | None:
+    """
+    Objet JSON complet, éventuellement après retrait des virgules finales
+    """
+    try:
+        value = json.loads(candidate)
+    except json.JSONDecodeError:
+        fixed = _remove_trailing_commas(candidate)
+        if fixed is None:
+            return None
+        try:
+            value = json.loads(fixed)
+        except json.JSONDecodeError:
+            return None
+    return value if isinstance(value, dict) else None
+
+
+def _first_inner(text: str, spans: list[tuple[int, int]]) -> tuple[dict | None, str | None]:
+    """
+    Premier objet valide parmi les accolades équilibrées d'un objet invalide
+    """
+    for start, end in sorted(spans):
+        value = _decode(text[start:end])
+        if value is not None:
+            return value, text[start:end]
+    return None, None
+
+
+def find_json_object(text: str) -> tuple[dict | None, str | None, bool]:
+    """
+    Premier objet JSON valide du texte (prose, ```json ... ``` et accolades
+    parasites autour sont ignorées).
+
+    Un seul parcours du texte : profondeur et chaînes sont suivies dans
+    l'objet en cours, et on ne décode qu'aux accolades équilibrées.
+
+    Retourne (objet, texte source de l'objet, réparé ?). Réparé seulement
+    si un objet tronqué a été complété ; les virgules finales sont retirées
+    sans compter comme une réparation.
+    """
+    if not text:
+        return None, None, False
+    # Positions des "{" ouvertes de l'objet en cours, accolades équilibrées qu'il contient
+    opened, inner = [], []
+    in_string = False
+    skip = -1
+    for m in _STRUCTURAL.finditer(text):
+        i = m.start()
+        if i < skip:
+            continue
+        c = text[i]
+        if not opened:
+            # 🔹 Hors objet (prose) : seules les accolades ouvrantes comptent
+            if c == "{":
+                opened.append(i)
+        elif in_string:
+            if c == "\\":
+                skip = i + 2
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            opened.append(i)
+        elif c == "}":
+            start = opened.pop()
+            if opened:
+                inner.append((start, i + 1))
+                continue
+            # 1️⃣ Objet refermé : décodé tel quel ou sans ses virgules finales
+            value = _decode(text[start:i + 1])
+            if value is not None:
+                return value, text[start:i + 1], False
+            # 2️⃣ Accolades parasites autour : objets équilibrés à l'intérieur
+            value, source = _first_inner(text, inner)
+            if value is not None:
+                return value, source, False
+            inner.clear()
+            in_string = False
+
+    if opened:
+        # 3️⃣ Objet jamais refermé : réponse tronquée
+        value = repair_truncated(text[opened[0]:])
+        if value is not None:
+            return value, text[opened[0]:], True
+        value, source = _first_inner(text, inner)
+        if value is not None:
+            return value, source, False
+    return None, None, False
@@ -0,0 +1,167 @@
+# metrics.py
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# ----------------------
+# Mesures par étape du pipeline (durées, tailles, tokens)
+# ----------------------
+# Étapes instrumentées : read, preprocess, encode, upload, ocr_api, json_dump,
+# llm_call, json_extract, index_update, analytics_export (+ rate_limit_wait : attente du limiteur)
+
+# 🔹 Bornes des histogrammes de durée (secondes)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 🔹 Fichier JSON lines optionnel (une ligne par mesure)
+METRICS_JSONL = os.getenv("OCR_METRICS_JSONL")
+
+LOG_FORMAT = "%(message)s"
+
+
+def configure_logging(level: str | int | None = None) -> None:
+    """
+    Sortie console des logs du pipeline (scripts / CLI).
+    Niveau : argument, sinon OCR_LOG_LEVEL, sinon INFO.
+    DEBUG affiche aussi le texte OCR de chaque page.
+    """
+    level = level or os.getenv("OCR_LOG_LEVEL", "INFO")
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+class _StageStats:
+    __slots__ = ("count", "errors", "seconds", "bytes", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+class Metrics:
+    """
+    Registre de mesures thread-safe.
+
+    - observe / timer : durée (+ taille, tokens) d'une étape
+    - snapshot : agrégats par étape (dict)
+    - to_prometheus : format texte Prometheus
+    - jsonl_path : chaque mesure est aussi ajoutée en JSON lines
+    """
+
+    def __init__(self, jsonl_path: str | None = None):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._stages: dict[str, _StageStats] = {}
+        self._tokens = {"prompt": 0, "completion": 0}
+
+    def observe(self, stage: str, seconds: float, bytes: int | None = None,
+                prompt_tokens: int | None = None, completion_tokens: int | None = None,
+                error: bool = False, **labels) -> None:
+        with self._lock:
+            stats = self._stages.setdefault(stage, _StageStats())
+            stats.count += 1
+            stats.seconds += seconds
+            stats.errors += int(error)
+            stats.bytes += bytes or 0
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+            self._tokens["prompt"] += prompt_tokens or 0
+            self._tokens["completion"] += completion_tokens or 0
+
+            if self.jsonl_path:
+                record = {"ts": time.time(), "stage": stage, "seconds": round(seconds, 6)}
+                if bytes is not None:
+                    record["bytes"] = bytes
+                if prompt_tokens is not None or completion_tokens is not None:
+                    record["prompt_tokens"] = prompt_tokens
+                    record["completion_tokens"] = completion_tokens
+                if error:
+                    record["error"] = True
+                record.update(labels)
+                Path(self.jsonl_path).parent.mkdir(parents=True, exist_ok=True)
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """
+        with metrics.timer("ocr_api", file=name) as obs:
+            ...
+            obs["bytes"] = len(payload)
+
+        La mesure est enregistrée même en cas d'exception (error=True).
+        """
+        obs = dict(labels)
+        start = time.perf_counter()
+        try:
+            yield obs
+        except BaseException:
+            obs["error"] = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, **obs)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {
+                name: {
+                    "count": s.count,
+                    "errors": s.errors,
+                    "seconds": s.seconds,
+                    "avg_seconds": s.seconds / s.count if s.count else 0.0,
+                    "bytes": s.bytes,
+                }
+                for name, s in self._stages.items()
+            }
+            return {"stages": stages, "tokens": dict(self._tokens)}
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP ocr_stage_duration_seconds Durée des étapes du pipeline OCR",
+            "# TYPE ocr_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for name, s in stages:
+                for bound, count in zip(DURATION_BUCKETS, s.buckets):
+                    lines.append(f'ocr_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'ocr_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {s.count}')
+                lines.append(f'ocr_stage_duration_seconds_sum{{stage="{name}"}} {s.seconds}')
+                lines.append(f'ocr_stage_duration_seconds_count{{stage="{name}"}} {s.count}')
+            lines += ["# HELP ocr_stage_errors_total Étapes terminées en erreur",
+                      "# TYPE ocr_stage_errors_total counter"]
+            lines += [f'ocr_stage_errors_total{{stage="{name}"}} {s.errors}' for name, s in stages]
+            lines += ["# HELP ocr_stage_bytes_total Octets traités par étape",
+                      "# TYPE ocr_stage_bytes_total counter"]
+            lines += [f'ocr_stage_bytes_total{{stage="{name}"}} {s.bytes}' for name, s in stages]
+            lines += ["# HELP ocr_llm_tokens_total Tokens consommés par la structuration LLM",
+                      "# TYPE ocr_llm_tokens_total counter"]
+            lines += [f'ocr_llm_tokens_total{{type="{kind}"}} {n}' for kind, n in self._tokens.items()]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Écrit les métriques au format texte (ex. pour le textfile collector de node_exporter)
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._tokens = {"prompt": 0, "completion": 0}
+
+
+# 🔹 Registre partagé par tous les services
+metrics = Metrics(METRICS_JSONL)
@@ -0,0 +1,319 @@
+# mistral_client.py
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from dataclasses import dataclass
+
+from .metrics import metrics
+from .rate_limit import ApiLimiter, AdaptiveConcurrency
+
+logger = logging.getLogger(__name__)
+
+# 🔹 Fichier .env lu au premier appel (pas à l'import)
+ENV_FILE = "./env"
+
+# 🔹 Retries : backoff exponentiel avec jitter sur 429 / 5xx
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 🔹 Réponses signalant une surcharge : la concurrence adaptative réduit sa limite
+THROTTLE_STATUS_CODES = {429, 503}
+
+# 🔹 Appels dont la latence guide la concurrence (une référence par type d'appel) ;
+#    envois de fichiers, URL signées, suivi des jobs batch... restent hors signal
+LATENCY_SIGNAL_CALLS = {"Ocr.process", "Chat.complete"}
+
+
+@dataclass(frozen=True)
+class ClientSettings:
+    api_key: str
+    # URL de l'API (surcharge possible, ex. serveur local de test)
+    server_url: str | None = None
+    timeout_ms: int = 120000
+    max_connections: int = 32
+    max_retries: int = 5
+    # Limites côté client (None = pas de limite) et concurrence adaptative
+    requests_per_second: float | None = None
+    tokens_per_minute: int | None = None
+    initial_concurrency: int = 4
+    max_concurrency: int = 32
+
+
+_settings = None
+_client = None
+# 🔹 Un httpx.AsyncClient ne sert qu'à la boucle asyncio qui l'a utilisé : un client par boucle
+_loop_clients = weakref.WeakKeyDictionary()
+_limiter = None
+_client_lock = threading.RLock()
+
+
+def _streamlit_secret(name: str) -> str | None:
+    """
+    Secret Streamlit, seulement si streamlit est installé et configuré
+    """
+    try:
+        import streamlit as st
+        return st.secrets.get(name)
+    except Exception:
+        return None
+
+
+def get_settings() -> ClientSettings:
+    """
+    Configuration résolue au premier appel : .env, variables d'environnement,
+    puis secrets Streamlit pour la clé API.
+    """
+    global _settings
+    if _settings is None:
+        with _client_lock:
+            if _settings is None:
+                try:
+                    from dotenv import load_dotenv
+                    load_dotenv(dotenv_path=ENV_FILE)
+                except ImportError:
+                    pass
+
+                api_key = os.getenv("MISTRAL_API_KEY") or _streamlit_secret("MISTRAL_API_KEY")
+                if not api_key:
+                    raise ValueError("❌ MISTRAL_API_KEY introuvable")
+                _settings = ClientSettings(
+                    api_key=api_key,
+                    server_url=os.getenv("MISTRAL_SERVER_URL") or None,
+                    timeout_ms=int(os.getenv("MISTRAL_TIMEOUT_MS", "120000")),
+                    max_connections=int(os.getenv("MISTRAL_MAX_CONNECTIONS", "32")),
+                    max_retries=int(os.getenv("MISTRAL_MAX_RETRIES", "5")),
+                    requests_per_second=float(os.getenv("MISTRAL_RPS", "0")) or None,
+                    tokens_per_minute=int(os.getenv("MISTRAL_TPM", "0")) or None,
+                    initial_concurrency=int(os.getenv("MISTRAL_INITIAL_CONCURRENCY", "4")),
+                    max_concurrency=int(os.getenv("MISTRAL_MAX_CONCURRENCY", "32")),
+                )
+    return _settings
+
+
+def _new_client(http_client=None):
+    import httpx
+    from mistralai import Mistral
+
+    settings = get_settings()
+    limits = httpx.Limits(
+        max_connections=settings.max_connections,
+        max_keepalive_connections=settings.max_connections,
+    )
+    timeout = httpx.Timeout(settings.timeout_ms / 1000)
+    return Mistral(
+        api_key=settings.api_key,
+        server_url=settings.server_url,
+        client=http_client or httpx.Client(limits=limits, timeout=timeout),
+        async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+        timeout_ms=settings.timeout_ms,
+    )
+
+
+def get_client():
+    """
+    Client Mistral partagé par l'OCR et la structuration (créé au premier appel).
+
+    Le pool de connexions httpx synchrone est créé une seule fois et partagé
+    par tous les threads, ce qui réutilise les connexions TLS d'un appel à
+    l'autre. Le pool async est lié à une boucle asyncio : appelé depuis une
+    coroutine, get_client retourne le client de la boucle en cours (créé une
+    fois par boucle, même pool synchrone), oublié quand la boucle disparaît.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _new_client()
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _client
+
+    client = _loop_clients.get(loop)
+    if client is None:
+        with _client_lock:
+            client = _loop_clients.get(loop)
+            if client is None:
+                client = _loop_clients[loop] = _new_client(_client.sdk_configuration.client)
+    return client
+
+
+def get_limiter() -> ApiLimiter:
+    """
+    Limiteur partagé par tous les appels à l'API (OCR, chat, files) :
+    MISTRAL_RPS requêtes/s, MISTRAL_TPM tokens/min et concurrence AIMD
+    entre MISTRAL_INITIAL_CONCURRENCY et MISTRAL_MAX_CONCURRENCY
+    """
+    global _limiter
+    if _limiter is None:
+        with _client_lock:
+            if _limiter is None:
+                settings = get_settings()
+                _limiter = ApiLimiter(
+                    requests_per_second=settings.requests_per_second,
+                    tokens_per_minute=settings.tokens_per_minute,
+                    concurrency=AdaptiveConcurrency(
+                        initial=settings.initial_concurrency,
+                        maximum=settings.max_concurrency,
+                    ),
+                )
+    return _limiter
+
+
+def reset_client() -> None:
+    """
+    Oublie la configuration, le client et le limiteur (recréés au prochain appel)
+    """
+    global _settings, _client, _limiter
+    with _client_lock:
+        _settings = None
+        _client = None
+        _loop_clients.clear()
+        _limiter = None
+
+
+def _status_code(exc: Exception) -> int | None:
+    import httpx
+
+    status = getattr(exc, "status_code", None)
+    if status is None and isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    return status
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Erreurs transitoires : 429, 5xx, timeouts et erreurs de connexion
+    """
+    import httpx
+
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+
+def _retry_after(exc: Exception) -> float | None:
+    """
+    Délai demandé par le serveur (en-tête Retry-After), s'il existe
+    """
+    response = getattr(exc, "raw_response", None) or getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, exc: Exception | None = None) -> float:
+    """
+    Backoff exponentiel avec "full jitter" (plafonné à BACKOFF_MAX_SECONDS)
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    retry_after = _retry_after(exc) if exc is not None else None
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, BACKOFF_MAX_SECONDS))
+    return delay
+
+
+def _is_throttle(exc: Exception) -> bool:
+    import httpx
+
+    return isinstance(exc, httpx.TimeoutException) or _status_code(exc) in THROTTLE_STATUS_CODES
+
+
+def _latency_key(fn) -> str | None:
+    """
+    Type d'appel dont la latence guide la concurrence (None : appel de
+    métadonnées ou d'envoi de fichier, hors signal)
+    """
+    name = ".".join(getattr(fn, "__qualname__", "").split(".")[-2:]).removesuffix("_async")
+    return name if name in LATENCY_SIGNAL_CALLS else None
+
+
+def _total_tokens(response) -> int | None:
+    return getattr(getattr(response, "usage", None), "total_tokens", None)
+
+
+def _record_wait(waited: float) -> None:
+    if waited > 0.001:
+        metrics.observe("rate_limit_wait", waited)
+
+
+def call_with_retry(fn, *args, max_retries: int | None = None, estimated_tokens: int = 0,
+                    limiter: ApiLimiter | None = None, **kwargs):
+    """
+    Appelle fn(*args, **kwargs) en réessayant les erreurs transitoires
+    (max_retries : MISTRAL_MAX_RETRIES par défaut).
+
+    Chaque tentative passe par le limiteur partagé (get_limiter) :
+    estimated_tokens est réservé sur le budget tokens/min puis corrigé
+    avec l'usage réel de la réponse.
+    """
+    if max_retries is None:
+        max_retries = get_settings().max_retries
+    limiter = limiter or get_limiter()
+    key = _latency_key(fn)
+    attempt = 0
+    while True:
+        _record_wait(limiter.acquire(estimated_tokens))
+        start = time.perf_counter()
+        error, latency, throttled = None, None, False
+        try:
+            result = fn(*args, **kwargs)
+            latency = time.perf_counter() - start if key else None
+        except Exception as e:
+            error, throttled = e, _is_throttle(e)
+        finally:
+            # 🔹 Créneau rendu à chaque sortie (y compris KeyboardInterrupt)
+            limiter.release(latency, throttled, key or "default")
+        if error is None:
+            if estimated_tokens:
+                limiter.settle_tokens(estimated_tokens, _total_tokens(result))
+            return result
+        if attempt >= max_retries or not is_retryable(error):
+            raise error
+        delay = backoff_delay(attempt, error)
+        logger.warning("⚠️ Erreur transitoire (%s), nouvel essai dans %.1fs", _status_code(error) or type(error).__name__, delay)
+        time.sleep(delay)
+        attempt += 1
+
+
+async def call_with_retry_async(fn, *args, max_retries: int | None = None, estimated_tokens: int = 0,
+                                limiter: ApiLimiter | None = None, **kwargs):
+    """
+    Version async de call_with_retry (fn est une coroutine function)
+    """
+    if max_retries is None:
+        max_retries = get_settings().max_retries
+    limiter = limiter or get_limiter()
+    key = _latency_key(fn)
+    attempt = 0
+    while True:
+        _record_wait(await limiter.acquire_async(estimated_tokens))
+        start = time.perf_counter()
+        error, latency, throttled = None, None, False
+        try:
+            result = await fn(*args, **kwargs)
+            latency = time.perf_counter() - start if key else None
+        except Exception as e:
+            error, throttled = e, _is_throttle(e)
+        finally:
+            # 🔹 Créneau rendu à chaque sortie (y compris annulation : CancelledError n'est pas une Exception)
+            limiter.release(latency, throttled, key or "default")
+        if error is None:
+            if estimated_tokens:
+                limiter.settle_tokens(estimated_tokens, _total_tokens(result))
+            return result
+        if attempt >= max_retries or not is_retryable(error):
+            raise error
+        delay = backoff_delay(attempt, error)
+        logger.warning("⚠️ Erreur transitoire (%s), nouvel essai dans %.1fs", _status_code(error) or type(error).__name__, delay)
+        await asyncio.sleep(delay)
+        attempt += 1
@@ -1,29 +1,69 @@
 # ocr_engine.py
 import os
+import mmap
 import base64
 import json
+import asyncio
+import logging
+import tempfile
 from pathlib import Path
-import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 
-from mistralai import Mistral
-from dotenv import load_dotenv
+from .blob_store import extract_images
+from .preprocessing import PreprocessConfig, preprocess_image, IMAGE_MIME_TYPES
+from .cache import ocr_cache, cache_disabled, hash_file, make_cache_key
+from .mistral_client import get_client, call_with_retry, call_with_retry_async
+from .metrics import metrics, configure_logging
+from .text_layer import TEXT_LAYER_ENABLED, text_layer_pages, merge_pages
+from .pdf_split import SplitConfig, DEFAULT_SPLIT, page_count, page_ranges, write_ranges, \
+    check_range, combine_ranges
 
-# 🔹 Charger la clé API
-load_dotenv(dotenv_path="./env")
+logger = logging.getLogger(__name__)
 
-# Puis récupérer la clé soit dans env, soit dans secrets
-api_key = (
-    os.getenv("MISTRAL_API_KEY")
-    or st.secrets.get("MISTRAL_API_KEY")
-)
-if not api_key:
-    raise ValueError("❌ MISTRAL_API_KEY introuvable")
-client = Mistral(api_key=api_key)
+ocr_model = "mistral-ocr-latest"
+
+# 🔹 À incrémenter si les paramètres de l'appel OCR changent (invalide le cache)
+OCR_CACHE_VERSION = "ocr-v2"
+
+# 🔹 Taille des blocs encodés (multiple de 3 : pas de padding intermédiaire)
+BASE64_CHUNK_SIZE = 3 * 1024 * 1024
+
+# 🔹 Au-delà de ce seuil, le mode "auto" envoie le fichier via l'API files
+UPLOAD_THRESHOLD_BYTES = int(os.getenv("OCR_UPLOAD_THRESHOLD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_MODES = ("auto", "inline", "upload")
+
+def _encode_into_buffer(file_path: str, prefix: bytes = b"") -> bytearray:
+    """
+    Encode un fichier en base64 dans un seul buffer pré-dimensionné.
+
+    Le fichier est lu via mmap (pas de copie en mémoire Python) et encodé
+    par blocs ; seul le résultat encodé (+ le préfixe éventuel) est alloué.
+    """
+    size = os.path.getsize(file_path)
+    buffer = bytearray(len(prefix) + 4 * ((size + 2) // 3))
+    buffer[:len(prefix)] = prefix
+    if size == 0:
+        return buffer
+
+    pos = len(prefix)
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            for start in range(0, size, BASE64_CHUNK_SIZE):
+                chunk = base64.b64encode(view[start:start + BASE64_CHUNK_SIZE])
+                buffer[pos:pos + len(chunk)] = chunk
+                pos += len(chunk)
+        finally:
+            view.release()
+    return buffer
 
 # 🔹 Fonction pour encoder un fichier en base64
 def encode_file_to_base64(file_path: str) -> str:
-    with open(file_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+    return _encode_into_buffer(file_path).decode("ascii")
+
+# 🔹 Data URL construite directement (évite la copie supplémentaire de la f-string)
+def encode_file_to_data_url(file_path: str, mime_type: str) -> str:
+    return _encode_into_buffer(file_path, f"data:{mime_type};base64,".encode("ascii")).decode("ascii")
 
 # 🔹 Fonction pour déterminer le MIME type
 def get_mime_type(file_path: str) -> str:
@@ -35,21 +75,228 @@ def get_mime_type(file_path: str) -> str:
     else:
         raise ValueError(f"Format non supporté : {ext}")
 
-# 🔹 Fonction principale OCR
-def run_ocr(file_path: str, output_folder: str = "./data/samples") -> str:
-    mime_type = get_mime_type(file_path)
-    file_base64 = encode_file_to_base64(file_path)
+def _use_upload(file_path: str, upload_mode: str) -> bool:
+    if upload_mode not in UPLOAD_MODES:
+        raise ValueError(f"upload_mode invalide : {upload_mode} (attendu : {', '.join(UPLOAD_MODES)})")
+    if upload_mode == "auto":
+        return os.path.getsize(file_path) > UPLOAD_THRESHOLD_BYTES
+    return upload_mode == "upload"
 
-    # 🔹 Appel OCR Mistral
-    ocr_response = client.ocr.process(
-        model="mistral-ocr-latest",
-        document={"type": "document_url", "document_url": f"data:{mime_type};base64,{file_base64}"},
-        include_image_base64=True
+def _document(url: str, mime_type: str) -> dict:
+    if mime_type == "application/pdf":
+        return {"type": "document_url", "document_url": url}
+    return {"type": "image_url", "image_url": url}
+
+# 🔹 Paramètres de l'appel OCR (partagés par les versions sync et async)
+def ocr_request(file_path: str, document: dict | None = None, include_images: bool = True) -> dict:
+    if document is None:
+        mime_type = get_mime_type(file_path)
+        with metrics.timer("encode", file=Path(file_path).name) as obs:
+            data_url = encode_file_to_data_url(file_path, mime_type)
+            obs["bytes"] = len(data_url)
+        document = {"type": "document_url", "document_url": data_url}
+    return {
+        "model": ocr_model,
+        "document": document,
+        "include_image_base64": include_images,
+    }
+
+# 🔹 Image prétraitée (réduite / grise / recompressée) envoyée en data URL
+def _preprocessed_document(file_path: str, mime_type: str, preprocess: PreprocessConfig | None) -> dict | None:
+    if preprocess is None or mime_type not in IMAGE_MIME_TYPES:
+        return None
+    result = preprocess_image(file_path, mime_type, preprocess)
+    metrics.observe("preprocess", result.seconds, bytes=result.original_bytes, file=Path(file_path).name,
+                    output_bytes=result.output_bytes)
+    logger.info(
+        "🖼️ Prétraitement %s : %.0f Ko -> %.0f Ko en %.0f ms (%s)", Path(file_path).name,
+        result.original_bytes / 1024, result.output_bytes / 1024, result.seconds * 1000, ", ".join(result.steps)
     )
+    with metrics.timer("encode", file=Path(file_path).name) as obs:
+        data_url = f"data:{result.mime_type};base64,{base64.b64encode(result.data).decode('ascii')}"
+        obs["bytes"] = len(data_url)
+    return {"type": "document_url", "document_url": data_url}
 
-    # 🔹 Convertir en dictionnaire
+# 🔹 Réponse OCR -> dictionnaire, images déplacées dans le blob store
+def _to_ocr_dict(ocr_response) -> dict:
     ocr_dict = ocr_response.model_dump()
+    extracted = extract_images(ocr_dict)
+    if extracted:
+        logger.info("🖼️ %d image(s) extraite(s) vers le blob store", extracted)
+    return ocr_dict
+
+def _upload_file(file_path: str) -> tuple[str, str]:
+    """
+    Envoie le fichier via l'API files (flux, sans base64) et retourne
+    (file_id, URL signée utilisable par l'OCR)
+    """
+    client = get_client()
+    with open(file_path, "rb") as f, \
+            metrics.timer("upload", file=Path(file_path).name, bytes=os.path.getsize(file_path)):
+        def upload():
+            f.seek(0)
+            return client.files.upload(file={"file_name": Path(file_path).name, "content": f}, purpose="ocr")
+        uploaded = call_with_retry(upload)
+    try:
+        signed = call_with_retry(client.files.get_signed_url, file_id=uploaded.id)
+    except BaseException:
+        # 🔹 Pas d'URL signée : le fichier envoyé ne servira jamais, on le supprime
+        _delete_uploaded(uploaded.id)
+        raise
+    return uploaded.id, signed.url
+
+async def _upload_file_async(file_path: str) -> tuple[str, str]:
+    client = get_client()
+    with open(file_path, "rb") as f, \
+            metrics.timer("upload", file=Path(file_path).name, bytes=os.path.getsize(file_path)):
+        async def upload():
+            f.seek(0)
+            return await client.files.upload_async(file={"file_name": Path(file_path).name, "content": f}, purpose="ocr")
+        uploaded = await call_with_retry_async(upload)
+    try:
+        signed = await call_with_retry_async(client.files.get_signed_url_async, file_id=uploaded.id)
+    except BaseException:
+        await _delete_uploaded_async(uploaded.id)
+        raise
+    return uploaded.id, signed.url
+
+def _delete_uploaded(file_id: str) -> None:
+    try:
+        get_client().files.delete(file_id=file_id)
+    except Exception as e:
+        logger.warning("⚠️ Impossible de supprimer le fichier distant %s : %s", file_id, e)
+
+async def _delete_uploaded_async(file_id: str) -> None:
+    try:
+        await get_client().files.delete_async(file_id=file_id)
+    except Exception as e:
+        logger.warning("⚠️ Impossible de supprimer le fichier distant %s : %s", file_id, e)
+
+def ocr_cache_lookup(file_path: str, use_cache: bool, include_images: bool = True,
+                     preprocess: PreprocessConfig | None = None,
+                     text_layer: bool = False) -> tuple[str | None, dict | None]:
+    """
+    Retourne (clé de cache, résultat OCR en cache ou None)
+    """
+    if not use_cache or cache_disabled():
+        return None, None
+    version = OCR_CACHE_VERSION if include_images else f"{OCR_CACHE_VERSION}-noimages"
+    mime_type = get_mime_type(file_path)
+    if preprocess is not None and mime_type in IMAGE_MIME_TYPES:
+        version = f"{version}|{preprocess.cache_tag()}"
+    if text_layer and mime_type == "application/pdf":
+        version = f"{version}|text-layer"
+    with metrics.timer("read", file=Path(file_path).name, bytes=os.path.getsize(file_path)):
+        content_hash = hash_file(file_path)
+    cache_key = make_cache_key(content_hash, ocr_model, version)
+    ocr_dict = ocr_cache.get(cache_key)
+    if ocr_dict is not None:
+        logger.info("♻️ OCR trouvé dans le cache pour : %s", file_path)
+    return cache_key, ocr_dict
+
+# 🔹 Pages à demander à l'OCR distant (None : tout le document)
+def pages_to_ocr(local_pages: list[dict | None] | None) -> list[int] | None:
+    if local_pages is None:
+        return None
+    return [i for i, page in enumerate(local_pages) if page is None]
+
+# 🔹 Pages à OCRiser par plages parallèles (None : une seule requête)
+def _split_pages(file_path: str, mime_type: str, remote_pages: list[int] | None,
+                 split: SplitConfig | None) -> list[int] | None:
+    if split is None or mime_type != "application/pdf":
+        return None
+    try:
+        indices = remote_pages if remote_pages is not None else list(range(page_count(file_path)))
+    except Exception as e:
+        logger.warning("⚠️ Découpage impossible pour %s (%s) : envoi en une requête", file_path, e)
+        return None
+    return indices if split.should_split(len(indices)) else None
+
+def _range_label(pages: list[int]) -> str:
+    return f"{pages[0] + 1}-{pages[-1] + 1}"
+
+def _ocr_range(path: str, pages: list[int], include_images: bool, timeout_ms: int | None) -> dict:
+    request = ocr_request(path, None, include_images)
+    with metrics.timer("ocr_api", file=Path(path).name) as obs:
+        ocr_response = call_with_retry(get_client().ocr.process, **request, timeout_ms=timeout_ms)
+        obs["pages"] = len(ocr_response.pages)
+    return check_range(pages, _to_ocr_dict(ocr_response))
+
+async def _ocr_range_async(path: str, pages: list[int], include_images: bool, timeout_ms: int | None) -> dict:
+    request = await asyncio.to_thread(ocr_request, path, None, include_images)
+    with metrics.timer("ocr_api", file=Path(path).name) as obs:
+        ocr_response = await call_with_retry_async(get_client().ocr.process_async, **request, timeout_ms=timeout_ms)
+        obs["pages"] = len(ocr_response.pages)
+    return check_range(pages, await asyncio.to_thread(_to_ocr_dict, ocr_response))
+
+def _ranges_result(file_path: str, ranges: list[list[int]], results: dict, errors: dict) -> dict:
+    pending = [i for i in range(len(ranges)) if i not in results]
+    if pending:
+        failed = ", ".join(_range_label(ranges[i]) for i in pending)
+        raise RuntimeError(f"❌ OCR impossible pour {Path(file_path).name}, pages {failed}") from errors[pending[0]]
+    return combine_ranges([(ranges[i], results[i]) for i in sorted(results)])
+
+def _ocr_ranges(file_path: str, indices: list[int], split: SplitConfig, include_images: bool,
+                timeout_ms: int | None) -> dict:
+    """
+    OCR d'un gros PDF par plages de pages en parallèle ; une plage en échec
+    est relancée seule (split.range_attempts passes au total)
+    """
+    ranges = page_ranges(indices, split.pages_per_range)
+    logger.info("✂️ %s : %d page(s) OCRisée(s) en %d plage(s)", Path(file_path).name, len(indices), len(ranges))
+    results, errors = {}, {}
+    with tempfile.TemporaryDirectory(prefix="ocr_split_") as tmp:
+        with metrics.timer("pdf_split", file=Path(file_path).name) as obs:
+            paths = write_ranges(file_path, ranges, tmp)
+            obs["ranges"] = len(ranges)
+        for attempt in range(max(1, split.range_attempts)):
+            pending = [i for i in range(len(ranges)) if i not in results]
+            if not pending:
+                break
+            if attempt:
+                logger.warning("⚠️ %d plage(s) en échec, nouvel essai (%d/%d)", len(pending), attempt + 1,
+                               split.range_attempts)
+            with ThreadPoolExecutor(max_workers=max(1, min(split.max_workers, len(pending)))) as pool:
+                futures = {i: pool.submit(_ocr_range, paths[i], ranges[i], include_images, timeout_ms) for i in pending}
+                for i, future in futures.items():
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        errors[i] = e
+                        logger.warning("⚠️ Pages %s de %s : %s", _range_label(ranges[i]), Path(file_path).name, e)
+    return _ranges_result(file_path, ranges, results, errors)
 
+async def _ocr_ranges_async(file_path: str, indices: list[int], split: SplitConfig, include_images: bool,
+                            timeout_ms: int | None) -> dict:
+    ranges = page_ranges(indices, split.pages_per_range)
+    logger.info("✂️ %s : %d page(s) OCRisée(s) en %d plage(s)", Path(file_path).name, len(indices), len(ranges))
+    results, errors = {}, {}
+    semaphore = asyncio.Semaphore(max(1, split.max_workers))
+
+    async def run(i: int, path: str) -> None:
+        async with semaphore:
+            try:
+                results[i] = await _ocr_range_async(path, ranges[i], include_images, timeout_ms)
+            except Exception as e:
+                errors[i] = e
+                logger.warning("⚠️ Pages %s de %s : %s", _range_label(ranges[i]), Path(file_path).name, e)
+
+    with tempfile.TemporaryDirectory(prefix="ocr_split_") as tmp:
+        with metrics.timer("pdf_split", file=Path(file_path).name) as obs:
+            paths = await asyncio.to_thread(write_ranges, file_path, ranges, tmp)
+            obs["ranges"] = len(ranges)
+        for attempt in range(max(1, split.range_attempts)):
+            pending = [i for i in range(len(ranges)) if i not in results]
+            if not pending:
+                break
+            if attempt:
+                logger.warning("⚠️ %d plage(s) en échec, nouvel essai (%d/%d)", len(pending), attempt + 1,
+                               split.range_attempts)
+            await asyncio.gather(*(run(i, paths[i]) for i in pending))
+    return _ranges_result(file_path, ranges, results, errors)
+
+# 🔹 Enrichissement + sauvegarde du résultat OCR
+def save_ocr_result(file_path: str, ocr_dict: dict, output_folder: str) -> str:
     # 🔹 Enrichir le JSON pour indexation/recherche
     pages = ocr_dict.get("pages", [])
     full_text = " ".join([page.get("markdown", "") for page in pages])
@@ -62,20 +309,154 @@ def run_ocr(file_path: str, output_folder: str = "./data/samples") -> str:
     Path(output_folder).mkdir(parents=True, exist_ok=True)
     output_path = Path(output_folder) / f"{Path(file_path).stem}_ocr_result.json"
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(ocr_dict, f, ensure_ascii=False, indent=4)
+    with metrics.timer("json_dump", file=Path(file_path).name) as obs:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(ocr_dict, f, ensure_ascii=False, indent=4)
+        obs["bytes"] = output_path.stat().st_size
 
-    print(f"✅ OCR terminé et JSON enrichi sauvegardé dans : {output_path}")
+    logger.info("✅ OCR terminé et JSON enrichi sauvegardé dans : %s", output_path)
 
-    # 🔹 Afficher le texte extrait
-    for i, page in enumerate(pages, 1):
-        print(f"\n=== Page {i} ===")
-        print(page.get("text", "Aucun texte détecté"))
+    # 🔹 Texte extrait (niveau DEBUG : coûteux pour les gros documents)
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, page in enumerate(pages, 1):
+            logger.debug("\n=== Page %d ===\n%s", i, page.get("markdown") or "Aucun texte détecté")
 
     return str(output_path)
 
+# 🔹 Fonction principale OCR
+def run_ocr(file_path: str, output_folder: str = "./data/samples", use_cache: bool = True,
+            timeout_ms: int | None = None, upload_mode: str = "auto",
+            include_images: bool = True, preprocess: PreprocessConfig | None = None,
+            text_layer: bool = TEXT_LAYER_ENABLED, split: SplitConfig | None = DEFAULT_SPLIT) -> str:
+    """
+    upload_mode : "inline" (data URL base64), "upload" (API files, le fichier
+    est envoyé en flux) ou "auto" (upload au-delà de UPLOAD_THRESHOLD_BYTES)
+
+    include_images : si False, les images des pages ne sont pas demandées à
+    l'API. Sinon elles sont stockées dans le blob store (data/blobs) et le
+    JSON OCR ne garde que leur identifiant (image_blob_id).
+
+    preprocess : si fourni, les images PNG/JPEG sont réduites, converties
+    et recompressées avant envoi (voir preprocessing.PreprocessConfig).
+
+    text_layer : pour les PDF natifs, le texte des pages lisibles est extrait
+    localement (voir text_layer.py) ; seules les pages scannées partent à
+    l'OCR distant, et aucun appel n'est fait si toutes sont lisibles.
+
+    split : les PDF dont plus de split.min_pages pages partent à l'OCR sont
+    découpés en plages OCRisées en parallèle puis réassemblées dans l'ordre
+    (voir pdf_split.SplitConfig) ; None = toujours une seule requête.
+
+    timeout_ms : None = délai du client (MISTRAL_TIMEOUT_MS)
+    """
+    mime_type = get_mime_type(file_path)
+
+    # 🔹 Cache : un fichier identique (même contenu) n'est pas renvoyé à l'API
+    cache_key, ocr_dict = ocr_cache_lookup(file_path, use_cache, include_images, preprocess, text_layer)
+
+    local_pages = text_layer_pages(file_path, mime_type, text_layer) if ocr_dict is None else None
+    remote_pages = pages_to_ocr(local_pages)
+    if ocr_dict is None and remote_pages == []:
+        logger.info("📄 PDF natif, OCR distant évité : %s", file_path)
+        ocr_dict = merge_pages(local_pages, None)
+        if cache_key:
+            ocr_cache.set(cache_key, ocr_dict)
+
+    split_pages = _split_pages(file_path, mime_type, remote_pages, split) if ocr_dict is None else None
+    if split_pages:
+        ocr_dict = _ocr_ranges(file_path, split_pages, split, include_images, timeout_ms)
+        if local_pages is not None:
+            ocr_dict = merge_pages(local_pages, ocr_dict)
+        if cache_key:
+            ocr_cache.set(cache_key, ocr_dict)
+
+    if ocr_dict is None:
+        file_id = None
+        document = _preprocessed_document(file_path, mime_type, preprocess)
+        if document is None and _use_upload(file_path, upload_mode):
+            file_id, url = _upload_file(file_path)
+            document = _document(url, mime_type)
+        try:
+            request = ocr_request(file_path, document, include_images)
+            if remote_pages:
+                request["pages"] = remote_pages
+            # 🔹 Appel OCR Mistral (avec retries sur 429 / 5xx)
+            with metrics.timer("ocr_api", file=Path(file_path).name) as obs:
+                ocr_response = call_with_retry(get_client().ocr.process, **request, timeout_ms=timeout_ms)
+                obs["pages"] = len(ocr_response.pages)
+        finally:
+            if file_id:
+                _delete_uploaded(file_id)
+
+        # 🔹 Convertir en dictionnaire (images -> blob store)
+        ocr_dict = _to_ocr_dict(ocr_response)
+        if local_pages is not None:
+            ocr_dict = merge_pages(local_pages, ocr_dict)
+        if cache_key:
+            ocr_cache.set(cache_key, ocr_dict)
+
+    return save_ocr_result(file_path, ocr_dict, output_folder)
+
+# 🔹 Version async (FastAPI, batchs) : ne bloque pas la boucle d'événements
+async def run_ocr_async(file_path: str, output_folder: str = "./data/samples", use_cache: bool = True,
+                        timeout_ms: int | None = None, upload_mode: str = "auto",
+                        include_images: bool = True, preprocess: PreprocessConfig | None = None,
+                        text_layer: bool = TEXT_LAYER_ENABLED, split: SplitConfig | None = DEFAULT_SPLIT) -> str:
+    mime_type = get_mime_type(file_path)
+
+    # 🔹 Lecture / hash / encodage du fichier hors de la boucle d'événements
+    cache_key, ocr_dict = await asyncio.to_thread(ocr_cache_lookup, file_path, use_cache, include_images, preprocess,
+                                                  text_layer)
+
+    local_pages = None
+    if ocr_dict is None:
+        local_pages = await asyncio.to_thread(text_layer_pages, file_path, mime_type, text_layer)
+    remote_pages = pages_to_ocr(local_pages)
+    if ocr_dict is None and remote_pages == []:
+        logger.info("📄 PDF natif, OCR distant évité : %s", file_path)
+        ocr_dict = merge_pages(local_pages, None)
+        if cache_key:
+            await asyncio.to_thread(ocr_cache.set, cache_key, ocr_dict)
+
+    split_pages = None
+    if ocr_dict is None:
+        split_pages = await asyncio.to_thread(_split_pages, file_path, mime_type, remote_pages, split)
+    if split_pages:
+        ocr_dict = await _ocr_ranges_async(file_path, split_pages, split, include_images, timeout_ms)
+        if local_pages is not None:
+            ocr_dict = merge_pages(local_pages, ocr_dict)
+        if cache_key:
+            await asyncio.to_thread(ocr_cache.set, cache_key, ocr_dict)
+
+    if ocr_dict is None:
+        file_id = None
+        document = await asyncio.to_thread(_preprocessed_document, file_path, mime_type, preprocess)
+        if document is None and _use_upload(file_path, upload_mode):
+            file_id, url = await _upload_file_async(file_path)
+            document = _document(url, mime_type)
+        try:
+            request = await asyncio.to_thread(ocr_request, file_path, document, include_images)
+            if remote_pages:
+                request["pages"] = remote_pages
+            with metrics.timer("ocr_api", file=Path(file_path).name) as obs:
+                ocr_response = await call_with_retry_async(
+                    get_client().ocr.process_async, **request, timeout_ms=timeout_ms
+                )
+                obs["pages"] = len(ocr_response.pages)
+        finally:
+            if file_id:
+                await _delete_uploaded_async(file_id)
+        ocr_dict = await asyncio.to_thread(_to_ocr_dict, ocr_response)
+        if local_pages is not None:
+            ocr_dict = merge_pages(local_pages, ocr_dict)
+        if cache_key:
+            await asyncio.to_thread(ocr_cache.set, cache_key, ocr_dict)
+
+    return await asyncio.to_thread(save_ocr_result, file_path, ocr_dict, output_folder)
+
 
 # 🔹 Exemple d'utilisation
 if __name__ == "__main__":
+    configure_logging()
     local_file_path = "./data/samples/facture1.pdf"  # ou image
     run_ocr(local_file_path)
@@ -1,24 +1,52 @@
 import os
 import json
+import argparse
+import hashlib
+import logging
 from pathlib import Path
 
+from .index_store import IndexStore, DB_FILE
+from .metrics import metrics, configure_logging
+
+logger = logging.getLogger(__name__)
+
 # 🔹 Dossiers où sont stockés les fichiers OCR et structured
 OCR_FOLDER = "./data/samples"
 STRUCTURED_FOLDER = "./data/samples"
 
-# 🔹 Fichier index final
-INDEX_FILE = "./data/index.json"
 
-index_data = []
+def _fingerprint(path: Path, previous: dict | None = None) -> dict | None:
+    """
+    Empreinte d'un fichier source. Le hash n'est recalculé que si le mtime
+    ou la taille ont changé depuis l'empreinte précédente.
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    fingerprint = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if previous and previous.get("mtime_ns") == stat.st_mtime_ns and previous.get("size") == stat.st_size:
+        fingerprint["sha256"] = previous.get("sha256")
+    else:
+        fingerprint["sha256"] = hashlib.sha256(path.read_bytes()).hexdigest()
+    return fingerprint
+
+
+def _same_content(a: dict | None, b: dict | None) -> bool:
+    if a is None or b is None:
+        return a is b
+    return a.get("sha256") == b.get("sha256")
 
-# 🔹 Parcourir tous les fichiers OCR
-for ocr_file in Path(OCR_FOLDER).glob("*_ocr_result.json"):
-    # Nom du fichier (sans extension)
-    stem = ocr_file.stem.replace("_ocr_result", "")
 
-    # Correspondant structured file
-    structured_file = Path(STRUCTURED_FOLDER) / f"{stem}_structured.json"
+def _write_json(path: str, data, indent: int | None = 4) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
 
+
+def _build_entry(ocr_file: Path, structured_file: Path) -> dict:
     # Charger OCR JSON
     with open(ocr_file, "r", encoding="utf-8") as f:
         ocr_json = json.load(f)
@@ -30,8 +58,8 @@ for ocr_file in Path(OCR_FOLDER).glob("*_ocr_result.json"):
     else:
         structured_json = None
 
-    # Construire l'entrée index
-    entry = {
+    stem = ocr_file.stem.replace("_ocr_result", "")
+    return {
         "file_name": ocr_json.get("file_name", f"{stem}.pdf"),
         "document_type": ocr_json.get("document_type", "unknown"),
         "full_text": ocr_json.get("full_text", ""),
@@ -40,11 +68,92 @@ for ocr_file in Path(OCR_FOLDER).glob("*_ocr_result.json"):
         "path_structured": str(structured_file) if structured_file.exists() else None
     }
 
-    index_data.append(entry)
 
-# 🔹 Sauvegarder l'index complet
-Path(INDEX_FILE).parent.mkdir(parents=True, exist_ok=True)
-with open(INDEX_FILE, "w", encoding="utf-8") as f:
-    json.dump(index_data, f, ensure_ascii=False, indent=4)
+def build_index(ocr_folder: str = OCR_FOLDER, structured_folder: str = STRUCTURED_FOLDER,
+                db_file: str = DB_FILE, full_rebuild: bool = False, index_file: str | None = None) -> dict:
+    """
+    Met à jour l'index SQLite (db_file) de façon incrémentale :
+    - l'empreinte (mtime, taille, hash) de chaque fichier source est gardée
+      dans la table sources de la base
+    - seuls les fichiers OCR / structured nouveaux ou modifiés sont relus
+    - les documents dont le fichier OCR a disparu sont supprimés
+    - seules les lignes concernées sont écrites (rien si rien n'a changé)
+
+    full_rebuild relit tous les fichiers. index_file (optionnel) exporte
+    l'index complet en JSON, au format de l'ancien index.json.
+
+    Retourne un résumé {"added", "updated", "removed", "unchanged"}.
+    """
+    store = IndexStore(db_file)
+    previous_sources = store.sources()
+
+    seen = set()
+    changed = []
+    touched = {}
+    added = updated = unchanged = 0
+
+    # 🔹 Parcourir tous les fichiers OCR
+    for ocr_file in sorted(Path(ocr_folder).glob("*_ocr_result.json")):
+        key = str(ocr_file)
+        seen.add(key)
+        # Nom du fichier (sans extension)
+        stem = ocr_file.stem.replace("_ocr_result", "")
+
+        # Correspondant structured file
+        structured_file = Path(structured_folder) / f"{stem}_structured.json"
+
+        previous = previous_sources.get(key)
+        known = {} if previous is None or full_rebuild else previous
+        current = {
+            "ocr": _fingerprint(ocr_file, known.get("ocr")),
+            "structured": _fingerprint(structured_file, known.get("structured")),
+        }
+
+        if (previous is not None and not full_rebuild
+                and _same_content(previous.get("ocr"), current["ocr"])
+                and _same_content(previous.get("structured"), current["structured"])):
+            unchanged += 1
+            if current != {"ocr": previous.get("ocr"), "structured": previous.get("structured")}:
+                # Même contenu, mtime différent : empreinte rafraîchie (pas de nouveau hash au prochain passage)
+                touched[key] = current
+            continue
+
+        # 🔹 Fichier nouveau ou modifié : (re)construire l'entrée
+        changed.append((_build_entry(ocr_file, structured_file), current))
+        if previous is None:
+            added += 1
+        else:
+            updated += 1
+
+    # 🔹 Sources supprimées
+    removed = [key for key in previous_sources if key not in seen]
+
+    summary = {"added": added, "updated": updated, "removed": len(removed), "unchanged": unchanged}
+
+    if changed or removed or touched:
+        with metrics.timer("index_update", upserted=len(changed), removed=len(removed)):
+            store.apply_source_changes(changed, removed, touched)
+
+    if index_file:
+        # 🔹 Export complet (O(N)) : uniquement sur demande
+        _write_json(index_file, store.all_entries())
+
+    logger.info(
+        "✅ Index à jour dans : %s — %d ajouté(s), %d mis à jour, %d supprimé(s), %d inchangé(s)",
+        db_file, summary["added"], summary["updated"], summary["removed"], summary["unchanged"]
+    )
+    return summary
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description="Met à jour l'index des documents OCR")
+    parser.add_argument("--full-rebuild", action="store_true", help="relire tous les fichiers sources")
+    parser.add_argument("--db", default=DB_FILE, help="index SQLite")
+    parser.add_argument("--export-json", help="exporter aussi l'index complet dans ce fichier JSON")
+    args = parser.parse_args(argv)
+    configure_logging()
+    return build_index(db_file=args.db, full_rebuild=args.full_rebuild, index_file=args.export_json)
+
 
-print(f"✅ Index généré avec {len(index_data)} documents dans : {INDEX_FILE}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# pdf_split.py
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from .text_layer import _pymupdf
+
+# ----------------------
+# Découpage des gros PDF en plages de pages (OCR en parallèle)
+# ----------------------
+
+
+@dataclass
+class SplitConfig:
+    """
+    Réglages du découpage (un par lot de documents)
+
+    - min_pages : découpage seulement au-delà de ce nombre de pages à OCRiser
+    - pages_per_range : pages par requête OCR
+    - max_workers : plages OCRisées simultanément
+    - range_attempts : passes de relance des plages en échec (en plus des
+      retries 429 / 5xx de call_with_retry)
+    """
+    min_pages: int = int(os.getenv("OCR_SPLIT_MIN_PAGES", "30"))
+    pages_per_range: int = int(os.getenv("OCR_SPLIT_PAGES", "10"))
+    max_workers: int = int(os.getenv("OCR_SPLIT_WORKERS", "4"))
+    range_attempts: int = 2
+
+    def should_split(self, num_pages: int) -> bool:
+        return num_pages > max(self.min_pages, self.pages_per_range)
+
+
+# 🔹 OCR_SPLIT=0 désactive le découpage par défaut
+DEFAULT_SPLIT = SplitConfig() if os.getenv("OCR_SPLIT", "1") != "0" else None
+
+
+def page_count(file_path: str) -> int:
+    with _pymupdf().open(file_path) as doc:
+        return doc.page_count
+
+
+def page_ranges(indices: list[int], pages_per_range: int) -> list[list[int]]:
+    """
+    Regroupe des index de pages en plages contiguës d'au plus pages_per_range pages
+    """
+    ranges = []
+    for index in sorted(indices):
+        current = ranges[-1] if ranges else None
+        if current and current[-1] == index - 1 and len(current) < pages_per_range:
+            current.append(index)
+        else:
+            ranges.append([index])
+    return ranges
+
+
+def write_ranges(file_path: str, ranges: list[list[int]], output_dir: str) -> list[str]:
+    """
+    Écrit un PDF par plage (source ouverte une seule fois) ; retourne leurs chemins
+    """
+    pymupdf = _pymupdf()
+    stem = Path(file_path).stem
+    paths = []
+    with pymupdf.open(file_path) as src:
+        for pages in ranges:
+            path = Path(output_dir) / f"{stem}_p{pages[0] + 1}-{pages[-1] + 1}.pdf"
+            with pymupdf.open() as part:
+                part.insert_pdf(src, from_page=pages[0], to_page=pages[-1])
+                part.save(str(path), garbage=3, deflate=True)
+            paths.append(str(path))
+    return paths
+
+
+def check_range(indices: list[int], ocr_dict: dict) -> dict:
+    """
+    Vérifie qu'une plage a bien une page de réponse par page envoyée ; une
+    plage incomplète lève une erreur (relancée comme une plage en échec)
+    """
+    received = len(ocr_dict.get("pages") or [])
+    if received != len(indices):
+        raise RuntimeError(f"❌ Plage {indices[0] + 1}-{indices[-1] + 1} incomplète : "
+                           f"{received} page(s) reçue(s) sur {len(indices)}")
+    return ocr_dict
+
+
+def combine_ranges(results: list[tuple[list[int], dict]]) -> dict:
+    """
+    Réponses OCR des plages -> une réponse unique, pages renumérotées dans
+    l'ordre du document
+    """
+    pages = []
+    usage = {"pages_processed": 0, "doc_size_bytes": 0}
+    model = None
+    for indices, ocr_dict in sorted(results, key=lambda r: r[0][0]):
+        check_range(indices, ocr_dict)
+        model = model or ocr_dict.get("model")
+        range_pages = sorted(ocr_dict.get("pages") or [], key=lambda p: p.get("index", 0))
+        pages.extend({**page, "index": index} for index, page in zip(indices, range_pages))
+        for key in usage:
+            usage[key] += (ocr_dict.get("usage_info") or {}).get(key) or 0
+    return {"pages": pages, "model": model, "usage_info": usage, "ranges": len(results)}
@@ -1,39 +1,222 @@
-import json
+import io
+import time
+import threading
+from dataclasses import dataclass, field
 
-# 🔹 Charger l'index
-with open("data/index.json", "r", encoding="utf-8") as f:
-    index = json.load(f)
+# ----------------------
+# Prétraitement des images avant OCR
+# ----------------------
 
-def search_index(index, query):
+# 🔹 Côté long d'une page A4 en pouces (pour convertir un DPI cible en pixels)
+PAGE_LONG_SIDE_INCHES = 11.69
+
+# 🔹 Angles testés pour le redressement (degrés)
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+
+IMAGE_MIME_TYPES = {"image/png", "image/jpeg"}
+
+
+@dataclass
+class PreprocessStats:
+    """
+    Totaux du prétraitement d'un lot (partagés par ses threads)
+    """
+    images: int = 0
+    original_bytes: int = 0
+    output_bytes: int = 0
+    seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, result: "PreprocessResult") -> None:
+        with self._lock:
+            self.images += 1
+            self.original_bytes += result.original_bytes
+            self.output_bytes += result.output_bytes
+            self.seconds += result.seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"images": self.images, "original_bytes": self.original_bytes,
+                    "output_bytes": self.output_bytes, "seconds": self.seconds}
+
+
+@dataclass
+class PreprocessConfig:
+    """
+    Réglages du prétraitement (un par lot de documents)
+
+    - target_dpi : résolution visée pour une page A4 (None = pas de réduction)
+    - grayscale : conversion en niveaux de gris
+    - deskew : redressement des photos légèrement inclinées
+    - output_format : "JPEG", "PNG" ou None (garder le format d'origine)
+    - jpeg_quality : qualité de recompression JPEG
+
+    stats cumule les images traitées avec cette config ; dataclasses.replace
+    en fait une copie aux totaux remis à zéro (un lot = une copie).
+    """
+    target_dpi: int | None = 200
+    grayscale: bool = True
+    deskew: bool = False
+    output_format: str | None = "JPEG"
+    jpeg_quality: int = 85
+    stats: PreprocessStats = field(default_factory=PreprocessStats, init=False, repr=False, compare=False)
+
+    def cache_tag(self) -> str:
+        return (f"dpi={self.target_dpi};gray={self.grayscale};deskew={self.deskew};"
+                f"fmt={self.output_format};q={self.jpeg_quality}")
+
+
+@dataclass
+class PreprocessResult:
+    data: bytes
+    mime_type: str
+    original_bytes: int
+    output_bytes: int
+    seconds: float
+    steps: list[str] = field(default_factory=list)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.output_bytes
+
+
+def _require_pillow():
+    try:
+        from PIL import Image, ImageOps, ImageStat
+    except ImportError as e:
+        raise ImportError("❌ Le prétraitement des images nécessite Pillow (pip install pillow)") from e
+    return Image, ImageOps, ImageStat
+
+
+def _estimate_skew(image, Image, ImageStat) -> float:
+    """
+    Angle d'inclinaison par profil de projection : on garde l'angle pour
+    lequel la variance des moyennes de lignes est maximale (lignes de texte
+    horizontales). Calculé sur une vignette binarisée pour rester rapide.
+    """
+    thumb = image.convert("L")
+    thumb.thumbnail((800, 800))
+    # Texte en blanc sur fond noir : les lignes de texte ressortent dans le profil
+    binary = thumb.point(lambda p: 255 if p < 128 else 0)
+
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for i in range(-steps, steps + 1):
+        angle = i * DESKEW_STEP
+        rotated = binary.rotate(angle, resample=Image.NEAREST, fillcolor=0)
+        profile = rotated.resize((1, rotated.height), Image.BOX)
+        score = ImageStat.Stat(profile).var[0]
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def preprocess_image(file_path: str, mime_type: str, config: PreprocessConfig) -> PreprocessResult:
     """
-    Recherche tous les documents contenant tous les mots du query dans le full_text.
+    Réduit, convertit en gris, redresse et recompresse une image avant OCR.
+    Si le résultat n'est pas plus petit que l'original, l'original est gardé.
     """
-    results = []
-    keywords = query.lower().split()  # séparer la requête en mots
+    Image, ImageOps, ImageStat = _require_pillow()
+    start = time.perf_counter()
+    with open(file_path, "rb") as f:
+        original = f.read()
 
-    for doc in index:
-        text = doc.get("full_text", "").lower()
-        if all(k in text for k in keywords):
-            results.append(doc)
+    image = Image.open(io.BytesIO(original))
+    image = ImageOps.exif_transpose(image)
+    steps = []
 
-    return results
+    # 🔹 Réduction à la résolution cible (le côté long correspond à une page A4)
+    if config.target_dpi:
+        max_side = int(config.target_dpi * PAGE_LONG_SIDE_INCHES)
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            steps.append(f"resize:{image.width}x{image.height}")
 
-print("🔹 Bienvenue dans le moteur de recherche des documents !")
-print("Tapez vos mots-clés séparés par des espaces (ou 'exit' pour quitter)")
+    # 🔹 Niveaux de gris
+    if config.grayscale and image.mode != "L":
+        image = image.convert("L")
+        steps.append("grayscale")
 
-while True:
-    query = input("\nVotre recherche : ").strip()
-    if query.lower() == "exit":
-        break
-    if not query:
-        print("❌ Veuillez saisir au moins un mot-clé.")
-        continue
+    # 🔹 Redressement
+    if config.deskew:
+        angle = _estimate_skew(image, Image, ImageStat)
+        if angle:
+            fill = 255 if image.mode == "L" else (255,) * len(image.getbands())
+            image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+            steps.append(f"deskew:{angle:+.1f}")
 
-    matches = search_index(index, query)
-    if not matches:
-        print("⚠️ Aucun document trouvé.")
+    # 🔹 Recompression
+    output_format = (config.output_format or ("PNG" if mime_type == "image/png" else "JPEG")).upper()
+    if output_format == "JPEG" and image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    if output_format == "JPEG":
+        image.save(buffer, format="JPEG", quality=config.jpeg_quality, optimize=True)
     else:
-        print(f"✅ {len(matches)} document(s) trouvé(s) :")
-        for m in matches:
-            total = m.get("structured_json", {}).get("total", "N/A")
-            print(f"- {m['file_name']} | Type: {m.get('document_type')} | Total: {total}")
+        image.save(buffer, format="PNG", optimize=True)
+    data = buffer.getvalue()
+    out_mime = f"image/{output_format.lower()}"
+    steps.append(f"encode:{output_format.lower()}")
+
+    if len(data) >= len(original):
+        data, out_mime, steps = original, mime_type, ["original"]
+
+    result = PreprocessResult(
+        data=data,
+        mime_type=out_mime,
+        original_bytes=len(original),
+        output_bytes=len(data),
+        seconds=time.perf_counter() - start,
+        steps=steps,
+    )
+    config.stats.add(result)
+    return result
+
+
+# ----------------------
+# Recherche en ligne de commande
+# ----------------------
+# 🔹 index_store n'est importé que par la recherche (le prétraitement n'en a pas besoin)
+def search_index(store: "IndexStore", query: str, page: int = 1, page_size: int = 20) -> dict:
+    """
+    Recherche les documents correspondant au query dans le full_text
+    (mots en ET, OR, "phrases", préfixes*), triés par pertinence (FTS5 / bm25).
+    Retourne une page de IndexStore.query.
+    """
+    from .index_store import DocumentFilter
+    return store.query(DocumentFilter(text=query), page=page, page_size=page_size)
+
+
+def main(db_file: str | None = None, index_file: str | None = None):
+    from .index_store import IndexStore, DB_FILE, INDEX_FILE
+    # 🔹 Index SQLite (ancien index.json importé une seule fois)
+    store = IndexStore(db_file or DB_FILE)
+    store.migrate_from_json(index_file or INDEX_FILE)
+
+    print("🔹 Bienvenue dans le moteur de recherche des documents !")
+    print("Tapez vos mots-clés séparés par des espaces (ou 'exit' pour quitter)")
+
+    while True:
+        query = input("\nVotre recherche : ").strip()
+        if query.lower() == "exit":
+            break
+        if not query:
+            print("❌ Veuillez saisir au moins un mot-clé.")
+            continue
+
+        result = search_index(store, query)
+        matches = result["results"]
+        if not matches:
+            print("⚠️ Aucun document trouvé.")
+        else:
+            print(f"✅ {result['total_count']} document(s) trouvé(s) :")
+            for m in matches:
+                total = (m.get("structured_json") or {}).get("total", "N/A")
+                print(f"- {m['file_name']} | Type: {m.get('document_type')} | Total: {total}")
+            if result["pages"] > 1:
+                print(f"… {len(matches)} premiers résultats affichés")
+
+
+if __name__ == "__main__":
+    main()
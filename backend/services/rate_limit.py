@@ -0,0 +1,216 @@
+# rate_limit.py
+import time
+import asyncio
+import threading
+
+# ----------------------
+# Limitation du débit côté client (requêtes/s, tokens/min) + concurrence adaptative
+# ----------------------
+
+# 🔹 Attente maximale entre deux vérifications en mode async (secondes)
+ASYNC_POLL_SECONDS = 0.05
+
+
+class TokenBucket:
+    """
+    Seau à jetons : rate jetons ajoutés par seconde, au plus capacity en réserve.
+
+    Le solde peut devenir négatif (adjust) : une consommation sous-estimée
+    est rattrapée sur les acquisitions suivantes.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("❌ rate doit être > 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """
+        Prend amount jetons si possible et retourne 0 ; sinon ne prend rien
+        et retourne le temps d'attente estimé (secondes)
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Bloque jusqu'à obtenir amount jetons ; retourne le temps attendu
+        """
+        waited = 0.0
+        while (wait := self.try_acquire(amount)) > 0:
+            time.sleep(wait)
+            waited += wait
+        return waited
+
+    async def acquire_async(self, amount: float = 1.0) -> float:
+        waited = 0.0
+        while (wait := self.try_acquire(amount)) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        return waited
+
+    def adjust(self, delta: float) -> None:
+        """
+        Corrige le solde après coup (delta < 0 : consommation réelle supérieure à l'estimation)
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+
+class AdaptiveConcurrency:
+    """
+    Nombre d'appels simultanés ajusté en AIMD :
+    - succès rapide : +1 appel toutes les `limit` réponses (croissance additive)
+    - 429 : limite multipliée par backoff (0.5)
+    - latence lissée > latency_tolerance × latence de référence : limite × 0.9
+
+    La latence est suivie par type d'appel (key : OCR, chat...) : un OCR de
+    3 s n'est pas comparé à un chat de 0.1 s. La référence est la meilleure
+    latence lissée, qui remonte vers la latence courante (baseline_drift par
+    réponse) : des documents plus lourds ne bloquent pas la limite au minimum.
+
+    Les baisses sont espacées d'au moins cooldown_seconds pour qu'une rafale
+    de 429 ne fasse pas tomber la limite au minimum d'un coup.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32, backoff: float = 0.5,
+                 latency_tolerance: float = 3.0, cooldown_seconds: float = 2.0, smoothing: float = 0.2,
+                 baseline_drift: float = 0.05):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown_seconds = cooldown_seconds
+        self.smoothing = smoothing
+        self.baseline_drift = baseline_drift
+        self.in_flight = 0
+        self.throttled = 0
+        self.latency_ewma: dict[str, float] = {}
+        self.best_latency: dict[str, float] = {}
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self) -> None:
+        while not self.try_acquire():
+            await asyncio.sleep(ASYNC_POLL_SECONDS)
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown_seconds:
+            self.limit = max(float(self.minimum), self.limit * factor)
+            self._last_decrease = now
+
+    def release(self, latency: float | None = None, throttled: bool = False, key: str = "default") -> None:
+        """
+        Libère un créneau et ajuste la limite selon le résultat de l'appel
+        (latency None : erreur non liée à la charge, annulation ou appel de
+        métadonnées, pas d'ajustement)
+        """
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if throttled:
+                self.throttled += 1
+                self._decrease(self.backoff)
+            elif latency is not None:
+                previous = self.latency_ewma.get(key)
+                ewma = latency if previous is None else self.smoothing * latency + (1 - self.smoothing) * previous
+                best = self.best_latency.get(key, ewma)
+                best = min(ewma, best + self.baseline_drift * (ewma - best))
+                self.latency_ewma[key], self.best_latency[key] = ewma, best
+                if ewma > best * self.latency_tolerance:
+                    self._decrease(0.9)
+                else:
+                    self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class ApiLimiter:
+    """
+    Limiteur partagé par l'OCR et la structuration :
+    requêtes/s et tokens/min (seaux à jetons, None = illimité) + concurrence AIMD.
+    """
+
+    def __init__(self, requests_per_second: float | None = None, tokens_per_minute: float | None = None,
+                 concurrency: AdaptiveConcurrency | None = None):
+        self.requests = TokenBucket(requests_per_second, max(1.0, requests_per_second)) \
+            if requests_per_second else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = concurrency or AdaptiveConcurrency()
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Réserve un créneau, une requête et `tokens` tokens ; retourne l'attente (secondes)
+        """
+        start = time.perf_counter()
+        self.concurrency.acquire()
+        try:
+            if self.requests:
+                self.requests.acquire()
+            if self.tokens and tokens:
+                self.tokens.acquire(tokens)
+        except BaseException:
+            # 🔹 Interruption pendant l'attente des seaux : le créneau est rendu
+            self.concurrency.release()
+            raise
+        return time.perf_counter() - start
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        start = time.perf_counter()
+        await self.concurrency.acquire_async()
+        try:
+            if self.requests:
+                await self.requests.acquire_async()
+            if self.tokens and tokens:
+                await self.tokens.acquire_async(tokens)
+        except BaseException:
+            # 🔹 Annulation (CancelledError) pendant l'attente des seaux : le créneau est rendu
+            self.concurrency.release()
+            raise
+        return time.perf_counter() - start
+
+    def release(self, latency: float | None = None, throttled: bool = False, key: str = "default") -> None:
+        self.concurrency.release(latency, throttled, key)
+
+    def settle_tokens(self, estimated: int, actual: int | None) -> None:
+        """
+        Remplace l'estimation par la consommation réelle (usage de la réponse)
+        """
+        if self.tokens and actual is not None:
+            self.tokens.adjust(estimated - actual)
+
+    def stats(self) -> dict:
+        c = self.concurrency
+        return {
+            "concurrency_limit": int(c.limit),
+            "in_flight": c.in_flight,
+            "throttled": c.throttled,
+            "latency_ewma_seconds": dict(c.latency_ewma),
+        }
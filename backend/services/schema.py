@@ -0,0 +1,398 @@
+# schema.py
+import re
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+# ----------------------
+# Schéma validé d'une facture structurée (montants Decimal, dates ISO, devise ISO 4217)
+# ----------------------
+
+# 🔹 À incrémenter si la forme de to_record() ou l'analyse des valeurs change
+#    (2 : séparateur décimal selon la devise, pourcentages ignorés)
+SCHEMA_VERSION = 2
+
+AMOUNT_RE = re.compile(r"-?\d[\d\s.,']*")
+_PERCENT_RE = re.compile(r"\s*%")
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%d/%m/%y")
+
+# 🔹 Symboles et codes reconnus -> code ISO 4217
+CURRENCY_SYMBOLS = {"€": "EUR", "$": "USD", "£": "GBP", "¥": "JPY", "CHF": "CHF", "FCFA": "XOF", "DH": "MAD"}
+CURRENCY_CODES = {"EUR", "USD", "GBP", "CHF", "JPY", "CAD", "AUD", "XOF", "XAF", "MAD", "TND", "DZD"}
+_CURRENCY_RE = re.compile(
+    r"(?<![A-Za-z])("
+    + "|".join(re.escape(t) for t in sorted(CURRENCY_CODES | set(CURRENCY_SYMBOLS), key=len, reverse=True))
+    + r")(?![A-Za-z])",
+    re.IGNORECASE,
+)
+
+# 🔹 Séparateur décimal selon la devise ("1,234" : 1234 en USD, 1,234 en EUR) ;
+#    devise inconnue : usage français, avec une erreur si le montant est ambigu
+DECIMAL_POINT_CURRENCIES = {"USD", "GBP", "CHF", "JPY", "CAD", "AUD"}
+DEFAULT_DECIMAL_SEPARATOR = ","
+
+# 🔹 Champs montants d'une facture et d'une ligne
+AMOUNT_FIELDS = ("subtotal", "tax", "total", "amount_paid")
+DATE_FIELDS = ("date", "due_date")
+
+# 🔹 Clés acceptées pour les lignes (le prompt demande des noms français)
+ITEM_KEYS = {
+    "description": ("description", "désignation", "designation", "libelle", "libellé"),
+    "quantity": ("quantité", "quantite", "quantity", "qty"),
+    "unit_price": ("prix_unitaire", "unit_price", "prix"),
+    "amount": ("montant", "amount", "total"),
+}
+
+# 🔹 Écart toléré entre montants recalculés et montants lus (arrondis)
+TOLERANCE = Decimal("0.02")
+
+
+def _amount_text(value: str) -> str | None:
+    """
+    Premier nombre de la chaîne qui n'est pas un pourcentage ("TVA 20% : 24,00" -> "24,00")
+    """
+    for match in AMOUNT_RE.finditer(value):
+        if not _PERCENT_RE.match(value, match.end()):
+            return match.group(0)
+    return None
+
+
+def parse_amount_checked(value, currency: str | None = None) -> tuple[Decimal | None, str | None]:
+    """
+    "1 234,56 €" -> (Decimal("1234.56"), None).
+
+    - deux séparateurs différents : le dernier est décimal ; un séparateur
+      répété ("1.234.567") est un séparateur de milliers
+    - un seul séparateur suivi de 3 chiffres ("12.000", "1,234") : choisi
+      selon la devise (paramètre ou symbole dans la valeur) ; sans devise,
+      usage français et message d'ambiguïté en second élément
+    - pourcentages ignorés, valeurs non finies (NaN, inf) refusées
+    """
+    if isinstance(value, bool) or value is None:
+        return None, None
+    if isinstance(value, (int, float)):
+        return (Decimal(str(value)), None) if math.isfinite(value) else (None, None)
+    if not isinstance(value, str):
+        return None, None
+    text = _amount_text(value)
+    if text is None:
+        return None, None
+    number = re.sub(r"[\s']", "", text).rstrip(".,")
+    for sep in ",.":
+        if number.count(sep) > 1:
+            number = number.replace(sep, "")
+    issue = None
+    if "," in number and "." in number:
+        if number.rfind(",") > number.rfind("."):
+            number = number.replace(".", "").replace(",", ".")
+        else:
+            number = number.replace(",", "")
+    elif "," in number or "." in number:
+        sep = "," if "," in number else "."
+        integer, decimals = number.split(sep)
+        if len(decimals) == 3 and integer.lstrip("-") not in ("", "0"):
+            currency = currency or parse_currency(value)
+            if currency is None:
+                decimal_sep = DEFAULT_DECIMAL_SEPARATOR
+            else:
+                decimal_sep = "." if currency in DECIMAL_POINT_CURRENCIES else ","
+            if sep != decimal_sep:
+                number = integer + decimals
+            if currency is None:
+                issue = f"montant ambigu ({value!r}, séparateur décimal supposé {decimal_sep!r})"
+        number = number.replace(",", ".")
+    try:
+        amount = Decimal(number)
+    except InvalidOperation:
+        return None, None
+    return (amount, issue) if amount.is_finite() else (None, None)
+
+
+def parse_amount(value, currency: str | None = None) -> Decimal | None:
+    """
+    Montant seul (voir parse_amount_checked)
+    """
+    return parse_amount_checked(value, currency)[0]
+
+
+def parse_date(value) -> str | None:
+    """
+    Date en ISO (YYYY-MM-DD) si le format est reconnu
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_currency(*values) -> str | None:
+    """
+    Premier code devise trouvé dans les valeurs ("1 234,56 €" -> "EUR")
+    """
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        match = _CURRENCY_RE.search(value)
+        if match:
+            token = match.group(1).upper()
+            return CURRENCY_SYMBOLS.get(token, token if token in CURRENCY_CODES else None)
+    return None
+
+
+def _parse_column(values: list, parser, contexts: list | None = None) -> list:
+    """
+    Applique parser à une colonne : chaque valeur distincte (et son contexte,
+    ex. la devise de la facture) n'est analysée qu'une fois
+    """
+    parsed = {}
+    out = []
+    contexts = contexts if contexts is not None else [None] * len(values)
+    for value, context in zip(values, contexts):
+        args = (value,) if context is None else (value, context)
+        key = (type(value), value, context) if isinstance(value, (str, int, float)) else None
+        if key is None:
+            out.append(parser(*args))
+            continue
+        if key not in parsed:
+            parsed[key] = parser(*args)
+        out.append(parsed[key])
+    return out
+
+
+def _text(value) -> str | None:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _party(value) -> tuple[str | None, str | None]:
+    """
+    Vendeur / acheteur : chaîne ou {"nom", "adresse"} -> (nom, adresse)
+    """
+    if isinstance(value, dict):
+        name = value.get("nom") or value.get("name")
+        address = value.get("adresse") or value.get("address")
+        if isinstance(address, (dict, list)):
+            address = ", ".join(str(v) for v in (address.values() if isinstance(address, dict) else address) if v)
+        return _text(name), _text(address)
+    return _text(value), None
+
+
+def _pick(item: dict, field_name: str):
+    for key in ITEM_KEYS[field_name]:
+        if key in item:
+            return item[key]
+    return None
+
+
+def _to_number(value: Decimal | None):
+    # JSON : entier si possible, sinon flottant
+    if value is None:
+        return None
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def _to_decimal(value) -> Decimal | None:
+    return None if value is None else Decimal(str(value))
+
+
+@dataclass(slots=True)
+class LineItem:
+    description: str | None = None
+    quantity: Decimal | None = None
+    unit_price: Decimal | None = None
+    amount: Decimal | None = None
+
+    def to_record(self) -> dict:
+        return {
+            "description": self.description,
+            "quantity": _to_number(self.quantity),
+            "unit_price": _to_number(self.unit_price),
+            "amount": _to_number(self.amount),
+        }
+
+
+@dataclass(slots=True)
+class Invoice:
+    """
+    Facture normalisée : montants Decimal, dates ISO, devise ISO 4217.
+    errors liste les champs illisibles et les incohérences de montants.
+    """
+    invoice_number: str | None = None
+    date: str | None = None
+    due_date: str | None = None
+    currency: str | None = None
+    seller: str | None = None
+    buyer: str | None = None
+    buyer_address: str | None = None
+    items: list[LineItem] = field(default_factory=list)
+    subtotal: Decimal | None = None
+    tax: Decimal | None = None
+    total: Decimal | None = None
+    amount_paid: Decimal | None = None
+    terms: str | None = None
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def to_record(self) -> dict:
+        """
+        Forme stockée (JSON) : montants en nombres, dates et devise en chaînes
+        """
+        return {
+            "schema_version": SCHEMA_VERSION,
+            "invoice_number": self.invoice_number,
+            "date": self.date,
+            "due_date": self.due_date,
+            "currency": self.currency,
+            "seller": self.seller,
+            "buyer": self.buyer,
+            "buyer_address": self.buyer_address,
+            "items": [item.to_record() for item in self.items],
+            **{name: _to_number(getattr(self, name)) for name in AMOUNT_FIELDS},
+            "terms": self.terms,
+            "errors": list(self.errors),
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Invoice":
+        """
+        Relit to_record() sans ré-analyser de chaînes
+        """
+        return cls(
+            invoice_number=record.get("invoice_number"),
+            date=record.get("date"),
+            due_date=record.get("due_date"),
+            currency=record.get("currency"),
+            seller=record.get("seller"),
+            buyer=record.get("buyer"),
+            buyer_address=record.get("buyer_address"),
+            items=[
+                LineItem(i.get("description"), _to_decimal(i.get("quantity")),
+                         _to_decimal(i.get("unit_price")), _to_decimal(i.get("amount")))
+                for i in record.get("items") or []
+            ],
+            **{name: _to_decimal(record.get(name)) for name in AMOUNT_FIELDS},
+            terms=record.get("terms"),
+            errors=list(record.get("errors") or []),
+        )
+
+
+def _validate(invoice: Invoice, raw: dict) -> None:
+    for name in AMOUNT_FIELDS:
+        if raw.get(name) not in (None, "") and getattr(invoice, name) is None:
+            invoice.errors.append(f"{name} : montant illisible ({raw.get(name)!r})")
+    for name in DATE_FIELDS:
+        if raw.get(name) not in (None, "") and getattr(invoice, name) is None:
+            invoice.errors.append(f"{name} : date illisible ({raw.get(name)!r})")
+    if "raw_output" in raw:
+        invoice.errors.append("réponse LLM non structurée (raw_output)")
+    if raw.get("_repaired"):
+        invoice.errors.append(f"JSON réparé, résultat possiblement incomplet (finish_reason={raw['_repaired']})")
+
+    if None not in (invoice.subtotal, invoice.tax, invoice.total) \
+            and abs(invoice.subtotal + invoice.tax - invoice.total) > TOLERANCE:
+        invoice.errors.append(f"total incohérent : {invoice.subtotal} + {invoice.tax} != {invoice.total}")
+    amounts = [item.amount for item in invoice.items]
+    if invoice.subtotal is not None and amounts and None not in amounts \
+            and abs(sum(amounts) - invoice.subtotal) > TOLERANCE:
+        invoice.errors.append(f"sous-total incohérent : somme des lignes {sum(amounts)} != {invoice.subtotal}")
+
+
+def normalize_many(raws: list[dict]) -> list[Invoice]:
+    """
+    Normalise un lot de factures brutes (sortie LLM) colonne par colonne :
+    chaque montant / date distinct du lot n'est analysé qu'une fois.
+    """
+    raws = [raw if isinstance(raw, dict) else {} for raw in raws]
+    raw_items = [
+        [item for item in raw.get("items") or [] if isinstance(item, dict)] if isinstance(raw.get("items"), list) else []
+        for raw in raws
+    ]
+    # 🔹 Devise d'abord : elle fixe le séparateur décimal des montants ambigus
+    currencies = [
+        parse_currency(raw.get("currency"), *(raw.get(name) for name in AMOUNT_FIELDS),
+                       *(_pick(item, "amount") for item in items))
+        for raw, items in zip(raws, raw_items)
+    ]
+    columns = {name: _parse_column([raw.get(name) for raw in raws], parse_amount_checked, currencies)
+               for name in AMOUNT_FIELDS}
+    columns.update({name: _parse_column([raw.get(name) for raw in raws], parse_date) for name in DATE_FIELDS})
+
+    # Lignes de toutes les factures aplaties, puis réparties
+    flat = [item for items in raw_items for item in items]
+    flat_currencies = [currency for currency, items in zip(currencies, raw_items) for _ in items]
+    item_columns = {
+        name: _parse_column([_pick(item, name) for item in flat], parse_amount_checked, flat_currencies)
+        for name in ("quantity", "unit_price", "amount")
+    }
+
+    invoices = []
+    offset = 0
+    for row, raw in enumerate(raws):
+        items, issues = [], []
+        for number, item in enumerate(raw_items[row], 1):
+            values = {}
+            for name in ("quantity", "unit_price", "amount"):
+                values[name], issue = item_columns[name][offset]
+                if issue:
+                    issues.append(f"ligne {number} {name} : {issue}")
+            items.append(LineItem(_text(_pick(item, "description")), **values))
+            offset += 1
+        amounts = {}
+        for name in AMOUNT_FIELDS:
+            amounts[name], issue = columns[name][row]
+            if issue:
+                issues.append(f"{name} : {issue}")
+        seller, _ = _party(raw.get("seller"))
+        buyer, buyer_address = _party(raw.get("buyer"))
+        invoice = Invoice(
+            invoice_number=_text(raw.get("invoice_number")),
+            date=columns["date"][row],
+            due_date=columns["due_date"][row],
+            currency=currencies[row],
+            seller=seller,
+            buyer=buyer,
+            buyer_address=buyer_address,
+            items=items,
+            terms=_text(raw.get("terms")),
+            errors=issues,
+            **amounts,
+        )
+        _validate(invoice, raw)
+        invoices.append(invoice)
+    return invoices
+
+
+def normalize_invoice(raw: dict) -> Invoice:
+    return normalize_many([raw])[0]
+
+
+def attach_normalized(structured: dict) -> dict:
+    """
+    Résultat de structuration + sa forme normalisée (clé "normalized")
+    """
+    raw = {k: v for k, v in structured.items() if k != "normalized"}
+    return {**raw, "normalized": normalize_invoice(raw).to_record()}
+
+
+def invoice_of(structured) -> Invoice | None:
+    """
+    Facture typée d'un résultat stocké : relue depuis "normalized" si présent
+    (pas de ré-analyse), sinon normalisée à la volée (anciens fichiers)
+    """
+    if not isinstance(structured, dict):
+        return None
+    record = structured.get("normalized")
+    if isinstance(record, dict) and record.get("schema_version") == SCHEMA_VERSION:
+        return Invoice.from_record(record)
+    return normalize_invoice(structured)
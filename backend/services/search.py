@@ -0,0 +1,49 @@
+# search.py
+import re
+import unicodedata
+
+# 🔹 Syntaxe de recherche partagée ; l'index plein texte est la table FTS5
+#    de index_store.IndexStore (classement bm25)
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def fold(text: str) -> str:
+    """
+    Minuscules + suppression des accents ("Échéance" -> "echeance")
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(fold(text or ""))
+
+
+def parse_query(query: str) -> list[list[tuple[str, ...]]]:
+    """
+    Analyse une requête en groupes OR de clauses AND.
+
+    - mots séparés par des espaces : ET logique
+    - OR (ou "|") entre deux clauses : OU logique
+    - "expression entre guillemets" : recherche de phrase
+    - mot* : recherche par préfixe
+
+    Exemple : 'facture "net 30" OR avoir' -> [[("facture",), ("net", "30")], [("avoir",)]]
+    """
+    groups = [[]]
+    for phrase, word in QUERY_RE.findall(query or ""):
+        if word in ("OR", "|"):
+            if groups[-1]:
+                groups.append([])
+            continue
+        if phrase:
+            terms = tuple(tokenize(phrase))
+        elif word.endswith("*") and len(word) > 1:
+            terms = tuple(f"{t}*" for t in tokenize(word[:-1])[:1])
+        else:
+            terms = tuple(tokenize(word))
+        # Un mot composé ("T.V.A", "2024-01") devient une phrase
+        if terms:
+            groups[-1].append(terms)
+    return [g for g in groups if g]
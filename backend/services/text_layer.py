@@ -0,0 +1,173 @@
+# text_layer.py
+import os
+import re
+import time
+import logging
+import unicodedata
+from pathlib import Path
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Couche texte des PDF natifs (logiciels de facturation) : OCR distant évité
+# ----------------------
+
+# 🔹 OCR_TEXT_LAYER=0 désactive le chemin rapide (tout part à l'OCR distant)
+TEXT_LAYER_ENABLED = os.getenv("OCR_TEXT_LAYER", "1") != "0"
+
+# 🔹 Qualité minimale (0..1) du texte d'une page pour se passer de l'OCR
+TEXT_LAYER_MIN_QUALITY = float(os.getenv("OCR_TEXT_LAYER_MIN_QUALITY", "0.8"))
+MIN_PAGE_CHARS = 40
+
+# 🔹 Image couvrant au moins cette part de la page : page scannée (couche texte d'un OCR inconnu)
+SCAN_IMAGE_COVERAGE = 0.9
+
+# 🔹 Identifiant de "modèle" des pages extraites localement
+TEXT_LAYER_MODEL = "pdf-text-layer"
+
+_WORD_RE = re.compile(r"\S+")
+_ALLOWED_PUNCTUATION = set(".,;:!?'\"()[]{}-–—_/\\%€$£+*=<>#&@°§|~^`«»’‘“”…")
+
+
+def _pymupdf():
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            import fitz as pymupdf
+        except ImportError as e:
+            raise ImportError("❌ La lecture de la couche texte nécessite PyMuPDF (pip install pymupdf)") from e
+    return pymupdf
+
+
+def text_quality(text: str) -> float:
+    """
+    Score 0..1 d'un texte extrait : part de caractères lisibles × part de
+    mots plausibles. Les polices mal encodées (glyphes privés, U+FFFD,
+    caractères de contrôle) et les pages quasi vides donnent un score bas.
+    """
+    stripped = text.strip()
+    if len(stripped) < MIN_PAGE_CHARS:
+        return 0.0
+    good = 0
+    for c in stripped:
+        if c.isalnum() or c.isspace() or c in _ALLOWED_PUNCTUATION:
+            good += 1
+        elif unicodedata.category(c) in ("Co", "Cc", "Cs", "Cn") or c == "�":
+            continue
+        else:
+            # Autres symboles : tolérés à moitié
+            good += 0.5
+    # 🔹 Ponctuation isolée (":", "€", "-") ignorée ; les autres mots doivent contenir des lettres/chiffres
+    words = [w for w in _WORD_RE.findall(stripped) if not set(w) <= _ALLOWED_PUNCTUATION]
+    plausible = sum(1 for w in words if len(w) <= 40 and any(c.isalnum() for c in w))
+    return (good / len(stripped)) * (plausible / len(words) if words else 0.0)
+
+
+def _image_coverage(page) -> float:
+    area = abs(page.rect) or 1.0
+    largest = 0.0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        largest = max(largest, abs((x1 - x0) * (y1 - y0)))
+    return min(1.0, largest / area)
+
+
+def extract_text_layer(file_path: str, min_quality: float = TEXT_LAYER_MIN_QUALITY) -> list[dict | None]:
+    """
+    Pages d'un PDF au format de la réponse OCR (index, markdown, images,
+    dimensions) quand leur couche texte est exploitable ; None pour les
+    pages scannées ou illisibles (à envoyer à l'OCR distant).
+    """
+    pymupdf = _pymupdf()
+    pages = []
+    with metrics.timer("text_layer", file=Path(file_path).name) as obs, pymupdf.open(file_path) as doc:
+        for index, page in enumerate(doc):
+            text = page.get_text("text", sort=True)
+            quality = text_quality(text)
+            if quality < min_quality or _image_coverage(page) >= SCAN_IMAGE_COVERAGE:
+                pages.append(None)
+                continue
+            pages.append({
+                "index": index,
+                "markdown": text.strip(),
+                "images": [],
+                "dimensions": {"dpi": 72, "height": int(page.rect.height), "width": int(page.rect.width)},
+                "source": "text_layer",
+                "text_quality": round(quality, 3),
+            })
+        obs["pages"] = len(pages)
+        obs["local_pages"] = sum(1 for p in pages if p is not None)
+    return pages
+
+
+def text_layer_pages(file_path: str, mime_type: str, enabled: bool = TEXT_LAYER_ENABLED) -> list[dict | None] | None:
+    """
+    Couche texte des PDF (None : fichier image, chemin rapide désactivé,
+    PyMuPDF absent ou PDF illisible localement -> tout part à l'OCR distant)
+    """
+    if not enabled or mime_type != "application/pdf":
+        return None
+    start = time.perf_counter()
+    try:
+        pages = extract_text_layer(file_path)
+    except ImportError as e:
+        logger.warning("⚠️ %s : couche texte ignorée", e)
+        return None
+    except Exception as e:
+        logger.warning("⚠️ Couche texte illisible pour %s : %s", file_path, e)
+        return None
+    local = sum(1 for p in pages if p is not None)
+    logger.info("📄 Couche texte %s : %d/%d page(s) exploitable(s) en %.0f ms", Path(file_path).name, local,
+                len(pages), (time.perf_counter() - start) * 1000)
+    return pages
+
+
+def _match_remote_pages(missing: list[int], remote_pages: list[dict]) -> dict[int, dict]:
+    """
+    Pages distantes rattachées aux pages demandées : par index du document,
+    ou par position si l'API a renuméroté 0..n. Une page demandée sans
+    réponse lève une erreur (pas de texte décalé ni de page perdue en silence).
+    """
+    indices = [p.get("index", 0) for p in remote_pages]
+    if len(set(indices)) == len(indices) and set(indices) <= set(missing):
+        filled = {p.get("index", 0): p for p in remote_pages}
+    elif sorted(indices) == list(range(len(missing))):
+        filled = dict(zip(missing, sorted(remote_pages, key=lambda p: p.get("index", 0))))
+    else:
+        filled = {}
+    lost = [i + 1 for i in missing if i not in filled]
+    if lost:
+        raise RuntimeError(f"❌ OCR distant incomplet : page(s) {', '.join(map(str, lost))} sans réponse "
+                           f"(pages reçues : {sorted(indices)})")
+    return filled
+
+
+def merge_pages(local_pages: list[dict | None], remote: dict | None) -> dict:
+    """
+    Résultat OCR complet : pages locales + pages de l'OCR distant (remote,
+    demandé uniquement pour les pages manquantes), dans l'ordre du document.
+    Sans remote (tout est local ou rien n'a été demandé), seules les pages
+    locales sont gardées.
+    """
+    remote = remote or {}
+    missing = [i for i, page in enumerate(local_pages) if page is None]
+    filled = _match_remote_pages(missing, remote.get("pages") or []) if remote else {}
+    pages = []
+    for i, page in enumerate(local_pages):
+        if page is None:
+            if i not in filled:
+                continue
+            page = {**filled[i], "index": i, "source": "ocr"}
+        pages.append(page)
+    usage = dict(remote.get("usage_info") or {})
+    usage["pages_processed"] = len(filled)
+    return {
+        **{k: v for k, v in remote.items() if k not in ("pages", "usage_info")},
+        "model": remote.get("model") or TEXT_LAYER_MODEL,
+        "pages": pages,
+        "usage_info": usage,
+        "text_layer_pages": len(local_pages) - len(missing),
+    }
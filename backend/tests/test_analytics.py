@@ -0,0 +1,99 @@
+import pytest
+
+from backend.benchmarks.corpus import make_entries
+from backend.services.index_store import IndexStore
+
+pytest.importorskip("pyarrow")
+
+from backend.services.analytics import export_analytics, open_dataset, totals_by_seller_month  # noqa: E402
+
+
+def _count(name, export_dir):
+    return open_dataset(name, export_dir).count_rows()
+
+
+def test_export_is_incremental_and_follows_updates_and_deletes(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    entries = make_entries(20)
+    store.upsert_many(entries)
+    out = str(tmp_path / "analytics")
+    n_items = sum(len(e["structured_json"]["items"]) for e in entries)
+
+    summary = export_analytics(store, out, batch_size=7)
+    assert summary["documents_written"] == 20
+    assert _count("documents", out) == 20
+    assert _count("items", out) == n_items
+
+    # Rien de changé : aucun fichier écrit
+    assert export_analytics(store, out)["documents_written"] == 0
+
+    changed = dict(entries[0], structured_json={**entries[0]["structured_json"], "items": [], "date": "01/01/2019"})
+    store.upsert(changed)
+    store.delete([entries[1]["file_name"]])
+    summary = export_analytics(store, out)
+    assert (summary["documents_written"], summary["documents_removed"]) == (1, 1)
+    assert _count("documents", out) == 19
+    expected_items = n_items - sum(len(e["structured_json"]["items"]) for e in entries[:2])
+    assert _count("items", out) == expected_items
+
+    docs = open_dataset("documents", out).to_table().to_pylist()
+    moved = next(d for d in docs if d["file_name"] == entries[0]["file_name"])
+    assert moved["year_month"] == "2019-01"
+
+
+def test_totals_by_seller_month_match_source(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    entries = make_entries(30)
+    store.upsert_many(entries)
+    out = str(tmp_path / "analytics")
+    export_analytics(store, out, fmt="arrow")
+
+    totals = totals_by_seller_month(out).to_pylist()
+    assert sum(row["amount_count"] for row in totals) == sum(len(e["structured_json"]["items"]) for e in entries)
+    expected = sum(i["montant"] for e in entries for i in e["structured_json"]["items"])
+    assert sum(row["amount_sum"] for row in totals) == pytest.approx(expected)
+
+
+def test_interrupted_export_leaves_no_duplicates(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    store.upsert_many(make_entries(5))
+    out = tmp_path / "analytics"
+    export_analytics(store, str(out))
+    # Fichier écrit sans mise à jour du manifeste (crash) : supprimé au prochain export
+    stray = next((out / "items").glob("year_month=*/*.parquet"))
+    stray.with_name("part-crash.parquet").write_bytes(stray.read_bytes())
+
+    assert export_analytics(store, str(out))["orphans_removed"] == 1
+    assert _count("documents", str(out)) == 5
+
+
+def test_late_commit_with_older_timestamp_is_exported_and_reads_are_paged(tmp_path, monkeypatch):
+    from backend.services import index_store
+
+    store = IndexStore(str(tmp_path / "index.db"))
+    entries = make_entries(6)
+    store.upsert_many(entries[:5])
+    out = str(tmp_path / "analytics")
+    export_analytics(store, out)
+
+    # Écrivain concurrent : heure prise avant le dernier export, commit après
+    monkeypatch.setattr(index_store.time, "time", lambda: 0.0)
+    store.upsert(entries[5])
+    monkeypatch.undo()
+
+    pages = []
+    entries_since = store.entries_since
+
+    def spy(seq=0, limit=None):
+        page = entries_since(seq, limit)
+        pages.append((limit, len(page)))
+        return page
+
+    monkeypatch.setattr(store, "entries_since", spy)
+    assert export_analytics(store, out, batch_size=2)["documents_written"] == 1
+    assert _count("documents", out) == 6
+
+    store.upsert_many([dict(e, file_name=f"copie_{e['file_name']}") for e in entries[:5]])
+    pages.clear()
+    assert export_analytics(store, out, batch_size=2)["documents_written"] == 5
+    assert all(limit == 2 and n <= 2 for limit, n in pages)
@@ -0,0 +1,112 @@
+import json
+import time
+import hashlib
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("multipart")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend.benchmarks.corpus import invoice_structured  # noqa: E402
+from backend.services import api  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_run_ocr(file_path, output_folder):
+        calls.append(file_path)
+        if "broken" in file_path:
+            raise RuntimeError("OCR impossible")
+        path = Path(output_folder) / f"{Path(file_path).stem}_ocr_result.json"
+        path.write_text(json.dumps({"full_text": f"Facture {Path(file_path).stem}", "num_pages": 1}), encoding="utf-8")
+        return str(path)
+
+    def fake_structure_ocr(ocr_json_path, output_folder):
+        structured = invoice_structured(ocr_json_path)
+        path = Path(output_folder) / f"{Path(ocr_json_path).stem}_structured.json"
+        path.write_text(json.dumps(structured), encoding="utf-8")
+        return str(path), structured
+
+    monkeypatch.setattr(api, "run_ocr", fake_run_ocr)
+    monkeypatch.setattr(api, "structure_ocr", fake_structure_ocr)
+    (tmp_path / "out").mkdir()
+    app = api.create_app(upload_dir=str(tmp_path / "uploads"), output_folder=str(tmp_path / "out"),
+                         queue_file=str(tmp_path / "jobs.db"), db_file=str(tmp_path / "index.db"),
+                         workers=2, max_upload_bytes=1024, max_attempts=1)
+    with TestClient(app) as test_client:
+        test_client.ocr_calls = calls
+        yield test_client
+
+
+def _wait(client, job_id, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["done"]:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} non terminé")
+
+
+def test_upload_process_and_search(client):
+    res = client.post("/jobs", files={"file": ("facture 1.pdf", b"%PDF-1.4 a", "application/pdf")})
+    assert res.status_code == 202
+    job = _wait(client, res.json()["job_id"])
+    assert job["state"] == "structured"
+    assert job["file_name"].endswith("_facture_1.pdf")
+
+    result = client.get(f"/jobs/{job['job_id']}/result").json()
+    assert result["total"] is not None
+
+    found = client.get("/search", params={"q": "facture"}).json()
+    assert found["total_count"] == 1
+    assert "full_text" not in found["results"][0]
+    assert found["results"][0]["file_hash"] == hashlib.sha256(b"%PDF-1.4 a").hexdigest()
+    facets = client.get("/search/facets").json()
+    assert facets["facets"]["seller"][0]["count"] == 1
+
+    # Même contenu renvoyé : même job, pas de nouvel OCR
+    again = client.post("/jobs/stream", params={"filename": "facture 1.pdf"}, content=b"%PDF-1.4 a")
+    assert again.json()["job_id"] == job["job_id"]
+    assert len(client.ocr_calls) == 1
+
+
+def test_index_entry_rehashes_files_uploaded_with_a_short_prefix(tmp_path):
+    content = b"%PDF-1.4 ancien"
+    path = tmp_path / f"{hashlib.sha256(content).hexdigest()[:16]}_facture.pdf"
+    path.write_bytes(content)
+    ocr = tmp_path / "ocr.json"
+    ocr.write_text(json.dumps({"full_text": "Facture", "num_pages": 1}), encoding="utf-8")
+    entry = api.index_entry(str(path), str(ocr), "structured.json", {})
+    assert entry["file_hash"] == hashlib.sha256(content).hexdigest()
+
+
+def test_bulk_rejects_bad_files_and_reports_failures(client):
+    res = client.post("/jobs/bulk", files=[
+        ("files", ("a.pdf", b"%PDF a", "application/pdf")),
+        ("files", ("broken.pdf", b"%PDF b", "application/pdf")),
+        ("files", ("notes.txt", b"hello", "text/plain")),
+        ("files", ("big.pdf", b"x" * 2048, "application/pdf")),
+    ]).json()
+    assert [r["status_code"] for r in res["rejected"]] == [415, 413]
+    states = {j["file_name"].split("_", 1)[1]: _wait(client, j["job_id"])["state"] for j in res["jobs"]}
+    assert states == {"a.pdf": "structured", "broken.pdf": "failed"}
+
+    broken = next(j for j in res["jobs"] if j["file_name"].endswith("broken.pdf"))
+    assert client.get(f"/jobs/{broken['job_id']}/result").status_code == 409
+    assert client.post(f"/jobs/{broken['job_id']}/retry").status_code == 202
+
+
+def test_events_stream_until_done(client):
+    job_id = client.post("/jobs", files={"file": ("sse.pdf", b"%PDF sse", "application/pdf")}).json()["job_id"]
+    with client.stream("GET", f"/jobs/{job_id}/events") as res:
+        assert res.headers["content-type"].startswith("text/event-stream")
+        events = [json.loads(line[len("data: "):]) for line in res.iter_lines() if line.startswith("data: ")]
+    assert events[-1]["state"] == "structured"
+    assert client.get("/jobs/999").status_code == 404
@@ -0,0 +1,119 @@
+import importlib.util
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="module")
+def workflow():
+    # backend/app.py importe ses services en "services.X" (lancé depuis backend/)
+    sys.path.insert(0, str(BACKEND_DIR))
+    try:
+        spec = importlib.util.spec_from_file_location("backend_workflow", BACKEND_DIR / "app.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        yield module
+    finally:
+        sys.path.remove(str(BACKEND_DIR))
+
+
+def test_bulk_rejects_options_it_cannot_apply(workflow, tmp_path):
+    for options in ({"dedup": object()}, {"multi_page": True}, {"resume": True},
+                    {"preprocess": workflow.PreprocessConfig()}):
+        with pytest.raises(ValueError, match=next(iter(options))):
+            workflow.process_folder(str(tmp_path), bulk=True, **options)
+
+
+def test_preprocess_totals_are_per_batch(workflow, tmp_path, monkeypatch):
+    files = {}
+    for batch in ("a", "b"):
+        files[batch] = [str(tmp_path / f"{batch}{i}.png") for i in range(2 if batch == "a" else 3)]
+    both_started = threading.Barrier(2)
+
+    def fake_run_ocr(file_path, output_folder, preprocess):
+        if file_path.endswith("0.png"):
+            both_started.wait(timeout=5)
+        preprocess.stats.add(SimpleNamespace(original_bytes=100, output_bytes=40, seconds=0.01))
+        return f"{file_path}.json"
+
+    monkeypatch.setattr(workflow, "run_ocr", fake_run_ocr)
+    monkeypatch.setattr(workflow, "structure_ocr", lambda path, output_folder, multi_page: (path, None))
+    shared = workflow.PreprocessConfig()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        runs = {batch: pool.submit(workflow.process_batch, paths, str(tmp_path), max_workers=1, preprocess=shared)
+                for batch, paths in files.items()}
+    summaries = {batch: run.result()["summary"] for batch, run in runs.items()}
+
+    assert summaries["a"]["preprocessed_images"] == 2 and summaries["b"]["preprocessed_images"] == 3
+    assert summaries["b"]["preprocess_bytes_saved"] == 180
+    assert shared.stats.snapshot()["images"] == 0
+
+
+class StageProbe:
+    """
+    Faux étage : mesure le nombre maximal d'appels simultanés
+    """
+
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.lock = threading.Lock()
+        self.active = self.peak = 0
+
+    def run(self, file_path):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.02)
+            if Path(file_path).stem.removesuffix("_ocr_result") in self.fail_on:
+                raise RuntimeError(f"échec {Path(file_path).name}")
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def _probe_stages(workflow, monkeypatch, ocr_fail=(), structure_fail=()):
+    ocr, structure = StageProbe(ocr_fail), StageProbe(structure_fail)
+
+    def fake_run_ocr(file_path, output_folder, preprocess):
+        ocr.run(file_path)
+        return str(Path(output_folder) / f"{Path(file_path).stem}_ocr_result.json")
+
+    def fake_structure_ocr(ocr_json_path, output_folder, multi_page):
+        structure.run(ocr_json_path)
+        return ocr_json_path.replace("_ocr_result", "_structured"), {}
+
+    monkeypatch.setattr(workflow, "run_ocr", fake_run_ocr)
+    monkeypatch.setattr(workflow, "structure_ocr", fake_structure_ocr)
+    return ocr, structure
+
+
+def test_batch_respects_per_stage_concurrency(workflow, tmp_path, monkeypatch):
+    ocr, structure = _probe_stages(workflow, monkeypatch)
+    files = [str(tmp_path / f"doc{i}.pdf") for i in range(12)]
+    batch = workflow.process_batch(files, str(tmp_path), max_workers=6, ocr_concurrency=3, structure_concurrency=1)
+
+    assert batch["summary"]["succeeded"] == 12
+    assert ocr.peak == 3 and structure.peak == 1
+    assert [r["file"] for r in batch["results"]] == files
+
+
+def test_failed_file_does_not_stop_the_batch(workflow, tmp_path, monkeypatch):
+    _probe_stages(workflow, monkeypatch, ocr_fail={"doc1"}, structure_fail={"doc3"})
+    for i in range(5):
+        (tmp_path / f"doc{i}.pdf").write_bytes(b"%PDF-1.4")
+    batch = workflow.process_folder(str(tmp_path), output_folder=str(tmp_path / "out"), max_workers=3)
+
+    by_name = {Path(r["file"]).name: r for r in batch["results"]}
+    assert batch["summary"]["succeeded"] == 3 and batch["summary"]["failed"] == 2
+    assert by_name["doc1.pdf"]["error"] == "RuntimeError: échec doc1.pdf"
+    assert by_name["doc1.pdf"]["structured_json_path"] is None
+    assert by_name["doc3.pdf"]["status"] == "failed" and by_name["doc3.pdf"]["ocr_json_path"]
+    assert by_name["doc4.pdf"]["structured_json_path"].endswith("doc4_structured.json")
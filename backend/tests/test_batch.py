@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+pytest.importorskip("mistralai")
+pytest.importorskip("httpx")
+
+from backend.benchmarks.mock_mistral import MockMistralServer  # noqa: E402
+from backend.services import batch, mistral_client  # noqa: E402
+from backend.services.index_store import IndexStore  # noqa: E402
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    def start(**kwargs):
+        server = MockMistralServer(latency_ms=0, jitter_ms=0, pages_per_doc=1, seed=0, **kwargs).start()
+        monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+        monkeypatch.setenv("MISTRAL_SERVER_URL", server.url)
+        mistral_client.reset_client()
+        servers.append(server)
+        return server
+
+    servers = []
+    yield start
+    for server in servers:
+        server.stop()
+    mistral_client.reset_client()
+
+
+def _files(tmp_path, n):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    paths = []
+    for i in range(n):
+        path = inbox / f"scan_{i}.png"
+        path.write_bytes(b"\x89PNG\r\n\x1a\n" + bytes([i]) * 64)
+        paths.append(str(path))
+    return paths
+
+
+def _run(files, tmp_path, **kwargs):
+    return batch.run_batch(files, output_folder=str(tmp_path / "out"), db_file=str(tmp_path / "index.db"),
+                           poll_seconds=0.05, use_cache=False, **kwargs)
+
+
+def test_batch_fans_results_out_to_files_and_index(tmp_path, mock_server):
+    server = mock_server()
+    files = _files(tmp_path, 3)
+    result = _run(files, tmp_path)
+
+    assert result["summary"]["succeeded"] == 3
+    assert server.counts["batch_jobs"] == 2  # un job OCR + un job de structuration
+    assert server.counts["ocr"] == 0 and server.counts["chat"] == 0
+    for r in result["results"]:
+        assert r["status"] == "ok"
+        with open(r["structured_json_path"], encoding="utf-8") as f:
+            assert "normalized" in json.load(f)
+    assert IndexStore(str(tmp_path / "index.db")).count() == 3
+    assert not (tmp_path / "out" / batch.STATE_FILE_NAME).exists()
+
+    # Résultats à jour : rien n'est soumis à nouveau
+    again = _run(files, tmp_path)
+    assert again["summary"]["succeeded"] == 3
+    assert server.counts["batch_jobs"] == 2
+
+
+def test_batch_reports_failed_requests(tmp_path, mock_server):
+    mock_server(batch_error_rate=1.0)
+    result = _run(_files(tmp_path, 2), tmp_path)
+    assert result["summary"]["failed"] == 2
+    assert all("mock batch request error" in r["error"] for r in result["results"])
+
+
+def test_batch_resumes_pending_jobs(tmp_path, mock_server):
+    server = mock_server(batch_seconds=0.5)
+    files = _files(tmp_path, 2)
+    first = _run(files, tmp_path, timeout_seconds=0.0)
+    assert first["summary"]["pending"] == 2
+    assert (tmp_path / "out" / batch.STATE_FILE_NAME).exists()
+
+    # Relance : le job OCR déjà soumis est suivi, pas soumis à nouveau
+    second = _run(files, tmp_path)
+    assert second["summary"]["succeeded"] == 2
+    assert server.counts["batch_jobs"] == 2
+
+
+def test_pack_respects_request_and_byte_limits(monkeypatch):
+    monkeypatch.setattr(batch, "MAX_BATCH_REQUESTS", 2)
+    monkeypatch.setattr(batch, "MAX_BATCH_BYTES", 10)
+    lines = [("x" * 4, {"custom_id": str(i)}) for i in range(5)]
+    assert [len(chunk) for chunk in batch._pack(lines)] == [2, 2, 1]
+
+
+def test_jobs_are_built_and_sent_one_at_a_time(tmp_path, mock_server, monkeypatch):
+    server = mock_server()
+    monkeypatch.setattr(batch, "MAX_BATCH_REQUESTS", 1)
+    jobs_sent_at_build = []
+
+    def build_body():
+        jobs_sent_at_build.append(server.counts["batch_jobs"])
+        return {"messages": []}
+
+    state = batch.BatchState(str(tmp_path / "state.json"))
+    requests = [(str(i), build_body, {"custom_id": str(i), "file": f"f{i}"}) for i in range(3)]
+    job_ids, rejected = batch._submit(state, "structure", batch.CHAT_ENDPOINT, "model", requests)
+    assert len(job_ids) == 3 and rejected == {}
+    # Chaque corps n'est construit qu'une fois le job précédent envoyé
+    assert jobs_sent_at_build == [0, 1, 2]
+
+
+def test_request_over_the_job_byte_cap_is_rejected(tmp_path, mock_server, monkeypatch):
+    server = mock_server()
+    files = _files(tmp_path, 2)
+    with open(files[1], "ab") as f:
+        f.write(b"\0" * 4096)
+    monkeypatch.setattr(batch, "MAX_BATCH_BYTES", 2048)
+    result = _run(files, tmp_path)
+
+    by_file = {r["file"]: r for r in result["results"]}
+    assert by_file[files[0]]["status"] == "ok"
+    assert by_file[files[1]]["status"] == "failed" and "OCR_BATCH_MAX_BYTES" in by_file[files[1]]["error"]
+    assert server.counts["batch_jobs"] == 2
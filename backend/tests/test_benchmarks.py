@@ -0,0 +1,86 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from backend.benchmarks.mock_mistral import MockMistralServer
+from backend.benchmarks.run import compare_to_baseline, percentile, run_benchmarks, run_case
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def test_mock_server_serves_ocr_and_chat():
+    with MockMistralServer(latency_ms=0, jitter_ms=0, pages_per_doc=3, seed=0) as server:
+        ocr = post(f"{server.url}/v1/ocr", {"model": "mistral-ocr-latest", "document": {"document_url": "x"}})
+        chat = post(f"{server.url}/v1/chat/completions", {"messages": [{"role": "user", "content": "hi"}]})
+
+    assert len(ocr["pages"]) == 3
+    assert "FACTURE" in ocr["pages"][0]["markdown"]
+    assert json.loads(chat["choices"][0]["message"]["content"])["total"] > 0
+    assert chat["usage"]["total_tokens"] > 0
+    assert server.counts["ocr"] == 1 and server.counts["chat"] == 1
+
+
+def test_mock_server_injects_transient_errors():
+    with MockMistralServer(latency_ms=0, jitter_ms=0, error_rate=1.0, seed=0) as server:
+        with pytest.raises(urllib.error.HTTPError) as exc:
+            post(f"{server.url}/v1/ocr", {})
+    assert exc.value.code in (429, 503)
+    assert server.counts["errors"] == 1
+
+
+def test_percentile_interpolates():
+    assert percentile([], 50) is None
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5], 95) == 5
+
+
+def test_search_case_reports_latencies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    result = run_case("search", 20, str(tmp_path / "work"), {"query_rounds": 1})
+    assert result["items"] > 0
+    assert result["p50_ms"] is not None and result["p95_ms"] >= result["p50_ms"]
+
+
+def test_compare_to_baseline_flags_throughput_drops():
+    baseline = [{"stage": "index", "size": 100, "docs_per_second": 100.0}]
+    assert compare_to_baseline([{"stage": "index", "size": 100, "docs_per_second": 90.0}], baseline) == []
+    assert len(compare_to_baseline([{"stage": "index", "size": 100, "docs_per_second": 50.0}], baseline)) == 1
+
+
+def test_source_files_are_pdfs_mixing_text_and_scanned_pages(tmp_path):
+    pytest.importorskip("pymupdf")
+    from backend.benchmarks.corpus import write_source_files
+    from backend.services.text_layer import extract_text_layer
+
+    paths = write_source_files(str(tmp_path), 6, size_kb=16, pages_per_doc=2)
+    pages = [page for path in paths for page in extract_text_layer(path)]
+    assert len(pages) == 12
+    assert any(p is None for p in pages) and any(p is not None for p in pages)
+    assert all("FACTURE" in p["markdown"] for p in pages if p is not None)
+    assert all((tmp_path / path).stat().st_size >= 16 * 1024 for path in paths)
+
+
+def test_ocr_stage_runs_on_generated_pdfs(tmp_path, monkeypatch):
+    pytest.importorskip("pymupdf")
+    pytest.importorskip("mistralai")
+    from backend.services import mistral_client
+
+    # run_benchmarks écrit ces variables : restaurées par monkeypatch en fin de test
+    for name in ("MISTRAL_SERVER_URL", "OCR_CACHE_DISABLED", "OCR_BLOB_DIR"):
+        monkeypatch.setenv(name, "")
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    monkeypatch.chdir(tmp_path)
+    mistral_client.reset_client()
+    try:
+        [result] = run_benchmarks(stages=("ocr",), sizes=(4,), latency_ms=0, jitter_ms=0, pages_per_doc=2,
+                                  concurrency=2, source_kb=8, isolate=False)
+    finally:
+        mistral_client.reset_client()
+    assert result["items"] == 4 and result["p50_ms"] is not None
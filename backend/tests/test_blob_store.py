@@ -0,0 +1,64 @@
+import base64
+import hashlib
+import json
+import os
+
+from backend.services.blob_store import (
+    blob_path,
+    extract_images,
+    load_blob,
+    load_image_data_uri,
+    save_blob,
+    strip_ocr_file,
+)
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+
+def test_blobs_are_addressed_by_content(tmp_path):
+    blob_id = save_blob(PNG, "png", str(tmp_path))
+    assert blob_id == f"{hashlib.sha256(PNG).hexdigest()}.png"
+    assert blob_path(blob_id, str(tmp_path)) == str(tmp_path / blob_id[:2] / blob_id)
+    assert load_blob(blob_id, str(tmp_path)) == PNG
+    assert save_blob(PNG + b"x", "png", str(tmp_path)) != blob_id
+
+
+def test_identical_content_is_written_once(tmp_path):
+    blob_id = save_blob(PNG, "png", str(tmp_path))
+    path = blob_path(blob_id, str(tmp_path))
+    os.utime(path, ns=(0, 0))
+
+    assert save_blob(PNG, ".png", str(tmp_path)) == blob_id
+    assert os.stat(path).st_mtime_ns == 0
+    assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == [blob_id]
+
+
+def test_ocr_images_are_moved_out_and_read_back(tmp_path):
+    encoded = base64.b64encode(PNG).decode("ascii")
+    ocr_path = tmp_path / "doc_ocr_result.json"
+    ocr_path.write_text(json.dumps({"pages": [
+        {"markdown": "p1", "images": [{"id": "img-0.png", "image_base64": f"data:image/png;base64,{encoded}"}]},
+        {"markdown": "p2", "images": [{"id": "img-1.jpeg", "image_base64": encoded}, {"id": "img-2"}]},
+    ]}), encoding="utf-8")
+
+    blob_dir = str(tmp_path / "blobs")
+    assert strip_ocr_file(str(ocr_path), blob_dir) == 2
+    pages = json.loads(ocr_path.read_text(encoding="utf-8"))["pages"]
+    first, second = pages[0]["images"][0], pages[1]["images"][0]
+    assert "image_base64" not in first and "image_base64" not in second
+    # Même contenu : une seule copie, extension tirée du mime puis du nom de l'image
+    assert first["image_blob_id"].split(".")[0] == second["image_blob_id"].split(".")[0]
+    assert first["image_blob_id"].endswith(".png") and second["image_blob_id"].endswith(".jpeg")
+    assert load_image_data_uri(first["image_blob_id"], blob_dir) == f"data:image/png;base64,{encoded}"
+    assert extract_images({"pages": pages}, blob_dir) == 0
+
+
+def test_concurrent_writers_of_the_same_blob(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    data = PNG * 50000
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        ids = list(pool.map(lambda _: save_blob(data, "png", str(tmp_path)), range(32)))
+    assert len(set(ids)) == 1
+    assert load_blob(ids[0], str(tmp_path)) == data
+    assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == [ids[0]]
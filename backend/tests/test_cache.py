@@ -0,0 +1,46 @@
+import os
+import time
+
+from backend.services.cache import ResultCache, make_cache_key, hash_file
+
+
+def test_cache_roundtrip_and_counters(tmp_path):
+    cache = ResultCache("ocr", cache_dir=str(tmp_path))
+    key = make_cache_key("abc", "mistral-ocr-latest", "ocr-v1")
+
+    assert cache.get(key) is None
+    cache.set(key, {"pages": [{"markdown": "Facture"}]})
+    assert cache.get(key) == {"pages": [{"markdown": "Facture"}]}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_key_depends_on_model_and_prompt_version():
+    base = make_cache_key("abc", "model-a", "v1")
+    assert base != make_cache_key("abc", "model-b", "v1")
+    assert base != make_cache_key("abc", "model-a", "v2")
+
+
+def test_hash_file_is_content_addressed(tmp_path):
+    a = tmp_path / "a.pdf"
+    b = tmp_path / "b.pdf"
+    a.write_bytes(b"%PDF-1.4 same")
+    b.write_bytes(b"%PDF-1.4 same")
+    assert hash_file(str(a)) == hash_file(str(b))
+
+
+def test_evict_by_age_and_size(tmp_path):
+    cache = ResultCache("structure", cache_dir=str(tmp_path), max_age_seconds=60, max_bytes=0)
+    cache.set("old", {"x": 1})
+    old_path = cache._path("old")
+    past = time.time() - 3600
+    os.utime(old_path, (past, past))
+    cache.set("new", {"x": 2})
+
+    assert cache.evict() == 1
+    assert cache.get("old") is None
+    assert cache.get("new") == {"x": 2}
+
+    cache.max_bytes = 1
+    assert cache.evict() == 1
+    assert cache.get("new") is None
@@ -0,0 +1,209 @@
+import json
+import random
+import shutil
+import sqlite3
+
+import pytest
+
+from backend.benchmarks.corpus import invoice_markdown
+from backend.services.dedup import DedupConfig, DedupIndex, dhash, hamming_similarity, simhash, _key
+
+pymupdf = pytest.importorskip("pymupdf")
+
+
+def _pdf(path, text, **save_options):
+    doc = pymupdf.open()
+    doc.new_page().insert_textbox(pymupdf.Rect(50, 50, 550, 800), text, fontsize=11)
+    doc.save(str(path), **save_options)
+    doc.close()
+    return str(path)
+
+
+def _ocr_json(tmp_path, stem, text):
+    path = tmp_path / f"{stem}_ocr_result.json"
+    path.write_text(json.dumps({"full_text": text}), encoding="utf-8")
+    return str(path)
+
+
+def _process(index, tmp_path, file_path, text):
+    """
+    Pipeline simulé : check_file -> OCR -> check_ocr -> structuration -> record_result
+    """
+    duplicate = index.check_file(file_path)
+    if duplicate is None:
+        ocr_json_path = _ocr_json(tmp_path, file_path.rsplit("/", 1)[-1], text)
+        duplicate = index.check_ocr(file_path, ocr_json_path)
+    if duplicate is None:
+        structured = tmp_path / f"{file_path.rsplit('/', 1)[-1]}_structured.json"
+        structured.write_text("{}", encoding="utf-8")
+        index.record_result(file_path, ocr_json_path, str(structured))
+    return duplicate
+
+
+def _noisy(text, rate, seed=1):
+    rng = random.Random(seed)
+    return " ".join(w if rng.random() > rate else w[:-1] + "l" for w in text.split())
+
+
+def test_resent_and_reexported_files_are_linked_before_ocr(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.db"))
+    text = invoice_markdown("fournisseur-1")
+    original = _pdf(tmp_path / "original.pdf", text)
+    assert _process(index, tmp_path, original, text) is None
+
+    copy = str(tmp_path / "copie.pdf")
+    shutil.copy(original, copy)
+    duplicate = _process(index, tmp_path, copy, text)
+    assert (duplicate.file_name, duplicate.kind, duplicate.similarity) == ("original.pdf", "sha256", 1.0)
+
+    # Même rendu, octets différents (ré-export compressé) : hash perceptuel
+    reexport = _pdf(tmp_path / "reexport.pdf", text, garbage=4, deflate=True)
+    duplicate = _process(index, tmp_path, reexport, text)
+    assert duplicate.kind == "dhash" and duplicate.file_name == "original.pdf"
+    assert duplicate.structured_json_path.endswith("original.pdf_structured.json")
+    assert {d["file_name"] for d in index.duplicates_of(original)} == {"copie.pdf", "reexport.pdf"}
+
+
+def test_rescanned_text_is_linked_but_other_invoice_is_not(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.db"), DedupConfig(image_threshold=1.01))
+    text = invoice_markdown("fournisseur-2")
+    assert index.check_ocr("a.pdf", _ocr_json(tmp_path, "a", text)) is None
+    index.record_result("a.pdf", "a_ocr.json", "a_structured.json")
+
+    duplicate = index.check_ocr("a_rescan.pdf", _ocr_json(tmp_path, "a_rescan", _noisy(text, 0.05)))
+    assert duplicate is not None and duplicate.kind == "simhash" and duplicate.file_name == "a.pdf"
+
+    # Même modèle de facture, autres montants : refusé par la comparaison des nombres
+    other = invoice_markdown("fournisseur-3")
+    assert index.check_ocr("b.pdf", _ocr_json(tmp_path, "b", other)) is None
+    assert index.stats() == {"original": 2, "simhash": 1}
+
+
+def test_threshold_controls_matching_and_full_scan_fallback(tmp_path):
+    text = invoice_markdown("fournisseur-4")
+    noisy = _noisy(text, 0.1, seed=3)
+    similarity = hamming_similarity(simhash(text), simhash(noisy), 64)
+
+    for threshold, expected in ((similarity + 0.01, False), (similarity - 0.01, True), (0.5, True)):
+        index = DedupIndex(str(tmp_path / f"dedup-{threshold}.db"), DedupConfig(text_threshold=threshold,
+                                                                                 numbers_threshold=0.0))
+        index.check_ocr("a.pdf", _ocr_json(tmp_path, "a", text))
+        index.record_result("a.pdf", "a_ocr.json", "a_structured.json")
+        assert (index.check_ocr("b.pdf", _ocr_json(tmp_path, "b", noisy)) is not None) is expected
+
+
+def test_default_text_threshold_uses_the_band_index(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.db"), DedupConfig(numbers_threshold=0.0))
+    text = invoice_markdown("fournisseur-5")
+    index.check_ocr("a.pdf", _ocr_json(tmp_path, "a", text))
+    index.record_result("a.pdf", "a_ocr.json", "a_structured.json")
+
+    # 16 bits d'écart (seuil 0.75), répartis sur toutes les bandes
+    value = simhash(text) ^ sum(0xF << shift for shift in (0, 16, 32, 48))
+    with index._connect() as conn:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        rows = index._candidates(conn, "simhash", value, index.config.text_threshold, _key("b.pdf"))
+    assert [row["file_name"] for row in rows] == ["a.pdf"]
+    assert any("FROM bands" in sql for sql in statements)
+
+
+def test_same_name_in_other_folders_keeps_its_own_row(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.db"))
+    first, second = tmp_path / "lot1", tmp_path / "lot2"
+    first.mkdir(), second.mkdir()
+    first_text, second_text = invoice_markdown("fournisseur-6"), "Bon de livraison\n" * 40
+    first_pdf = _pdf(first / "facture.pdf", first_text)
+    assert _process(index, tmp_path, first_pdf, first_text) is None
+    assert _process(index, tmp_path, _pdf(second / "facture.pdf", second_text), second_text) is None
+
+    copy = str(tmp_path / "copie.pdf")
+    shutil.copy(first_pdf, copy)
+    duplicate = index.check_file(copy)
+    assert (duplicate.kind, duplicate.file_path) == ("sha256", first_pdf)
+    assert index.stats() == {"original": 2, "sha256": 1}
+
+
+def test_duplicates_are_not_used_as_references(tmp_path):
+    db = str(tmp_path / "dedup.db")
+    text = invoice_markdown("fournisseur-7")
+    # Deux références indexées (correspondance SimHash désactivée) ...
+    setup = DedupIndex(db, DedupConfig(image_threshold=1.01, text_threshold=1.01))
+    for name, body in (("a.pdf", text), ("b.pdf", _noisy(text, 0.05))):
+        setup.check_ocr(name, _ocr_json(tmp_path, name, body))
+        setup.record_result(name, f"{name}_ocr.json", f"{name}_structured.json")
+
+    # ... puis b rattaché à a : il ne sert plus de référence
+    index = DedupIndex(db, DedupConfig(image_threshold=1.01, numbers_threshold=0.0))
+    assert index.check_ocr("b.pdf", _ocr_json(tmp_path, "b.pdf", _noisy(text, 0.05))).file_name == "a.pdf"
+    with index._connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM bands WHERE file_path = ?", (_key("b.pdf"),)).fetchone()[0] == 0
+        conn.execute("INSERT INTO bands SELECT kind, key, ? FROM bands WHERE file_path = ?",
+                     (_key("b.pdf"), _key("a.pdf")))
+        rows = index._candidates(conn, "simhash", simhash(text), index.config.text_threshold, _key("c.pdf"))
+    assert [row["file_name"] for row in rows] == ["a.pdf"]
+
+
+def test_fingerprints_keyed_by_name_are_migrated(tmp_path):
+    db = tmp_path / "dedup.db"
+    text = invoice_markdown("fournisseur-8")
+    with sqlite3.connect(db) as conn:
+        conn.execute("CREATE TABLE fingerprints (file_name TEXT PRIMARY KEY, file_path TEXT, sha256 TEXT, "
+                     "dhash TEXT, simhash TEXT, numbers TEXT, ocr_json_path TEXT, structured_json_path TEXT, "
+                     "duplicate_of TEXT, match_kind TEXT, similarity REAL, updated_at REAL)")
+        conn.execute("CREATE TABLE bands (kind TEXT, key INTEGER, file_name TEXT)")
+        conn.executemany("INSERT INTO fingerprints (file_name, file_path, simhash, structured_json_path, "
+                         "duplicate_of) VALUES (?, ?, ?, ?, ?)",
+                         [("a.pdf", "a.pdf", f"{simhash(text):x}", "a_structured.json", None),
+                          ("a2.pdf", "a2.pdf", f"{simhash(text):x}", None, "a.pdf")])
+    conn.close()
+
+    index = DedupIndex(str(db), DedupConfig(numbers_threshold=0.0))
+    assert {d["file_name"] for d in index.duplicates_of("a.pdf")} == {"a2.pdf"}
+    assert index.check_ocr("b.pdf", _ocr_json(tmp_path, "b", text)).file_path == _key("a.pdf")
+
+
+def test_dhash_separates_different_documents(tmp_path):
+    a = dhash(_pdf(tmp_path / "a.pdf", invoice_markdown("x")))
+    b = dhash(_pdf(tmp_path / "b.pdf", "Bon de livraison\n" * 40))
+    assert hamming_similarity(a, a, 256) == 1.0
+    assert hamming_similarity(a, b, 256) < 0.9
+
+
+def _template_invoice(number, total):
+    return (f"FACTURE N° {number}\nFournisseur : Atelier Dupont SARL\nClient : Martin & Fils\n"
+            f"Date : 12/03/2024\n\nDésignation          Qté   Prix\nPrestation          1     {total}\n\n"
+            f"Total HT : {total} EUR\nTVA 20 %\nTotal TTC : {total} EUR\n")
+
+
+def test_same_template_invoices_are_not_linked(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.db"))
+    first_text = _template_invoice("2024-0117", "1 250,00")
+    second_text = _template_invoice("2024-0342", "9 870,40")
+    first = _pdf(tmp_path / "first.pdf", first_text)
+    second = _pdf(tmp_path / "second.pdf", second_text)
+    assert hamming_similarity(dhash(first), dhash(second), 256) >= index.config.image_threshold
+
+    assert _process(index, tmp_path, first, first_text) is None
+    assert _process(index, tmp_path, second, second_text) is None
+
+
+def test_scanned_image_match_waits_for_ocr_numbers(tmp_path):
+    pytest.importorskip("PIL")
+    from PIL import Image
+
+    # SimHash désactivé : seule la correspondance dHash + nombres peut rattacher
+    index = DedupIndex(str(tmp_path / "dedup.db"), DedupConfig(text_threshold=1.01))
+    Image.new("L", (340, 320), 255).save(tmp_path / "scan.png")
+    Image.new("L", (340, 320), 255).save(tmp_path / "scan_copy.png", compress_level=1)
+    Image.new("L", (340, 320), 255).save(tmp_path / "other.png", compress_level=9)
+    text = _template_invoice("2024-0117", "1 250,00")
+    assert _process(index, tmp_path, str(tmp_path / "scan.png"), text) is None
+
+    # Même rendu, pas de couche texte : pas de décision avant l'OCR
+    assert index.check_file(str(tmp_path / "scan_copy.png")) is None
+    duplicate = index.check_ocr(str(tmp_path / "scan_copy.png"), _ocr_json(tmp_path, "scan_copy", text))
+    assert (duplicate.file_name, duplicate.kind) == ("scan.png", "dhash")
+
+    other = _template_invoice("2024-0342", "9 870,40")
+    assert _process(index, tmp_path, str(tmp_path / "other.png"), other) is None
@@ -0,0 +1,71 @@
+import json
+
+from backend.services import exporter
+from backend.services.exporter import _split_text, chunk_pages, estimate_tokens, merge_structured
+
+
+def test_split_text_prefers_line_breaks_and_cuts_long_lines():
+    text = "a" * 30 + "\n" + "b" * 30 + "\n"
+    assert _split_text(text, max_tokens=10) == ["a" * 30 + "\n", "b" * 30 + "\n"]
+
+    pieces = _split_text("c" * 100, max_tokens=10)
+    assert [len(p) for p in pieces] == [40, 40, 20]
+    assert "".join(pieces) == "c" * 100
+
+
+def test_chunk_pages_packs_pages_and_splits_oversized_ones():
+    pages = ["page un", "page deux", "x" * 400, "page quatre"]
+    chunks = chunk_pages(pages, max_tokens=40)
+    assert [c["pages"] for c in chunks][:1] == [[1, 2]]
+    assert all(c["pages"] == [3] for c in chunks[1:-1]) and len(chunks) > 3
+    assert chunks[-1]["pages"] == [4]
+    assert all(estimate_tokens(c["markdown"]) <= 41 for c in chunks)
+    # Rien n'est perdu : le texte des pages se retrouve dans l'ordre
+    joined = "".join(c["markdown"] for c in chunks)
+    assert joined.index("page deux") < joined.index("x" * 10) < joined.index("page quatre")
+    assert chunk_pages([""]) == [{"pages": [1], "markdown": "\n\n<!-- Page 1 -->\n\n"}]
+
+
+def test_merge_structured_concatenates_items_and_keeps_last_totals():
+    merged = merge_structured([
+        {"seller": "Dupont", "buyer": None, "items": [{"montant": 1}], "total": None},
+        {"seller": "Autre", "buyer": "Durand", "items": [{"montant": 2}], "total": "3,00"},
+    ])
+    assert merged == {"seller": "Dupont", "buyer": "Durand", "items": [{"montant": 1}, {"montant": 2}],
+                      "total": "3,00"}
+
+
+def test_merge_structured_skips_parts_that_are_not_objects():
+    report = [{"chunk": i, "pages": [i]} for i in (1, 2, 3)]
+    merged = merge_structured([{"total": "5"}, [{"montant": 1}], {"raw_output": "pas du JSON"}], report)
+    assert merged["total"] == "5"
+    assert merged["raw_output"] == [json.dumps([{"montant": 1}]), "pas du JSON"]
+    assert [e["chunk"] for e in merged["chunk_errors"]] == [2, 3]
+    assert "error" not in report[0] and report[1]["error"].startswith("réponse non structurée")
+
+
+def test_multipage_saves_chunk_errors(tmp_path, monkeypatch):
+    ocr_json = tmp_path / "doc_ocr_result.json"
+    # Deux pages de ~5000 tokens : deux morceaux, le second répond une liste
+    pages = [{"markdown": "a" * 20000}, {"markdown": "b" * 20000}]
+    ocr_json.write_text(json.dumps({"pages": pages}), encoding="utf-8")
+
+    def fake_chunk(index, chunk, total_chunks, use_cache, timeout_ms, ocr_json_path):
+        answer = {"total": "5"} if index == 1 else ["liste"]
+        return answer, {"chunk": index, "pages": chunk["pages"], "cached": True}
+
+    monkeypatch.setattr(exporter, "_structure_chunk", fake_chunk)
+    path, _ = exporter.structure_ocr(str(ocr_json), str(tmp_path), multi_page=True)
+    saved = json.loads(open(path, encoding="utf-8").read())
+    assert saved["chunk_errors"][0]["pages"] == [2]
+    assert any("raw_output" in e for e in saved["normalized"]["errors"])
+
+
+def test_repaired_json_is_marked_in_normalized_errors():
+    from backend.services.schema import attach_normalized
+
+    parsed = exporter.parse_structured_text('{"invoice_number": "F-1", "total": "12,00", "items": [{"descr',
+                                            finish_reason="length")
+    assert parsed["_repaired"] == "length" and parsed["invoice_number"] == "F-1"
+    assert any("JSON réparé" in e for e in attach_normalized(parsed)["normalized"]["errors"])
+    assert exporter.parse_structured_text('{"a": tr') == {"raw_output": '{"a": tr'}
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from backend.benchmarks.import_time import run_import_benchmark
+from backend.services import mistral_client
+
+
+def test_service_imports_are_lazy_and_side_effect_free():
+    results = run_import_benchmark(["backend.services.ocr_engine", "backend.services.exporter",
+                                    "backend.services.parser"], repeat=1)
+    for r in results:
+        assert "error" not in r, r
+        assert r["heavy_loaded"] == [], r["module"]
+        assert r["files_created"] == [], r["module"]
+
+
+def test_preprocessing_does_not_load_the_index_store():
+    code = ("import sys, backend.services.preprocessing; "
+            "print('backend.services.index_store' in sys.modules)")
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                          cwd=Path(__file__).resolve().parents[2])
+    assert proc.stdout.strip() == "False"
+
+
+def test_settings_are_resolved_on_first_use(monkeypatch, tmp_path):
+    monkeypatch.setattr(mistral_client, "ENV_FILE", str(tmp_path / "missing.env"))
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    monkeypatch.setenv("MISTRAL_SERVER_URL", "http://127.0.0.1:9999")
+    monkeypatch.setenv("MISTRAL_MAX_RETRIES", "2")
+    mistral_client.reset_client()
+    try:
+        settings = mistral_client.get_settings()
+        assert settings.api_key == "test-key"
+        assert settings.server_url == "http://127.0.0.1:9999"
+        assert settings.max_retries == 2
+    finally:
+        mistral_client.reset_client()
+
+
+def test_missing_api_key_raises_on_first_use(monkeypatch, tmp_path):
+    monkeypatch.setattr(mistral_client, "ENV_FILE", str(tmp_path / "missing.env"))
+    monkeypatch.setattr(mistral_client, "_streamlit_secret", lambda name: None)
+    monkeypatch.delenv("MISTRAL_API_KEY", raising=False)
+    mistral_client.reset_client()
+    try:
+        with pytest.raises(ValueError):
+            mistral_client.get_settings()
+    finally:
+        mistral_client.reset_client()
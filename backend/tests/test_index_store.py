@@ -0,0 +1,168 @@
+import json
+
+from backend.services.index_store import IndexStore, to_fts_query
+
+
+def make_entry(name, text, total=None, date=None, **extra):
+    return {
+        "file_name": name,
+        "document_type": "facture",
+        "full_text": text,
+        "structured_json": {"total": total, "date": date},
+        **extra,
+    }
+
+
+def test_upsert_replaces_by_file_name_and_keeps_extra_fields(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    store.upsert(make_entry("f1.pdf", "Facture Dupont", total="1 234,56 €", date="15/03/2024", path_file="up/f1.pdf"))
+    store.upsert(make_entry("f1.pdf", "Facture Durand", total="99", path_file="up/f1.pdf"))
+
+    assert store.count() == 1
+    entry = store.get("f1.pdf")
+    assert entry["full_text"] == "Facture Durand"
+    assert entry["path_file"] == "up/f1.pdf"
+    assert entry["structured_json"]["total"] == "99"
+
+
+def test_derived_columns_are_normalized(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    store.upsert(make_entry("f1.pdf", "x", total="1 234,56 €", date="15/03/2024"))
+    with store._connect() as conn:
+        row = conn.execute("SELECT doc_date, total FROM documents").fetchone()
+    assert row["doc_date"] == "2024-03-15"
+    assert row["total"] == 1234.56
+
+
+def test_fts_search_folds_accents_and_follows_deletes(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    store.upsert_many([
+        make_entry("f1.pdf", "Échéance net 30 jours"),
+        make_entry("f2.pdf", "Avoir sur facture"),
+    ])
+    assert [e["file_name"] for e in store.search("echeance")] == ["f1.pdf"]
+    assert {e["file_name"] for e in store.search("echeance OR avoir")} == {"f1.pdf", "f2.pdf"}
+    assert [e["file_name"] for e in store.search('"net 30"')] == ["f1.pdf"]
+
+    store.delete(["f1.pdf"])
+    assert store.search("echeance") == []
+
+
+def test_to_fts_query():
+    assert to_fts_query('fact* "net 30" OR avoir') == '("fact"* AND "net 30") OR ("avoir")'
+
+
+def test_migrate_from_json_runs_once(tmp_path):
+    index_file = tmp_path / "index.json"
+    index_file.write_text(json.dumps([make_entry("f1.pdf", "a"), make_entry("f2.pdf", "b")]), encoding="utf-8")
+    store = IndexStore(str(tmp_path / "index.db"))
+
+    assert store.migrate_from_json(str(index_file)) == 2
+    store.delete(["f2.pdf"])
+    assert store.migrate_from_json(str(index_file)) == 0
+    assert store.count() == 1
+
+
+def test_entries_expose_typed_columns_and_old_databases_are_upgraded(tmp_path):
+    db = tmp_path / "index.db"
+    store = IndexStore(str(db))
+    store.upsert(make_entry("f1.pdf", "x", total="1 234,56 €", date="15/03/2024"))
+    with store._connect() as conn:
+        conn.execute("DROP INDEX idx_documents_currency")
+        conn.execute("ALTER TABLE documents DROP COLUMN currency")
+    # Réouverture : colonne ajoutée et remplie pour les documents existants
+    store = IndexStore(str(db))
+
+    entry = store.get("f1.pdf")
+    assert (entry["doc_date"], entry["total"], entry["currency"]) == ("2024-03-15", 1234.56, "EUR")
+    # Les colonnes dérivées ne sont pas recopiées dans extra_json lors d'un nouvel upsert
+    store.upsert_many([{"file_name": "f1.pdf", "full_text": "y"}], merge=True)
+    assert store.get("f1.pdf")["total"] == 1234.56
+
+
+def _invoice_entry(name, text, seller, total, date):
+    return {"file_name": name, "document_type": "facture", "full_text": text,
+            "structured_json": {"seller": seller, "total": total, "date": date, "buyer": {"nom": "Mairie"}}}
+
+
+def _filled_store(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    store.upsert_many([
+        _invoice_entry("a.pdf", "Maintenance annuelle", "Dupont SARL", "120,00 €", "05/03/2024"),
+        _invoice_entry("b.pdf", "Licence logiciel", "DUPONT SARL", "980,00 €", "20/03/2024"),
+        _invoice_entry("c.pdf", "Maintenance serveur", "Garage Moreau", "45,50 €", "02/04/2024"),
+        _invoice_entry("d.pdf", "Papier A4", "Garage Moreau", "12 €", None),
+    ])
+    return store
+
+
+def test_query_combines_ranges_facets_and_full_text(tmp_path):
+    from backend.services.index_store import DocumentFilter
+
+    store = _filled_store(tmp_path)
+    names = lambda res: [e["file_name"] for e in res["results"]]  # noqa: E731
+
+    assert names(store.query(DocumentFilter(month="2024-03"), sort="date_asc")) == ["a.pdf", "b.pdf"]
+    assert names(store.query(DocumentFilter(total_min=40, total_max=500), sort="total_desc")) == ["a.pdf", "c.pdf"]
+    assert names(store.query(DocumentFilter(seller="dupont sarl"), sort="date_desc")) == ["b.pdf", "a.pdf"]
+    assert names(store.query(DocumentFilter(text="maintenance", date_from="2024-04-01"))) == ["c.pdf"]
+
+    page = store.query(DocumentFilter(), page=2, page_size=3, sort="total_asc")
+    assert (page["total_count"], page["pages"], names(page)) == (4, 2, ["b.pdf"])
+
+
+def test_facets_ignore_their_own_filter(tmp_path):
+    from backend.services.index_store import DocumentFilter
+
+    store = _filled_store(tmp_path)
+    facets = store.facets(DocumentFilter(seller="Garage Moreau", total_max=100))
+    # Casse ignorée : les deux graphies de Dupont sont regroupées
+    assert [(v.lower(), n) for v, n in facets["seller"]] == [("garage moreau", 2)]
+    facets = store.facets(DocumentFilter(seller="Garage Moreau"))
+    assert sorted((v.lower(), n) for v, n in facets["seller"]) == [("dupont sarl", 2), ("garage moreau", 2)]
+    assert facets["buyer"] == [("Mairie", 2)]
+    assert facets["currency"] == [("EUR", 2)]
+    assert store.ranges() == {"date": ("2024-03-05", "2024-04-02"), "total": (12.0, 980.0)}
+
+
+def test_version_changes_on_write(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    before = store.version()
+    assert store.version() == before
+    store.upsert(make_entry("f1.pdf", "x"))
+    assert store.version() != before
+
+
+def test_modification_sequence_follows_commits_and_old_databases_are_numbered(tmp_path):
+    db = tmp_path / "index.db"
+    store = IndexStore(str(db))
+    store.upsert_many([make_entry("a.pdf", "x"), make_entry("b.pdf", "y")])
+    with store._connect() as conn:
+        conn.execute("DROP INDEX idx_documents_seq")
+        conn.execute("ALTER TABLE documents DROP COLUMN seq")
+        conn.execute("DELETE FROM meta WHERE key = 'seq'")
+    store = IndexStore(str(db))
+    assert [(seq, e["file_name"]) for seq, e in store.entries_since(0)] == [(1, "a.pdf"), (2, "b.pdf")]
+
+    # Un document supprimé ne libère pas son numéro ; une mise à jour en prend un nouveau
+    store.delete(["b.pdf"])
+    store.upsert(make_entry("c.pdf", "z"))
+    store.upsert(make_entry("a.pdf", "x2"))
+    assert [(seq, e["file_name"]) for seq, e in store.entries_since(2)] == [(3, "c.pdf"), (4, "a.pdf")]
+    assert [e["file_name"] for _, e in store.entries_since(0, limit=1)] == ["c.pdf"]
+
+
+def test_search_cli_queries_the_store(tmp_path, monkeypatch, capsys):
+    from backend.services import preprocessing
+
+    index_file = tmp_path / "index.json"
+    index_file.write_text(json.dumps([make_entry("f1.pdf", "Échéance net 30", total="12"),
+                                      make_entry("f2.pdf", "Avoir")]), encoding="utf-8")
+    answers = iter(["echeance", "inexistant", "exit"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    preprocessing.main(str(tmp_path / "index.db"), str(index_file))
+
+    out = capsys.readouterr().out
+    assert "1 document(s) trouvé(s)" in out and "f1.pdf | Type: facture | Total: 12" in out
+    assert "Aucun document trouvé" in out
+    assert IndexStore(str(tmp_path / "index.db")).count() == 2
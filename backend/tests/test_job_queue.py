@@ -0,0 +1,71 @@
+import threading
+
+from backend.services import job_queue
+from backend.services.job_queue import JobQueue, FAILED, OCR_DONE, PENDING, STRUCTURED
+
+
+def test_enqueue_is_idempotent_per_batch(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    assert queue.enqueue("b1", ["a.pdf", "b.pdf"]) == 2
+    assert queue.enqueue("b1", ["a.pdf", "c.pdf"]) == 1
+    assert queue.enqueue("b2", ["a.pdf"]) == 1
+    assert queue.stats("b1")[PENDING] == 3
+
+
+def test_concurrent_claims_never_share_a_job(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("b", [f"f{i}.pdf" for i in range(40)])
+    claimed, lock = [], threading.Lock()
+
+    def worker():
+        while (job := queue.claim("b")) is not None:
+            with lock:
+                claimed.append(job["file_path"])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == sorted(f"f{i}.pdf" for i in range(40))
+
+
+def test_failed_job_resumes_at_its_stage_then_fails_for_good(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "retry_delay", lambda attempts: 0.0)
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("b", ["a.pdf"])
+
+    job = queue.claim("b")
+    queue.mark_ocr_done(job, "out/a_ocr_result.json")
+    assert queue.mark_failed(job, "LLM down", max_attempts=2) is True
+
+    job = queue.claim("b")
+    assert job["state"] == OCR_DONE and job["ocr_json_path"] == "out/a_ocr_result.json"
+    assert queue.mark_failed(job, "LLM down", max_attempts=2) is False
+    assert queue.claim("b") is None
+    assert queue.stats("b")[FAILED] == 1
+
+    assert queue.retry_failed("b") == 1
+    job = queue.claim("b")
+    assert job["state"] == OCR_DONE and job["attempts"] == 0
+    queue.mark_structured(job, "out/a_structured.json")
+    assert queue.stats("b")[STRUCTURED] == 1
+
+
+def test_backoff_delays_the_next_claim(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("b", ["a.pdf"])
+    queue.mark_failed(queue.claim("b"), "429", max_attempts=3)
+    assert queue.claim("b") is None
+    assert queue.next_retry_at("b") is not None
+
+
+def test_recover_releases_claims_of_dead_processes(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("b", ["a.pdf"])
+    assert queue.claim("b") is not None
+    assert queue.claim("b") is None
+
+    monkeypatch.setattr(job_queue, "_pid_alive", lambda pid: False)
+    assert queue.recover("b") == 1
+    assert queue.claim("b")["file_path"] == "a.pdf"
@@ -0,0 +1,61 @@
+import json
+
+from backend.services import json_extract
+from backend.services.json_extract import find_json_object, repair_truncated
+
+
+def test_ignores_prose_fences_and_stray_braces():
+    text = 'Voici {le résultat} demandé :\n```json\n{"total": "12,00 €", "note": "a } dans une chaîne"}\n```\nMerci {!}'
+    value, source, repaired = find_json_object(text)
+    assert value == {"total": "12,00 €", "note": "a } dans une chaîne"}
+    assert source.startswith('{"total"')
+    assert repaired is False
+
+
+def test_handles_escaped_quotes_and_nested_objects():
+    payload = {"seller": 'Dupont "& Fils"', "buyer": {"nom": "Durand", "adresse": "1 rue \\\\ {x}"}, "items": [{"a": 1}]}
+    value, _, _ = find_json_object("Réponse : " + json.dumps(payload, ensure_ascii=False))
+    assert value == payload
+
+
+def test_removes_trailing_commas():
+    value, _, repaired = find_json_object('{"items": [1, 2,], "total": 3,}')
+    assert value == {"items": [1, 2], "total": 3}
+    # 🔹 Rien n'a été complété : pas de marqueur _repaired, résultat mis en cache
+    assert repaired is False
+
+
+def test_finds_object_nested_in_stray_braces():
+    value, source, repaired = find_json_object('Note {voir : {"total": 3} ci-dessous} fin')
+    assert (value, source, repaired) == ({"total": 3}, '{"total": 3}', False)
+
+
+def test_scan_decodes_each_balanced_candidate_once(monkeypatch):
+    calls = []
+    decode = json_extract._decode
+    monkeypatch.setattr(json_extract, "_decode", lambda candidate: calls.append(candidate) or decode(candidate))
+    assert find_json_object("{x} " * 5000 + '{"a": 1}')[0] == {"a": 1}
+    assert len(calls) == 5001
+
+
+def test_repairs_truncated_response():
+    value, _, repaired = find_json_object('{"invoice_number": "F-1", "items": [{"description": "Papier", "montant": 12}, {"descr')
+    assert repaired is True
+    assert value["invoice_number"] == "F-1"
+    assert value["items"][0] == {"description": "Papier", "montant": 12}
+
+
+def test_repair_closes_an_open_string():
+    assert repair_truncated('{"terms": "Paiement à 30') == {"terms": "Paiement à 30"}
+
+
+def test_no_object_returns_none():
+    assert find_json_object("Aucune facture détectée.") == (None, None, False)
+    assert find_json_object("") == (None, None, False)
+
+
+def test_repair_that_loses_every_key_is_rejected():
+    assert repair_truncated('{"a": tr') is None
+    assert repair_truncated("{") is None
+    assert find_json_object('{"a": tr') == (None, None, False)
+    assert repair_truncated('{"a": 1, "b": tr') == {"a": 1}
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from backend.services.metrics import Metrics
+
+
+def test_timer_records_duration_bytes_and_errors():
+    m = Metrics()
+    with m.timer("encode") as obs:
+        obs["bytes"] = 100
+    with pytest.raises(ValueError):
+        with m.timer("encode"):
+            raise ValueError("boom")
+
+    stats = m.snapshot()["stages"]["encode"]
+    assert stats["count"] == 2
+    assert stats["errors"] == 1
+    assert stats["bytes"] == 100
+
+
+def test_prometheus_histogram_is_cumulative_and_counts_tokens():
+    m = Metrics()
+    m.observe("llm_call", 0.2, prompt_tokens=10, completion_tokens=5)
+    m.observe("llm_call", 3.0, prompt_tokens=1)
+    text = m.to_prometheus()
+
+    assert 'ocr_stage_duration_seconds_bucket{stage="llm_call",le="0.25"} 1' in text
+    assert 'ocr_stage_duration_seconds_bucket{stage="llm_call",le="5.0"} 2' in text
+    assert 'ocr_stage_duration_seconds_count{stage="llm_call"} 2' in text
+    assert 'ocr_llm_tokens_total{type="prompt"} 11' in text
+    assert 'ocr_llm_tokens_total{type="completion"} 5' in text
+
+
+def test_jsonl_export_writes_one_line_per_observation(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    m = Metrics(str(path))
+    m.observe("ocr_api", 1.5, file="f1.pdf", pages=2)
+    m.observe("json_dump", 0.01, bytes=42)
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [r["stage"] for r in records] == ["ocr_api", "json_dump"]
+    assert records[0]["file"] == "f1.pdf" and records[0]["pages"] == 2
+    assert records[1]["bytes"] == 42
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("mistralai")
+
+from backend.benchmarks.mock_mistral import MockMistralServer  # noqa: E402
+from backend.services import mistral_client  # noqa: E402
+from backend.services.mistral_client import backoff_delay, call_with_retry, call_with_retry_async  # noqa: E402
+from backend.services.rate_limit import ApiLimiter  # noqa: E402
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with MockMistralServer(latency_ms=0, jitter_ms=0, seed=0) as server:
+        monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+        monkeypatch.setenv("MISTRAL_SERVER_URL", server.url)
+        mistral_client.reset_client()
+        yield server
+    mistral_client.reset_client()
+
+
+def test_async_client_is_created_per_event_loop(server):
+    async def ocr():
+        client = mistral_client.get_client()
+        assert mistral_client.get_client() is client
+        response = await client.ocr.process_async(
+            model="mistral-ocr-latest", document={"type": "document_url", "document_url": "data:x"})
+        return client, len(response.pages)
+
+    first, pages = asyncio.run(ocr())
+    # Nouvelle boucle : le pool async de la boucle fermée n'est pas réutilisé
+    second, _ = asyncio.run(ocr())
+    assert pages == 1 and first is not second
+    assert server.counts["ocr"] == 2
+
+    sync_client = mistral_client.get_client()
+    assert sync_client not in (first, second)
+    assert second.sdk_configuration.client is sync_client.sdk_configuration.client
+
+
+def _status_error(status, headers=None):
+    request = httpx.Request("POST", "http://mock/v1/ocr")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status}", request=request, response=response)
+
+
+class Flaky:
+    """
+    Échoue avec les erreurs données, puis répond "ok"
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(mistral_client.time, "sleep", delays.append)
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(mistral_client.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+def test_retries_transient_errors_with_backoff(sleeps):
+    limiter = ApiLimiter()
+    fn = Flaky(_status_error(503), httpx.ConnectTimeout("lent"), _status_error(429, {"Retry-After": "2"}))
+    assert call_with_retry(fn, max_retries=3, limiter=limiter) == "ok"
+    assert fn.calls == 4 and len(sleeps) == 3
+    assert 0 <= sleeps[0] <= mistral_client.BACKOFF_BASE_SECONDS
+    assert sleeps[2] >= 2.0  # Retry-After respecté
+    # Surcharge (503, timeout, 429) : la concurrence adaptative a réduit sa limite
+    assert limiter.concurrency.limit < 4
+
+
+def test_non_retryable_and_exhausted_errors_are_raised(sleeps):
+    fn = Flaky(_status_error(400))
+    with pytest.raises(httpx.HTTPStatusError):
+        call_with_retry(fn, max_retries=3, limiter=ApiLimiter())
+    assert fn.calls == 1 and sleeps == []
+
+    fn = Flaky(*[_status_error(502)] * 3)
+    with pytest.raises(httpx.HTTPStatusError):
+        call_with_retry(fn, max_retries=2, limiter=ApiLimiter())
+    assert fn.calls == 3 and len(sleeps) == 2
+
+
+def test_async_retry_follows_the_same_policy(sleeps):
+    fn = Flaky(_status_error(500), _status_error(504))
+
+    async def call():
+        return fn()
+
+    assert asyncio.run(call_with_retry_async(call, max_retries=2, limiter=ApiLimiter())) == "ok"
+    assert fn.calls == 3 and len(sleeps) == 2
+
+    fn = Flaky(ValueError("pas transitoire"))
+    with pytest.raises(ValueError):
+        asyncio.run(call_with_retry_async(call, max_retries=2, limiter=ApiLimiter()))
+
+
+def test_backoff_delay_is_capped_and_jittered():
+    for attempt in range(12):
+        assert 0 <= backoff_delay(attempt) <= min(mistral_client.BACKOFF_MAX_SECONDS,
+                                                   mistral_client.BACKOFF_BASE_SECONDS * 2 ** attempt)
+    assert backoff_delay(0, _status_error(429, {"Retry-After": "600"})) == mistral_client.BACKOFF_MAX_SECONDS
@@ -0,0 +1,74 @@
+import asyncio
+import base64
+import types
+
+import pytest
+
+from backend.services import ocr_engine
+
+
+def _file(tmp_path, size, name="doc.pdf"):
+    path = tmp_path / name
+    path.write_bytes(bytes(i % 251 for i in range(size)))
+    return str(path)
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 100, 3 * 7 + 1])
+def test_encoder_matches_plain_base64(tmp_path, monkeypatch, size):
+    # Blocs minuscules : plusieurs passes d'encodage même sur un petit fichier
+    monkeypatch.setattr(ocr_engine, "BASE64_CHUNK_SIZE", 6)
+    path = _file(tmp_path, size)
+    expected = base64.b64encode(open(path, "rb").read()).decode("ascii")
+    assert ocr_engine.encode_file_to_base64(path) == expected
+    assert ocr_engine.encode_file_to_data_url(path, "application/pdf") == f"data:application/pdf;base64,{expected}"
+
+
+def test_auto_mode_uploads_above_threshold(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_engine, "UPLOAD_THRESHOLD_BYTES", 10)
+    assert not ocr_engine._use_upload(_file(tmp_path, 10, "small.pdf"), "auto")
+    assert ocr_engine._use_upload(_file(tmp_path, 11, "big.pdf"), "auto")
+    assert not ocr_engine._use_upload(_file(tmp_path, 11, "big.pdf"), "inline")
+    assert ocr_engine._use_upload(_file(tmp_path, 1, "tiny.pdf"), "upload")
+    with pytest.raises(ValueError, match="upload_mode"):
+        ocr_engine._use_upload(_file(tmp_path, 1), "base64")
+
+
+class _FailingFiles:
+    def __init__(self):
+        self.deleted = []
+
+    def upload(self, file, purpose):
+        return types.SimpleNamespace(id="file-1")
+
+    def get_signed_url(self, file_id):
+        raise RuntimeError("signature refusée")
+
+    def delete(self, file_id):
+        self.deleted.append(file_id)
+
+    async def upload_async(self, file, purpose):
+        return self.upload(file, purpose)
+
+    async def get_signed_url_async(self, file_id):
+        return self.get_signed_url(file_id)
+
+    async def delete_async(self, file_id):
+        self.delete(file_id)
+
+
+def test_upload_is_deleted_when_signing_fails(tmp_path, monkeypatch):
+    files = _FailingFiles()
+    monkeypatch.setattr(ocr_engine, "get_client", lambda: types.SimpleNamespace(files=files))
+    monkeypatch.setattr(ocr_engine, "call_with_retry", lambda fn, *a, **kw: fn(*a, **kw))
+
+    async def call_async(fn, *a, **kw):
+        return await fn(*a, **kw)
+
+    monkeypatch.setattr(ocr_engine, "call_with_retry_async", call_async)
+    path = _file(tmp_path, 16)
+
+    with pytest.raises(RuntimeError, match="signature"):
+        ocr_engine._upload_file(path)
+    with pytest.raises(RuntimeError, match="signature"):
+        asyncio.run(ocr_engine._upload_file_async(path))
+    assert files.deleted == ["file-1", "file-1"]
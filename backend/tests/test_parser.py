@@ -0,0 +1,77 @@
+import json
+import os
+
+from backend.services.index_store import IndexStore
+from backend.services.parser import build_index
+
+
+def _write(folder, stem, text, structured=None, file_name=None):
+    ocr = {"file_name": file_name or f"{stem}.pdf", "document_type": "facture", "full_text": text}
+    (folder / f"{stem}_ocr_result.json").write_text(json.dumps(ocr), encoding="utf-8")
+    if structured is not None:
+        (folder / f"{stem}_structured.json").write_text(json.dumps(structured), encoding="utf-8")
+
+
+def _build(tmp_path, **kwargs):
+    folder = tmp_path / "samples"
+    return build_index(str(folder), str(folder), db_file=str(tmp_path / "index.db"), **kwargs)
+
+
+def test_manifest_tracks_added_changed_and_deleted_sources(tmp_path):
+    folder = tmp_path / "samples"
+    folder.mkdir()
+    _write(folder, "a", "Facture Dupont", {"total": "10"})
+    _write(folder, "b", "Facture Durand")
+    store = IndexStore(str(tmp_path / "index.db"))
+
+    assert _build(tmp_path) == {"added": 2, "updated": 0, "removed": 0, "unchanged": 0}
+    assert store.file_names() == {"a.pdf", "b.pdf"}
+    assert set(store.sources()) == {str(folder / "a_ocr_result.json"), str(folder / "b_ocr_result.json")}
+
+    # Rien de changé : aucune écriture
+    version = store.version()
+    assert _build(tmp_path) == {"added": 0, "updated": 0, "removed": 0, "unchanged": 2}
+    assert store.version() == version
+
+    # Fichier structured ajouté, fichier OCR supprimé, nouveau fichier
+    (folder / "b_structured.json").write_text(json.dumps({"total": "20"}), encoding="utf-8")
+    (folder / "a_ocr_result.json").unlink()
+    _write(folder, "c", "Avoir Martin")
+    assert _build(tmp_path) == {"added": 1, "updated": 1, "removed": 1, "unchanged": 0}
+    assert store.file_names() == {"b.pdf", "c.pdf"}
+    assert store.get("b.pdf")["structured_json"] == {"total": "20"}
+    assert [e["file_name"] for e in store.search("dupont")] == []
+    assert str(folder / "a_ocr_result.json") not in store.sources()
+
+
+def test_update_keeps_fields_added_elsewhere_and_follows_renames(tmp_path):
+    folder = tmp_path / "samples"
+    folder.mkdir()
+    _write(folder, "a", "Facture")
+    _build(tmp_path)
+    store = IndexStore(str(tmp_path / "index.db"))
+    store.upsert({**store.get("a.pdf"), "path_file": "uploads/a.pdf"})
+
+    _write(folder, "a", "Facture corrigée")
+    assert _build(tmp_path)["updated"] == 1
+    assert store.get("a.pdf")["path_file"] == "uploads/a.pdf"
+    assert store.get("a.pdf")["full_text"] == "Facture corrigée"
+
+    _write(folder, "a", "Facture corrigée", file_name="a-renamed.pdf")
+    _build(tmp_path)
+    assert store.file_names() == {"a-renamed.pdf"}
+
+
+def test_touched_file_is_not_reparsed_and_full_rebuild_rereads(tmp_path):
+    folder = tmp_path / "samples"
+    folder.mkdir()
+    _write(folder, "a", "Facture")
+    _build(tmp_path)
+    os.utime(folder / "a_ocr_result.json", ns=(0, 10 ** 18))
+    assert _build(tmp_path)["unchanged"] == 1
+    assert IndexStore(str(tmp_path / "index.db")).sources()[str(folder / "a_ocr_result.json")]["ocr"]["mtime_ns"] \
+        == 10 ** 18
+
+    export = tmp_path / "index.json"
+    assert _build(tmp_path, full_rebuild=True, index_file=str(export))["updated"] == 1
+    assert [e["file_name"] for e in json.loads(export.read_text(encoding="utf-8"))] == ["a.pdf"]
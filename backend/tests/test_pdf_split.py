@@ -0,0 +1,120 @@
+import base64
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+from backend.services import mistral_client, ocr_engine  # noqa: E402
+from backend.services.pdf_split import SplitConfig, combine_ranges, page_ranges  # noqa: E402
+
+
+class FakeOcr:
+    """
+    OCR local : renvoie le texte de chaque page du PDF reçu (data URL)
+    """
+
+    def __init__(self, fail_once_on: str | None = None, short_once_on: str | None = None):
+        self.calls = []
+        self.fail_once_on = fail_once_on
+        self.short_once_on = short_once_on
+        self._lock = threading.Lock()
+
+    def process(self, model, document, include_image_base64, timeout_ms=None):
+        data = base64.b64decode(document["document_url"].split(",", 1)[1])
+        with pymupdf.open(stream=data, filetype="pdf") as doc:
+            texts = [page.get_text().strip() for page in doc]
+        with self._lock:
+            self.calls.append(texts)
+            if self.fail_once_on in texts:
+                self.fail_once_on = None
+                raise RuntimeError("plage perdue")
+            if self.short_once_on in texts:
+                # Réponse tronquée : dernière page de la plage manquante
+                self.short_once_on = None
+                texts = texts[:-1]
+        pages = [{"index": i, "markdown": t, "images": [], "dimensions": None} for i, t in enumerate(texts)]
+        response = {"pages": pages, "model": model, "usage_info": {"pages_processed": len(pages)}}
+        return SimpleNamespace(pages=pages, model_dump=lambda: json.loads(json.dumps(response)))
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    mistral_client.reset_client()
+    fake = FakeOcr()
+    monkeypatch.setattr(ocr_engine, "get_client", lambda: SimpleNamespace(ocr=fake))
+    yield fake
+    mistral_client.reset_client()
+
+
+def _pdf(path, num_pages):
+    doc = pymupdf.open()
+    for i in range(num_pages):
+        doc.new_page().insert_text((72, 72), f"page {i}")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_page_ranges_are_contiguous_and_bounded():
+    assert page_ranges([0, 1, 2, 3, 4], 2) == [[0, 1], [2, 3], [4]]
+    assert page_ranges([7, 1, 2, 5], 10) == [[1, 2], [5], [7]]
+
+
+def test_combine_ranges_restores_document_order():
+    combined = combine_ranges([
+        ([2, 3], {"model": "m", "pages": [{"index": 0, "markdown": "c"}, {"index": 1, "markdown": "d"}]}),
+        ([0, 1], {"model": "m", "pages": [{"index": 1, "markdown": "b"}, {"index": 0, "markdown": "a"}]}),
+    ])
+    assert [(p["index"], p["markdown"]) for p in combined["pages"]] == [(0, "a"), (1, "b"), (2, "c"), (3, "d")]
+
+    with pytest.raises(RuntimeError, match="incomplète"):
+        combine_ranges([([0, 1], {"pages": [{"index": 0, "markdown": "a"}]})])
+
+
+def test_short_range_is_retried(tmp_path, fake_ocr):
+    fake_ocr.short_once_on = "page 7"
+    path = _pdf(tmp_path / "contrat.pdf", 9)
+    out = ocr_engine.run_ocr(path, output_folder=str(tmp_path / "out"), use_cache=False, text_layer=False,
+                             split=SplitConfig(min_pages=4, pages_per_range=3))
+    result = json.loads(open(out, encoding="utf-8").read())
+    assert [p["markdown"] for p in result["pages"]] == [f"page {i}" for i in range(9)]
+    assert sum(1 for texts in fake_ocr.calls if "page 7" in texts) == 2
+
+
+def test_large_pdf_is_split_and_failed_range_retried(tmp_path, fake_ocr):
+    fake_ocr.fail_once_on = "page 5"
+    path = _pdf(tmp_path / "contrat.pdf", 11)
+    split = SplitConfig(min_pages=4, pages_per_range=3, max_workers=3)
+
+    out = ocr_engine.run_ocr(path, output_folder=str(tmp_path / "out"), use_cache=False, text_layer=False,
+                             split=split)
+    result = json.loads(open(out, encoding="utf-8").read())
+    assert [p["markdown"] for p in result["pages"]] == [f"page {i}" for i in range(11)]
+    assert [p["index"] for p in result["pages"]] == list(range(11))
+    assert result["num_pages"] == 11
+    # 4 plages + la plage 4-6 relancée seule
+    assert len(fake_ocr.calls) == 5
+    assert sum(1 for texts in fake_ocr.calls if "page 5" in texts) == 2
+
+
+def test_small_pdf_is_sent_in_one_request(tmp_path, fake_ocr):
+    path = _pdf(tmp_path / "facture.pdf", 3)
+    ocr_engine.run_ocr(path, output_folder=str(tmp_path / "out"), use_cache=False, text_layer=False,
+                       split=SplitConfig(min_pages=4, pages_per_range=3))
+    assert fake_ocr.calls == [["page 0", "page 1", "page 2"]]
+
+
+def test_range_failing_every_attempt_raises(tmp_path, fake_ocr, monkeypatch):
+    path = _pdf(tmp_path / "casse.pdf", 6)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("OCR indisponible")
+
+    monkeypatch.setattr(fake_ocr, "process", broken)
+    with pytest.raises(RuntimeError, match="pages 1-3, 4-6"):
+        ocr_engine.run_ocr(path, output_folder=str(tmp_path / "out"), use_cache=False, text_layer=False,
+                           split=SplitConfig(min_pages=2, pages_per_range=3))
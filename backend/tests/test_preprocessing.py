@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("PIL")
+
+from PIL import Image, ImageDraw, ImageStat  # noqa: E402
+
+from backend.services.preprocessing import PreprocessConfig, _estimate_skew, preprocess_image  # noqa: E402
+
+
+def _page(angle: float = 0.0):
+    # Fausse page de texte : bandes noires horizontales sur fond blanc
+    image = Image.new("L", (1200, 1600), 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(100, 1500, 40):
+        draw.rectangle((100, y, 1100, y + 12), fill=0)
+    return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+
+@pytest.mark.parametrize("angle", [3.0, -2.0, 0.0])
+def test_estimate_skew_finds_the_correcting_angle(angle):
+    assert _estimate_skew(_page(angle), Image, ImageStat) == -angle
+
+
+def test_preprocess_image_deskews_and_counts_per_config(tmp_path):
+    path = tmp_path / "scan.jpg"
+    _page(3.0).convert("RGB").save(path, quality=100)
+
+    config, other = PreprocessConfig(deskew=True, target_dpi=None), PreprocessConfig()
+    result = preprocess_image(str(path), "image/jpeg", config)
+    assert "deskew:-3.0" in result.steps and result.mime_type == "image/jpeg"
+    assert result.output_bytes < result.original_bytes
+
+    totals = config.stats.snapshot()
+    assert totals["images"] == 1 and totals["output_bytes"] == result.output_bytes
+    assert other.stats.snapshot()["images"] == 0
@@ -0,0 +1,124 @@
+import time
+
+import pytest
+
+from backend.services import mistral_client
+from backend.services.rate_limit import AdaptiveConcurrency, ApiLimiter, TokenBucket
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+def test_token_bucket_enforces_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # 1 jeton en réserve puis 5 à 50/s
+    assert time.monotonic() - start >= 0.09
+
+
+def test_token_bucket_debt_delays_next_acquire():
+    bucket = TokenBucket(rate=100, capacity=100)
+    assert bucket.try_acquire(100) == 0
+    bucket.adjust(-50)
+    assert bucket.try_acquire(10) > 0.5
+
+
+def test_aimd_grows_on_fast_successes_and_halves_on_throttle():
+    c = AdaptiveConcurrency(initial=4, maximum=8, cooldown_seconds=0)
+    for _ in range(20):
+        c.acquire()
+        c.release(latency=0.1)
+    assert c.limit > 6
+    grown = c.limit
+    c.acquire()
+    c.release(throttled=True)
+    assert c.limit == pytest.approx(grown / 2)
+    assert c.throttled == 1
+
+
+def test_aimd_backs_off_when_latency_degrades():
+    c = AdaptiveConcurrency(initial=8, cooldown_seconds=0, latency_tolerance=2.0, smoothing=1.0)
+    c.acquire()
+    c.release(latency=0.1)
+    before = c.limit
+    c.acquire()
+    c.release(latency=1.0)
+    assert c.limit < before
+
+
+def test_call_with_retry_releases_slot_and_reports_throttles(monkeypatch):
+    pytest.importorskip("httpx")
+    monkeypatch.setattr(mistral_client, "backoff_delay", lambda attempt, exc=None: 0)
+    limiter = ApiLimiter(concurrency=AdaptiveConcurrency(initial=2, cooldown_seconds=0))
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise Throttled()
+        return "ok"
+
+    assert mistral_client.call_with_retry(flaky, max_retries=5, limiter=limiter) == "ok"
+    assert limiter.concurrency.in_flight == 0
+    assert limiter.concurrency.throttled == 2
+
+
+def test_aimd_recovers_when_steady_calls_are_slower_than_the_first_ones():
+    c = AdaptiveConcurrency(initial=8, cooldown_seconds=0)
+    for _ in range(5):
+        c.acquire()
+        c.release(latency=0.1, key="Ocr.process")
+    for _ in range(200):
+        c.acquire()
+        c.release(latency=3.0, key="Ocr.process")
+    assert c.limit > 8
+    # Un autre type d'appel a sa propre référence : un chat rapide ne pénalise pas l'OCR
+    c.acquire()
+    c.release(latency=0.05, key="Chat.complete")
+    c.acquire()
+    c.release(latency=3.0, key="Ocr.process")
+    assert c.best_latency["Ocr.process"] > 1.0
+
+
+def test_metadata_calls_do_not_feed_the_latency_signal():
+    class Files:
+        def get_signed_url(self):
+            return None
+
+    class Ocr:
+        async def process_async(self):
+            return None
+
+    assert mistral_client._latency_key(Files().get_signed_url) is None
+    assert mistral_client._latency_key(Ocr().process_async) == "Ocr.process"
+
+
+def test_cancelled_calls_release_their_slot():
+    import asyncio
+
+    pytest.importorskip("httpx")
+    limiter = ApiLimiter(requests_per_second=1000, tokens_per_minute=60,
+                         concurrency=AdaptiveConcurrency(initial=2, maximum=2))
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def fast():
+        return "ok"
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(mistral_client.call_with_retry_async(slow, limiter=limiter, max_retries=0), 0.05)
+        assert limiter.concurrency.in_flight == 0
+        # Annulation pendant l'attente du budget tokens/min (créneau déjà pris)
+        limiter.tokens.try_acquire(60)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire_async(tokens=30), 0.05)
+        assert limiter.concurrency.in_flight == 0
+        return await asyncio.wait_for(mistral_client.call_with_retry_async(fast, limiter=limiter, max_retries=0), 1)
+
+    assert asyncio.run(main()) == "ok"
@@ -0,0 +1,92 @@
+import json
+from decimal import Decimal
+
+from backend.services.schema import (
+    Invoice, attach_normalized, invoice_of, normalize_invoice, normalize_many, parse_amount, parse_amount_checked,
+    parse_currency,
+)
+
+
+def test_parse_amount_handles_locales():
+    assert parse_amount("1 234,56 €") == Decimal("1234.56")
+    assert parse_amount("1 234,56 €") == Decimal("1234.56")
+    assert parse_amount("$1,234.56") == Decimal("1234.56")
+    assert parse_amount("1.234.567,8") == Decimal("1234567.8")
+    assert parse_amount(12.5) == Decimal("12.5")
+    assert parse_amount("n/a") is None
+    assert parse_amount(True) is None
+
+
+def test_parse_currency():
+    assert parse_currency(None, "1 234,56 €") == "EUR"
+    assert parse_currency("usd") == "USD"
+    assert parse_currency("Total 12 CHF") == "CHF"
+    assert parse_currency("fleur 12") is None
+
+
+def test_normalize_invoice_types_and_validation():
+    invoice = normalize_invoice({
+        "invoice_number": " F-001 ",
+        "date": "15/03/2024",
+        "seller": "Dupont SARL",
+        "buyer": {"nom": "Durand", "adresse": "1 rue de Paris"},
+        "items": [{"description": "Papier", "quantité": "2", "prix_unitaire": "5,00 €", "montant": "10,00 €"}],
+        "subtotal": "10,00 €",
+        "tax": "2,00 €",
+        "total": "13,00 €",
+        "due_date": "bientôt",
+    })
+    assert invoice.invoice_number == "F-001"
+    assert invoice.date == "2024-03-15"
+    assert invoice.currency == "EUR"
+    assert (invoice.buyer, invoice.buyer_address) == ("Durand", "1 rue de Paris")
+    assert invoice.items[0].amount == Decimal("10.00")
+    assert not invoice.valid
+    assert any(e.startswith("due_date") for e in invoice.errors)
+    assert any(e.startswith("total incohérent") for e in invoice.errors)
+
+
+def test_normalize_many_matches_single_normalization():
+    raws = [{"total": f"{n},50 €", "items": [{"montant": "1,00"}]} for n in (1, 2, 1)] + ["pas un dict"]
+    batch = normalize_many(raws)
+    assert [i.total for i in batch[:3]] == [Decimal("1.50"), Decimal("2.50"), Decimal("1.50")]
+    assert batch[3] == Invoice()
+    assert batch[:3] == [normalize_invoice(r) for r in raws[:3]]
+
+
+def test_record_round_trip_survives_json():
+    structured = attach_normalized({"total": "1 234,56 €", "date": "2024-03-15", "items": [{"montant": 3}]})
+    stored = json.loads(json.dumps(structured))
+    assert stored["normalized"]["total"] == 1234.56
+    invoice = invoice_of(stored)
+    assert invoice.total == Decimal("1234.56")
+    assert invoice.items[0].amount == Decimal("3")
+    # Résultat brut conservé tel quel
+    assert stored["total"] == "1 234,56 €"
+
+
+def test_parse_amount_resolves_separators_with_currency_and_skips_percentages():
+    assert parse_amount("$1,234") == Decimal("1234")
+    assert parse_amount("12.000 €") == Decimal("12000")
+    assert parse_amount("1,234", currency="EUR") == Decimal("1.234")
+    assert parse_amount("TVA 20% : 24,00") == Decimal("24.00")
+    assert parse_amount("0.125") == Decimal("0.125")
+    assert parse_amount(float("nan")) is None
+    assert parse_amount(float("inf")) is None
+    assert parse_amount_checked("12.000") == (Decimal("12000"), "montant ambigu ('12.000', séparateur décimal supposé ',')")
+    assert parse_amount_checked("12.000 €")[1] is None
+
+
+def test_ambiguous_and_non_finite_amounts_are_reported():
+    invoice = normalize_invoice({"total": "12.000", "tax": float("nan"), "items": [{"montant": "1.500"}]})
+    assert invoice.total == Decimal("12000")
+    assert invoice.tax is None
+    assert any(e.startswith("total : montant ambigu") for e in invoice.errors)
+    assert any(e.startswith("ligne 1 amount : montant ambigu") for e in invoice.errors)
+    assert any(e.startswith("tax : montant illisible") for e in invoice.errors)
+    record = json.loads(json.dumps(attach_normalized({"total": float("nan")})))
+    assert record["normalized"]["total"] is None
+
+    # Devise de la facture : "1,234" est 1234 en USD, sans erreur
+    usd = normalize_invoice({"currency": "USD", "total": "1,234", "items": [{"montant": "1,234"}]})
+    assert (usd.total, usd.items[0].amount, usd.errors) == (Decimal("1234"), Decimal("1234"), [])
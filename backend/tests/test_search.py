@@ -0,0 +1,35 @@
+from backend.services.index_store import IndexStore
+from backend.services.search import parse_query, tokenize
+
+ENTRIES = [
+    {"file_name": "facture1.pdf", "full_text": "Facture N° 42 — Échéance : net 30 jours. Total TTC 1 234,56 €"},
+    {"file_name": "facture2.pdf", "full_text": "Facture d'acompte, paiement à 30 jours net"},
+    {"file_name": "avoir1.pdf", "full_text": "Avoir sur facture 42"},
+]
+
+
+def test_tokenize_folds_accents_and_case():
+    assert tokenize("Échéance TTC") == ["echeance", "ttc"]
+
+
+def test_parse_query_groups_phrases_and_or():
+    assert parse_query('facture "net 30" OR avoir') == [[("facture",), ("net", "30")], [("avoir",)]]
+
+
+def test_and_or_phrase_and_prefix_queries(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    store.upsert_many(ENTRIES)
+    ids = lambda q: {e["file_name"] for e in store.search(q)}
+
+    assert ids("facture 42") == {"facture1.pdf", "avoir1.pdf"}
+    assert ids("echeance") == {"facture1.pdf"}
+    assert ids('"net 30"') == {"facture1.pdf"}
+    assert ids("acompte OR avoir") == {"facture2.pdf", "avoir1.pdf"}
+    assert ids("fact*") == {"facture1.pdf", "facture2.pdf", "avoir1.pdf"}
+    assert ids("inexistant") == set()
+
+
+def test_bm25_ranks_more_specific_document_first(tmp_path):
+    store = IndexStore(str(tmp_path / "index.db"))
+    store.upsert_many(ENTRIES)
+    assert store.search("avoir facture")[0]["file_name"] == "avoir1.pdf"
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+from backend.services import ocr_engine  # noqa: E402
+from backend.services.text_layer import extract_text_layer, merge_pages, text_quality  # noqa: E402
+
+INVOICE_TEXT = (
+    "FACTURE N° 2024-0042\nDate : 12/03/2024\nVendeur : Société Martin SARL, 12 rue des Lilas, Paris\n"
+    "Désignation Quantité Prix unitaire Montant\nMaintenance annuelle 1 450,00 € 450,00 €\nTotal TTC : 540,00 €"
+)
+
+
+def _pdf(path, pages):
+    doc = pymupdf.open()
+    for text in pages:
+        page = doc.new_page()
+        if text:
+            page.insert_textbox(pymupdf.Rect(50, 50, 550, 800), text, fontsize=10)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_text_quality_rejects_empty_and_garbled_text():
+    assert text_quality(INVOICE_TEXT) > 0.9
+    assert text_quality("Page 1") == 0.0
+    assert text_quality(" �� " * 20) < 0.2
+
+
+def test_born_digital_pdf_skips_remote_ocr(tmp_path, monkeypatch):
+    def no_api():
+        raise AssertionError("OCR distant appelé pour un PDF natif")
+
+    monkeypatch.setattr(ocr_engine, "get_client", no_api)
+    path = _pdf(tmp_path / "facture.pdf", [INVOICE_TEXT, INVOICE_TEXT.replace("0042", "0043")])
+
+    out = ocr_engine.run_ocr(path, output_folder=str(tmp_path / "out"), use_cache=False)
+    result = json.loads(open(out, encoding="utf-8").read())
+    assert result["num_pages"] == 2
+    assert [p["index"] for p in result["pages"]] == [0, 1]
+    assert "2024-0043" in result["pages"][1]["markdown"]
+    assert "Total TTC" in result["full_text"]
+
+
+def test_scanned_pages_go_to_remote_ocr_only(tmp_path):
+    path = _pdf(tmp_path / "mixte.pdf", [INVOICE_TEXT, "", INVOICE_TEXT])
+    local = extract_text_layer(path)
+    assert [p is None for p in local] == [False, True, False]
+    assert ocr_engine.pages_to_ocr(local) == [1]
+
+    remote = {"model": "mistral-ocr-latest", "pages": [{"index": 1, "markdown": "Page scannée", "images": []}],
+              "usage_info": {"pages_processed": 1}}
+    merged = merge_pages(local, remote)
+    assert [p["index"] for p in merged["pages"]] == [0, 1, 2]
+    assert merged["pages"][1]["markdown"] == "Page scannée"
+    assert merged["pages"][1]["source"] == "ocr"
+    assert merged["text_layer_pages"] == 2
+
+
+def test_remote_pages_are_matched_by_index_and_missing_ones_raise():
+    local = [{"index": 0, "markdown": "L0"}, None, {"index": 2, "markdown": "L2"}, None, None]
+    remote = {"pages": [{"index": 4, "markdown": "R4"}, {"index": 1, "markdown": "R1"}, {"index": 3, "markdown": "R3"}]}
+    assert [p["markdown"] for p in merge_pages(local, remote)["pages"]] == ["L0", "R1", "L2", "R3", "R4"]
+
+    # Réponse renumérotée 0..n dans l'ordre de la demande
+    renumbered = {"pages": [{"index": i, "markdown": f"R{n}"} for i, n in enumerate((1, 3, 4))]}
+    assert [p["markdown"] for p in merge_pages(local, renumbered)["pages"]] == ["L0", "R1", "L2", "R3", "R4"]
+
+    # Page 1 sans réponse : erreur au lieu de "R3" rangé en page 2 et d'une page perdue
+    short = {"pages": [{"index": 3, "markdown": "R3"}, {"index": 4, "markdown": "R4"}]}
+    with pytest.raises(RuntimeError, match="page\\(s\\) 2"):
+        merge_pages(local, short)